@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*-encoding: utf-8-*-
+
+""" Time of the search of counterexamples with and without decomposition (see decomposition.py)
+
+Formulas are random with the common variables, so they can't be split and decomposition
+is only the overhead: pure variables are looked for on each level before the engine is used.
+Every formula is checked once before the measurement, so the compiled functions and
+the signs of the occurrences are already cached.
+
+Usage: python bench_decomposition.py [count] [size]    (100 formulas with 150 connectives by default)
+"""
+
+import random
+import sys
+import time
+
+from logic_expressions import *
+from random_formulas import random_formula
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 150
+    generator = random.Random(1)
+    names = [f'v{i}' for i in range(12)]
+    formulas = [parse(random_formula(generator, names, size)) for _ in range(count)]
+
+    for decompose in (False, True):
+        for f in formulas:
+            f.find_counterexample(decompose=decompose)
+    for decompose in (False, True):
+        start = time.perf_counter()
+        for f in formulas:
+            f.find_counterexample(decompose=decompose)
+        print(f"{'with' if decompose else 'without'} decomposition: "
+              f"{(time.perf_counter() - start) / count * 1000:.3f} ms per formula")
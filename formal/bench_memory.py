@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*-encoding: utf-8-*-
+
+""" Peak memory (tracemalloc) of the adequacy proof of the tautology with n variables
+
+    ((x1 -> x2) -> ((x2 -> x3) -> ... ((xn-1 -> xn) -> (x1 -> xn))))
+
+All the steps of the proof are kept in memory. By default the proof is shared (each formula
+is proved once), 'full' is the proof without sharing (it's much longer, so n should be small).
+
+Usage: python bench_memory.py [n] [full]    (n = 10 by default)
+
+The number of steps depends on the order of variables, so PYTHONHASHSEED should be fixed
+to compare the results.
+
+Results (PYTHONHASHSEED=0, tracemalloc peak), the original code vs the current one:
+
+    3 variables, full:     152322 steps, 770.4 MB (5.18 KB per step)  vs  226541 steps, 252.5 MB (1.14 KB per step)
+    2 variables, full:      21883 steps,  69.6 MB (3.26 KB per step)  vs   30061 steps,  33.2 MB (1.13 KB per step)
+    10 variables, shared:   can't be built                            vs   22503 steps, 189.3 MB (8.62 KB per step)
+
+The original code has only the full proof: it's about 7 times longer for each new variable,
+so for 10 variables it would be ~10^11 steps (hundreds of TB at 5 KB per step).
+"""
+
+import sys
+import time
+import tracemalloc
+
+from logic_expressions import *
+
+
+def tautology(n: int) -> str:
+    result = f'(x1 -> x{n})'
+    for i in range(n - 1, 0, -1):
+        result = f'((x{i} -> x{i + 1}) -> {result})'
+    return result
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    full = 'full' in sys.argv[2:]
+    F = parse(tautology(n))
+
+    tracemalloc.start()
+    start = time.time()
+    output = adequacy_theorem(F) if full else adequacy_theorem(F, shared=True)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{n} variables, {'full' if full else 'shared'} proof: {len(output)} steps, {time.time() - start:.1f} s")
+    print(f'memory: {current / 2 ** 20:.1f} MB after the proof, {peak / 2 ** 20:.1f} MB peak, '
+          f'{peak / len(output) / 2 ** 10:.2f} KB peak per step')
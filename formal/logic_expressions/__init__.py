@@ -10,3 +10,8 @@
 from .formulas import *
 from .parser import *
 from .theorems import *
+from .patterns import *
+from .proof_file import *
+from .proof_search import *
+from .normal_forms import *
+from .equivalence import *
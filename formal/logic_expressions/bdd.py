@@ -0,0 +1,605 @@
+#!/usr/bin/env python3
+# -*-encoding: utf-8-*-
+
+""" Reduced ordered binary decision diagrams (ROBDD).
+
+All the nodes of the manager are hash-consed in the unique table, so the same
+boolean function is always the same node: formula is tautology iff its BDD is
+TRUE and two formulas are equivalent iff their BDDs are equal integers.
+
+Edge (reference to the node) is an integer: index of the node shifted by one bit
+plus the complement bit, so the negation is just edge ^ 1. There is only one
+terminal node, TRUE is the regular edge to it and FALSE is the complemented one.
+The high (then) edge of each node is always regular, that keeps the diagrams canonical.
+
+Unique table is split by levels, so two adjacent variables are swapped in place (see BDD.swap):
+nodes keep their functions and the sifting doesn't rebuild the diagrams. All the operations
+use the explicit stack instead of the recursion, so the depth of BDD isn't limited.
+By default formulas are checked in one shared manager (see bdd_counterexample), so the
+equivalence of formulas is the comparison of their edges (see bdd_equivalent).
+"""
+
+from threading import Lock
+
+from .formulas import *
+
+TRUE = 0
+FALSE = 1
+
+CACHE_BITS = 18          # operation cache has at most 2^CACHE_BITS slots
+MIN_CACHE_BITS = 8       # initial size of the operation cache (it grows with the unique table)
+SHARED_MAX_NODES = 1 << 18     # shared manager is cleaned before the check when it has more nodes
+SHARED_MAX_VARS = 1 << 12      # or more variables (all the nodes and variables are removed)
+
+# variable ordering heuristics (see variable_order)
+DFS_ORDER = 'dfs'                  # order of the first appearance in the formula
+FREQUENCY_ORDER = 'frequency'      # the most frequent variables first
+NAME_ORDER = 'name'                # alphabetical
+
+_AND = 0
+_XOR = 1
+
+
+def variable_order(f, heuristic=DFS_ORDER) -> list:
+    """ Order of the variables of formula for BDD.
+
+    :param f: Formula
+    :param heuristic: DFS_ORDER, FREQUENCY_ORDER or NAME_ORDER
+    :return: list of Vars
+    """
+    if heuristic == NAME_ORDER:
+        return sorted(f.vars, key=lambda var: var.name)
+
+    # each node of the hash-consed formula is visited once (the formula could be a DAG with
+    # exponentially big unfolded tree): nodes in the prefix order, then their multiplicities
+    nodes = []
+    seen = set()
+    stack = [f]
+    while stack:
+        node = stack.pop()
+        node = node if isinstance(node, Var) else node._canon
+        if node in seen:
+            continue
+        seen.add(node)
+        nodes.append(node)
+        if not isinstance(node, Var):
+            stack.extend(reversed(node.sons))
+
+    occurrences = {var: [0, index] for index, var in enumerate(node for node in nodes
+                                                               if isinstance(node, Var))}
+    multiplicity = {nodes[0]: 1}
+    for node in _topological(nodes[0]):
+        if isinstance(node, Var):
+            occurrences[node][0] += multiplicity[node]
+            continue
+        for son in node.sons:
+            son = son if isinstance(son, Var) else son._canon
+            multiplicity[son] = multiplicity.get(son, 0) + multiplicity[node]
+
+    if heuristic == DFS_ORDER:
+        return sorted(occurrences, key=lambda var: occurrences[var][1])
+    elif heuristic == FREQUENCY_ORDER:
+        return sorted(occurrences, key=lambda var: (-occurrences[var][0], occurrences[var][1]))
+    raise ValueError(f'unknown heuristic {heuristic}')
+
+
+def _topological(root) -> list:
+    """ Distinct nodes of the hash-consed formula (see variable_order) so that each node is before its sons.
+    """
+    order = []
+    done = set()
+    stack = [(root, False)]
+    while stack:                 # iterative post-order, reversed at the end
+        node, expanded = stack.pop()
+        if expanded:
+            order.append(node)
+            continue
+        if node in done:
+            continue
+        done.add(node)
+        stack.append((node, True))
+        if not isinstance(node, Var):
+            stack.extend((son if isinstance(son, Var) else son._canon, False) for son in node.sons)
+    order.reverse()
+    return order
+
+
+class BDD:
+    """ Manager of the shared BDD nodes with the unique table and operation cache.
+    """
+
+    def __init__(self, order=(), cache_bits=CACHE_BITS):
+        """
+        :param order: initial order of variables (other variables are added to the end)
+        :param cache_bits: log2 of the maximal size of the operation cache (it starts small
+                           and is doubled when there are more nodes than its slots)
+        """
+        self.variables = []         # variable on each level
+        self._levels = {}           # {Var: level}
+        self._node_levels = [None]  # nodes: level, low edge, high edge (node 0 is terminal)
+        self._lows = [None]
+        self._highs = [None]
+        self._unique = []           # {(low, high): index of node} for each level
+
+        self._cache_bits = cache_bits
+        self._cache_mask = (1 << min(cache_bits, MIN_CACHE_BITS)) - 1
+        self._cache = [None] * (self._cache_mask + 1)     # direct mapped: new entry replaces old one
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        for var in order:
+            self.add_var(var)
+
+    def add_var(self, var: Var) -> int:
+        """ Add variable to the end of the order (if it's new).
+
+        :return: level of the variable
+        """
+        if var not in self._levels:
+            self._levels[var] = len(self.variables)
+            self.variables.append(var)
+            self._unique.append({})
+            self._node_levels[0] = len(self.variables)     # terminal is below all the variables
+        return self._levels[var]
+
+    def var(self, var: Var) -> int:
+        """ BDD of the formula that is just one variable.
+        """
+        return self._make(self.add_var(var), FALSE, TRUE)
+
+    def __len__(self):
+        """ Number of nodes in the unique table (with terminal).
+        """
+        return len(self._node_levels)
+
+    def _level(self, edge):
+        return self._node_levels[edge >> 1]
+
+    def _make(self, level, low, high):
+        """ Find or create the node (level ? high : low).
+        """
+        if low == high:
+            return low
+        complement = high & 1       # high edge is always regular
+        if complement:
+            low, high = low ^ 1, high ^ 1
+        table = self._unique[level]
+        index = table.get((low, high))
+        if index is None:
+            index = len(self._node_levels)
+            self._node_levels.append(level)
+            self._lows.append(low)
+            self._highs.append(high)
+            table[(low, high)] = index
+            if index > self._cache_mask and self._cache_mask.bit_length() < self._cache_bits:
+                self._grow_cache()
+        return (index << 1) ^ complement
+
+    def _grow_cache(self):
+        """ Double the operation cache (its entries are kept).
+        """
+        self._cache_mask = (self._cache_mask << 1) | 1
+        cache = [None] * (self._cache_mask + 1)
+        for entry in self._cache:
+            if entry is not None:
+                cache[hash(entry[0]) & self._cache_mask] = entry
+        self._cache = cache
+
+    def _cofactors(self, edge, level):
+        """ (edge for var = 0, edge for var = 1) where var is on the given level.
+        """
+        node = edge >> 1
+        if self._node_levels[node] != level:
+            return edge, edge
+        complement = edge & 1
+        return self._lows[node] ^ complement, self._highs[node] ^ complement
+
+    def _cached(self, key):
+        entry = self._cache[hash(key) & self._cache_mask]
+        if entry is not None and entry[0] == key:
+            self.cache_hits += 1
+            return entry[1]
+        self.cache_misses += 1
+        return None
+
+    def _store(self, key, result):
+        self._cache[hash(key) & self._cache_mask] = (key, result)
+
+    def _and(self, f, g):
+        return self._apply(_AND, f, g)
+
+    def _xor(self, f, g):
+        return self._apply(_XOR, f, g)
+
+    def _apply(self, operation, f, g):
+        """ f & g (operation is _AND) or f ^ g (operation is _XOR) by Shannon expansion.
+
+        Stack has the pairs of edges to compute and the tasks (key, level, complement) to make
+        the node from the last two results.
+        """
+        results = []
+        stack = [(f, g)]
+        while stack:
+            task = stack.pop()
+            if len(task) == 3:
+                key, level, complement = task
+                high = results.pop()
+                result = self._make(level, results.pop(), high)
+                self._store(key, result)
+                results.append(result ^ complement)
+                continue
+
+            f, g = task
+            if operation == _AND:
+                complement = 0
+                if f == FALSE or g == FALSE or f == g ^ 1:
+                    results.append(FALSE)
+                    continue
+                if f == TRUE or f == g:
+                    results.append(g)
+                    continue
+                if g == TRUE:
+                    results.append(f)
+                    continue
+            else:
+                complement = (f ^ g) & 1            # !f ^ g == !(f ^ g)
+                f, g = f & ~1, g & ~1
+                if f == g:
+                    results.append(FALSE ^ complement)
+                    continue
+                if f == TRUE:
+                    results.append(g ^ 1 ^ complement)
+                    continue
+                if g == TRUE:
+                    results.append(f ^ 1 ^ complement)
+                    continue
+            if f > g:
+                f, g = g, f
+            key = (operation, f, g)
+            result = self._cached(key)
+            if result is not None:
+                results.append(result ^ complement)
+                continue
+            level = min(self._level(f), self._level(g))
+            f0, f1 = self._cofactors(f, level)
+            g0, g1 = self._cofactors(g, level)
+            stack.append((key, level, complement))
+            stack.append((f1, g1))
+            stack.append((f0, g0))          # the low result is computed first
+        return results[0]
+
+    def neg(self, f):
+        """ !f (constant time).
+        """
+        return f ^ 1
+
+    def apply(self, operation, f, g):
+        """ BDD of (f * g) for the binary operation * from BINARY.
+        """
+        if operation == AND:
+            return self._and(f, g)
+        elif operation == OR:
+            return self._and(f ^ 1, g ^ 1) ^ 1
+        elif operation == IMPLICATION:
+            return self._and(f, g ^ 1) ^ 1
+        elif operation == XOR:
+            return self._xor(f, g)
+        elif operation == EQUIV:
+            return self._xor(f, g) ^ 1
+        raise ValueError(f'bad operation {operation}')
+
+    def from_formula(self, f, max_nodes=None) -> int:
+        """ Build BDD of the formula (iteratively, each subformula object is built once).
+
+        :param f: Formula or Var
+        :param max_nodes: building stops if the manager has more nodes
+        :return: edge or None if there are more than max_nodes nodes
+        """
+        edges = {}       # {id(subformula): edge}
+        stack = [(f, False)]
+        while stack:
+            node, ready = stack.pop()
+            if id(node) in edges:
+                continue
+            if isinstance(node, Var):
+                edges[id(node)] = self.var(node)
+            elif not ready:
+                stack.append((node, True))
+                stack.extend((son, False) for son in reversed(node.sons))
+            else:
+                sons = [edges[id(son)] for son in node.sons]
+                if node.main_con == PASS:
+                    edges[id(node)] = sons[0]
+                elif node.main_con == NOT:
+                    edges[id(node)] = sons[0] ^ 1
+                else:
+                    edges[id(node)] = self.apply(node.main_con, *sons)
+                    if max_nodes is not None and len(self) > max_nodes:
+                        return None
+        return edges[id(f)]
+
+    def support(self, f) -> list:
+        """ Variables that BDD depends on.
+        """
+        levels = set()
+        self._walk(f, lambda node: levels.add(self._node_levels[node]))
+        return [self.variables[level] for level in sorted(levels)]
+
+    def size(self, f) -> int:
+        """ Number of nodes in BDD (without terminal).
+        """
+        nodes = []
+        self._walk(f, nodes.append)
+        return len(nodes)
+
+    def _walk(self, f, visit):
+        seen = set()
+        stack = [f >> 1]
+        while stack:
+            node = stack.pop()
+            if node == 0 or node in seen:
+                continue
+            seen.add(node)
+            visit(node)
+            stack.append(self._lows[node] >> 1)
+            stack.append(self._highs[node] >> 1)
+
+    def count_models(self, f, variables=None) -> int:
+        """ Number of satisfying assignments (linear in the size of BDD).
+
+        :param f: edge
+        :param variables: variables of the function, all the manager's variables by default
+                          (should contain the support of f)
+        :return: int
+        """
+        total = len(self.variables)
+        counts = {0: 1}     # {node: number of models of regular edge over the variables below node}
+
+        def count(edge, level):
+            """ Number of models of edge over the variables from level to the end. """
+            node = edge >> 1
+            node_level = self._node_levels[node]
+            res = counts[node] if not edge & 1 else (1 << (total - node_level)) - counts[node]
+            return res << (node_level - level)
+
+        nodes = []
+        self._walk(f, nodes.append)
+        for node in sorted(nodes, key=lambda node: -self._node_levels[node]):      # from the bottom
+            level = self._node_levels[node] + 1
+            counts[node] = count(self._lows[node], level) + count(self._highs[node], level)
+
+        result = count(f, 0)
+        if variables is None:
+            return result
+        variables = set(variables)
+        assert all(var in variables for var in self.support(f)), 'variables should contain the support'
+        return result >> (total - len(variables & set(self.variables))) << len(variables - set(self.variables))
+
+    def weighted_count(self, f, weights):
+        """ Total weight of the satisfying assignments of all the manager's variables,
+        weight of assignment is the product of the weights of values of variables.
+
+        :param f: edge
+        :param weights: {Var: (weight of False, weight of True)} for all the manager's variables
+        :return: sum of weights (int, float or Fraction just like the weights)
+        """
+        levels = len(self.variables)
+        sums = [sum(weights[var]) for var in self.variables]
+        below = [1] * (levels + 1)          # total weight of the variables from level to the end
+        for level in reversed(range(levels)):
+            below[level] = below[level + 1] * sums[level]
+
+        values = {0: below[levels]}         # {node: weight of regular edge over the variables below node}
+
+        def value(edge, level):
+            """ Weight of edge over the variables from level to the end. """
+            node = edge >> 1
+            node_level = self._node_levels[node]
+            res = values[node] if not edge & 1 else below[node_level] - values[node]
+            for skipped in range(level, node_level):       # variables that edge doesn't depend on
+                res *= sums[skipped]
+            return res
+
+        nodes = []
+        self._walk(f, nodes.append)
+        for node in sorted(nodes, key=lambda node: -self._node_levels[node]):      # from the bottom
+            level = self._node_levels[node]
+            weight_low, weight_high = weights[self.variables[level]]
+            values[node] = weight_low * value(self._lows[node], level + 1) + \
+                weight_high * value(self._highs[node], level + 1)
+        return value(f, 0)
+
+    def any_sat(self, f):
+        """ Any satisfying assignment.
+
+        :return: {Var: bool} for the support of f or None if f is FALSE
+        """
+        if f == FALSE:
+            return None
+        result = {}
+        while f != TRUE:
+            node, complement = f >> 1, f & 1
+            low, high = self._lows[node] ^ complement, self._highs[node] ^ complement
+            var = self.variables[self._node_levels[node]]
+            result[var] = low == FALSE       # go to high only if low is FALSE
+            f = high if result[var] else low
+        return result
+
+    def transfer(self, f, other) -> int:
+        """ The same function in the other manager (with other order of variables).
+        """
+        done = {0: TRUE}
+        stack = [f >> 1]
+        while stack:                   # iterative post-order by nodes
+            node = stack[-1]
+            if node in done:
+                stack.pop()
+                continue
+            low, high = self._lows[node] >> 1, self._highs[node] >> 1
+            if low not in done or high not in done:
+                stack.extend(child for child in (low, high) if child not in done)
+                continue
+            stack.pop()
+            var = other.var(self.variables[self._node_levels[node]])
+            low = done[low] ^ (self._lows[node] & 1)
+            high = done[high] ^ (self._highs[node] & 1)
+            done[node] = other.apply(OR, other.apply(AND, var, high), other.apply(AND, var ^ 1, low))
+        return done[f >> 1] ^ (f & 1)
+
+    def collect(self, roots=(), trim=False) -> list:
+        """ Remove all the nodes that are unreachable from roots and clean the cache.
+
+        Nodes are renumbered, so edges that aren't in roots become invalid.
+
+        :param roots: edges that are kept
+        :param trim: if True then the variables without nodes are removed from the order as well
+                     (so the manager without roots is empty), the counts of models are over the
+                     rest of variables after it
+        :return: list of new edges for roots
+        """
+        nodes = self._collect_nodes(roots)
+        levels = None
+        if trim:
+            used = sorted({self._node_levels[node] for node in nodes})
+            levels = {level: new_level for new_level, level in enumerate(used)}      # {old level: new level}
+            self.variables = [self.variables[level] for level in used]
+            self._levels = {var: level for level, var in enumerate(self.variables)}
+        indexes = {0: 0}
+        for index, node in enumerate(nodes, 1):
+            indexes[node] = index
+        node_levels, lows, highs = [len(self.variables)], [None], [None]
+        unique = [{} for _ in self.variables]
+        for node in nodes:
+            level = self._node_levels[node] if levels is None else levels[self._node_levels[node]]
+            low = (indexes[self._lows[node] >> 1] << 1) | (self._lows[node] & 1)
+            high = indexes[self._highs[node] >> 1] << 1
+            unique[level][(low, high)] = len(node_levels)
+            node_levels.append(level)
+            lows.append(low)
+            highs.append(high)
+        self._node_levels, self._lows, self._highs, self._unique = node_levels, lows, highs, unique
+
+        bits = min(self._cache_bits, max(MIN_CACHE_BITS, len(node_levels).bit_length()))
+        self._cache_mask = (1 << bits) - 1
+        self._cache = [None] * (self._cache_mask + 1)
+        return [(indexes[root >> 1] << 1) | (root & 1) for root in roots]
+
+    def swap(self, level):
+        """ Exchange the variables on level and level + 1 in place.
+
+        Nodes keep their functions, so the edges and the operation cache stay valid. Nodes of
+        the upper variable that depend on the lower one get the lower variable and new sons,
+        the other nodes only change their levels (some of them could become unreachable,
+        see collect).
+        """
+        upper, lower = self._unique[level], self._unique[level + 1]
+        moved = {}           # nodes of the upper variable that don't depend on the lower one
+        rebuilt = []         # (node, cofactors of its function by both variables)
+        for (low, high), node in upper.items():
+            if self._level(low) != level + 1 and self._level(high) != level + 1:
+                moved[(low, high)] = node
+            else:
+                rebuilt.append((node, self._cofactors(low, level + 1), self._cofactors(high, level + 1)))
+
+        for node in lower.values():
+            self._node_levels[node] = level
+        for node in moved.values():
+            self._node_levels[node] = level + 1
+        self._unique[level], self._unique[level + 1] = lower, moved
+        upper_var, lower_var = self.variables[level], self.variables[level + 1]
+        self.variables[level], self.variables[level + 1] = lower_var, upper_var
+        self._levels[lower_var], self._levels[upper_var] = level, level + 1
+
+        for node, (f00, f01), (f10, f11) in rebuilt:       # fxy: upper var = x, lower var = y
+            low = self._make(level + 1, f00, f10)
+            high = self._make(level + 1, f01, f11)
+            self._node_levels[node] = level
+            self._lows[node], self._highs[node] = low, high
+            lower[(low, high)] = node
+
+    def sift(self, roots) -> list:
+        """ Dynamic reordering of variables by sifting.
+
+        Each variable (from the most used) is moved through all the levels by swaps of adjacent
+        levels (see swap) and returned to the level where the total size of roots' BDDs is minimal.
+        Unreachable nodes are removed after each variable, so edges that aren't in roots become invalid.
+
+        :return: list of new edges for roots
+        """
+        roots = self.collect(roots)
+        last = len(self.variables) - 1
+        usage = {var: 0 for var in self.variables}
+        for node in self._collect_nodes(roots):
+            usage[self.variables[self._node_levels[node]]] += 1
+
+        for var in sorted(self.variables, key=lambda var: -usage[var]):
+            best_size, best_level = len(self._collect_nodes(roots)), self._levels[var]
+            for level in range(self._levels[var], last):                  # down to the bottom
+                self.swap(level)
+                size = len(self._collect_nodes(roots))
+                if size < best_size:
+                    best_size, best_level = size, level + 1
+            for level in reversed(range(last)):                           # up to the top
+                self.swap(level)
+                size = len(self._collect_nodes(roots))
+                if size < best_size:
+                    best_size, best_level = size, level
+            for level in range(best_level):
+                self.swap(level)
+            roots = self.collect(roots)
+        return roots
+
+    def _collect_nodes(self, roots):
+        nodes = []
+        for root in roots:
+            self._walk(root, nodes.append)
+        return list(dict.fromkeys(nodes))
+
+
+_shared = BDD()              # manager of bdd_counterexample and bdd_equivalent
+_shared_lock = Lock()
+
+
+def _shared_manager(*formulas) -> BDD:
+    """ Shared manager with the variables of formulas (should be used with _shared_lock).
+
+    Edges aren't kept between the checks, so when the manager is too big all its nodes
+    and variables are removed and the memory of long-lived process stays bounded.
+    """
+    if len(_shared) > SHARED_MAX_NODES or len(_shared.variables) > SHARED_MAX_VARS:
+        _shared.collect(trim=True)
+    for f in formulas:
+        for var in variable_order(f) if isinstance(f, Formula) else [f]:
+            _shared.add_var(var)
+    return _shared
+
+
+def bdd_counterexample(f, manager=None):
+    """ Find assignment for which formula is False using BDD.
+
+    :param f: Formula
+    :param manager: BDD, by default the shared manager (new variables are added to the end
+                    of its order by variable_order of f)
+    :return: {Var: bool} or None if formula is tautology
+    """
+    if manager is None:
+        with _shared_lock:
+            return bdd_counterexample(f, _shared_manager(f))
+    edge = manager.from_formula(f)
+    result = manager.any_sat(edge ^ 1)
+    if result is not None:
+        result = {var: result.get(var, False) for var in f.vars}
+    return result
+
+
+def bdd_equivalent(f, g, manager=None) -> bool:
+    """ Check if formulas are equivalent: their BDDs in the same manager are the same edge.
+
+    :param f: Formula or Var
+    :param g: Formula or Var
+    :param manager: BDD, the shared manager by default
+    """
+    if manager is None:
+        with _shared_lock:
+            return bdd_equivalent(f, g, _shared_manager(f, g))
+    return manager.from_formula(f) == manager.from_formula(g)
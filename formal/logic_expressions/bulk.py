@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*-encoding: utf-8-*-
+
+""" Checking of the big files with formulas (one formula per line).
+
+Lines go through the pipeline of generators: read -> batches -> parse and check -> JSON lines,
+so only a few batches are in memory at the same time.
+"""
+
+import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from time import perf_counter
+
+from .formulas import *
+from .parser import *
+
+BATCH_SIZE = 1000          # formulas in one batch
+BUFFER_SIZE = 1 << 20      # size of buffers for reading and writing
+
+
+def read_formulas(file):
+    """ Not empty lines of the file.
+
+    :param file: text file
+    :return: generator of (number of line starting from 1, line without spaces)
+    """
+    for number, line in enumerate(file, 1):
+        line = line.strip()
+        if line:
+            yield number, line
+
+
+def batches(items, size=BATCH_SIZE):
+    """ Split iterable into the lists of the given size.
+    """
+    items = iter(items)
+    while True:
+        batch = list(islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+def check_formula(number, text, engine=AUTO_ENGINE) -> dict:
+    """ Parse and check one formula.
+
+    :return: {'line': number, 'formula': text, 'tautology': bool, 'counterexample': {name: value} or None}
+             or {'line': number, 'formula': text, 'error': message} if formula is bad
+    """
+    try:
+        f = parse(text)
+    except ErrorLogicExpression as e:
+        return {'line': number, 'formula': text, 'error': str(e)}
+
+    counterexample = f.find_counterexample(engine=engine)
+    if counterexample is not None:
+        counterexample = {var.name: value for var, value in sorted(counterexample.items(),
+                                                                   key=lambda item: item[0].name)}
+    return {'line': number, 'formula': text, 'tautology': counterexample is None,
+            'counterexample': counterexample}
+
+
+def check_batch(batch, engine=AUTO_ENGINE) -> list:
+    """ check_formula for each (number, text) of the batch.
+    """
+    return [check_formula(number, text, engine) for number, text in batch]
+
+
+def check_formulas(formulas, batch_size=BATCH_SIZE, workers=None, engine=AUTO_ENGINE):
+    """ Check the stream of formulas.
+
+    :param formulas: iterable of (number of line, text of formula)
+    :param batch_size: number of formulas sent to the worker at once
+    :param workers: number of processes, by default everything is checked in this process
+    :param engine: engine for check_tautology
+    :return: generator of results of check_formula in the same order
+    """
+    if workers is None or workers < 2:
+        for batch in batches(formulas, batch_size):
+            yield from check_batch(batch, engine)
+        return
+
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()          # at most 2 batches for each worker, so memory doesn't grow
+        for batch in batches(formulas, batch_size):
+            pending.append(executor.submit(check_batch, batch, engine))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def write_results(results, file, batch_size=BATCH_SIZE) -> int:
+    """ Write results as JSON lines, batch by batch.
+
+    :return: number of written results
+    """
+    count = 0
+    for batch in batches(results, batch_size):
+        file.write(''.join(json.dumps(result) + '\n' for result in batch))
+        count += len(batch)
+    return count
+
+
+def check_file(src, dst, batch_size=BATCH_SIZE, workers=None, engine=AUTO_ENGINE):
+    """ Check all the formulas of the file src and write results to dst.
+
+    :param src: text file with one formula per line
+    :param dst: text file for JSON lines
+    :return: number of formulas, time in seconds
+    """
+    start = perf_counter()
+    count = write_results(check_formulas(read_formulas(src), batch_size, workers, engine), dst, batch_size)
+    return count, perf_counter() - start
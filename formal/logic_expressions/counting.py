@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+# -*-encoding: utf-8-*-
+
+""" Counting of the models of formula (#SAT) and their total weight.
+
+Weight of assignment is the product of weights of the values of variables, weights are
+{Var: (weight of False, weight of True)} or {Var: p} for (1 - p, p), the other variables
+have weights (1, 1). So if all the variables have probabilities, the result is the
+probability that formula is True.
+
+For the small number of variables the rows of the truth table are counted, then BDD is
+tried (compilation to the decision diagram that is deterministic and decomposable, so the
+count is linear in its size) and if it is too big, the DPLL counter on the clauses of
+Tseitin encoding is used (new variables of the encoding are determined by the original
+ones, so the number of models is the same):
+
+    new variables are eliminated by the resolution while the clauses don't become longer
+    or more numerous (so the clauses of CNF formula are the same again);
+    unit propagation after each decision by the occurrence lists of the component;
+    variables that are in no clause give the factor (weight of False + weight of True);
+    clauses are split into the connected components (by the common variables),
+    the result is the product of their counts, and each component is counted once
+    (cache {sorted tuple of clauses: count});
+    decision is the most frequent variable nearest to the center of component,
+    so the chains are split in the middle (n log n for the chain of n implications).
+
+DPLL counter works with 50 - 100 variables when formula has the independent parts or
+the structure that splits after a few decisions (random 3-CNF with 60 variables and
+3 clauses per variable takes a few seconds).
+"""
+
+from collections import deque
+from collections.abc import Sequence
+
+from .formulas import *
+from .sat import tseitin
+
+COUNT_TABLE_MAX_VARS = 16     # formulas with at most this number of variables are counted by the truth table
+COUNT_BDD_MAX_NODES = 1 << 16  # BDD counting is replaced by DPLL counter if BDD has more nodes
+COUNT_MAX_RESOLVENT = 8       # variables aren't eliminated by DPLL counter if they give the longer clauses
+
+
+def _weight_pair(var, weights) -> tuple:
+    """ (weight of False, weight of True) of the variable.
+
+    Weight is any sequence of two weights (tuple, list, ...) or the probability of True.
+    """
+    if weights is None or var not in weights:
+        return 1, 1
+    weight = weights[var]
+    if not isinstance(weight, Sequence):
+        return 1 - weight, weight
+    if len(weight) != 2:
+        raise ValueError(f'weight of {var} should be (weight of False, weight of True) or probability, '
+                         f'got {weight!r}')
+    return tuple(weight)
+
+
+def table_count(f, weights=None):
+    """ Number of models (or their weight) by the rows of truth table.
+    """
+    table = f.truth_table()
+    if weights is None:
+        return table.count_models()
+    pairs = {var: _weight_pair(var, weights) for var in table.variables}
+    total = 0
+    for row, bits in table.chunks():
+        while bits:
+            low = bits & -bits
+            weight = 1
+            for var, value in table.assignment(row + low.bit_length() - 1).items():
+                weight *= pairs[var][value]
+            total += weight
+            bits ^= low
+    return total
+
+
+def bdd_count(f, weights=None, max_nodes=None):
+    """ Number of models (or their weight) by BDD of the formula.
+
+    :return: int, the sum of weights or None if BDD has more than max_nodes nodes
+    """
+    from .bdd import BDD, variable_order
+    manager = BDD(variable_order(f))
+    edge = manager.from_formula(f, max_nodes)
+    if edge is None:
+        return None
+    if weights is None:
+        return manager.count_models(edge)
+    return manager.weighted_count(edge, {var: _weight_pair(var, weights) for var in manager.variables})
+
+
+def _occurrences(clauses) -> dict:
+    """ Occurrence lists {variable: list of indexes of the clauses with it}.
+    """
+    occurrences = {}
+    for i, clause in enumerate(clauses):
+        for literal in clause:
+            occurrences.setdefault(abs(literal), []).append(i)
+    return occurrences
+
+
+def _propagate(clauses, occurrences, literal):
+    """ Assign the literal and propagate the unit clauses.
+
+    Only the clauses with the falsified literals are visited (by the occurrence lists),
+    so the propagation is linear in the number of their occurrences.
+
+    :return: {variable: bool} of the assigned variables or None if there is a conflict
+    """
+    values = {abs(literal): literal > 0}
+    queue = [literal]
+    while queue:
+        literal = queue.pop()
+        for i in occurrences[abs(literal)]:
+            unassigned = None
+            for other in clauses[i]:
+                value = values.get(abs(other))
+                if value is None:
+                    if unassigned is not None:
+                        break              # at least two unassigned literals
+                    unassigned = other
+                elif value == (other > 0):
+                    break                  # clause is satisfied
+            else:
+                if unassigned is None:
+                    return None            # all the literals are False
+                values[abs(unassigned)] = unassigned > 0
+                queue.append(unassigned)
+    return values
+
+
+def _components(clauses) -> list:
+    """ Connected components of clauses by the common variables.
+
+    :return: list of the keys of components: sorted tuples of clauses (each clause is
+             the sorted tuple of literals), so the equal components have the equal keys
+    """
+    parents = {}
+
+    def find(x):
+        while parents[x] != x:
+            parents[x] = parents[parents[x]]
+            x = parents[x]
+        return x
+
+    for clause in clauses:
+        first = find(parents.setdefault(abs(clause[0]), abs(clause[0])))
+        for literal in clause[1:]:
+            root = find(parents.setdefault(abs(literal), abs(literal)))
+            if root != first:
+                parents[root] = first
+
+    groups = {}
+    for clause in clauses:
+        groups.setdefault(find(abs(clause[0])), []).append(clause)
+    return [tuple(sorted(group)) for group in groups.values()]
+
+
+def _branch(clauses, occurrences, literal, pairs):
+    """ Weight of the assigned and free variables, components of the rest clauses.
+
+    :return: (weight, list of components) or None if there is a conflict
+    """
+    values = _propagate(clauses, occurrences, literal)
+    if values is None:
+        return None
+    weight = 1
+    for var, value in values.items():
+        weight *= pairs[var][value]
+
+    rest = []
+    for clause in clauses:
+        reduced = []
+        for other in clause:
+            value = values.get(abs(other))
+            if value is None:
+                reduced.append(other)
+            elif value == (other > 0):
+                break                      # clause is satisfied
+        else:
+            rest.append(tuple(reduced))
+    free = set(occurrences).difference(values)
+    free.difference_update(abs(other) for clause in rest for other in clause)
+    for var in free:
+        weight *= sum(pairs[var])
+    return weight, _components(rest)
+
+
+def _resolvents(positive, negative, var):
+    """ Resolvents of the clauses by the variable (without tautologies).
+
+    :return: set of clauses or None if there are more of them than the given clauses,
+             some of them is longer than COUNT_MAX_RESOLVENT or empty
+    """
+    resolvents = set()
+    for first in positive:
+        for second in negative:
+            resolvent = set(first).union(second)
+            resolvent.difference_update((var, -var))
+            if not resolvent or len(resolvent) > COUNT_MAX_RESOLVENT:
+                return None
+            if not any(-literal in resolvent for literal in resolvent):
+                resolvents.add(tuple(sorted(resolvent)))
+                if len(resolvents) > len(positive) + len(negative):
+                    return None
+    return resolvents
+
+
+def _eliminate(clauses, original) -> list:
+    """ Elimination of the new variables of Tseitin encoding by the resolution while it doesn't
+    increase the number of clauses (and the clauses aren't longer than COUNT_MAX_RESOLVENT).
+
+    New variables are the functions of the original ones, so the models of the result are
+    the same models without the values of eliminated variables (and the count is the same).
+    The other variables could disappear from the clauses, then they are free.
+
+    :param original: number of the original variables (they have the least indexes)
+    :return: list of clauses, set of the eliminated variables
+    """
+    clauses = dict(enumerate(clauses))
+    count = len(clauses)           # next index of clause
+    occurrences = {}
+    for i, clause in clauses.items():
+        for literal in clause:
+            occurrences.setdefault(abs(literal), set()).add(i)
+
+    eliminated = set()
+    changed = True
+    while changed:
+        changed = False
+        for var in sorted((var for var in occurrences if var > original), key=lambda var: len(occurrences[var])):
+            positive = [clauses[i] for i in occurrences[var] if var in clauses[i]]
+            negative = [clauses[i] for i in occurrences[var] if -var in clauses[i]]
+            resolvents = _resolvents(positive, negative, var)
+            if resolvents is None:
+                continue
+
+            eliminated.add(var)
+            for i in occurrences.pop(var):
+                for literal in clauses.pop(i):
+                    if abs(literal) != var:
+                        occurrences[abs(literal)].discard(i)
+            for resolvent in resolvents:
+                clauses[count] = resolvent
+                for literal in resolvent:
+                    occurrences[abs(literal)].add(count)
+                count += 1
+            changed = True
+    return list(dict.fromkeys(clauses.values())), eliminated
+
+
+def _distances(clauses, occurrences, start) -> dict:
+    """ Distances from the variable to the other ones (by the common clauses).
+    """
+    distances = {start: 0}
+    visited = set()                # clauses
+    queue = deque([start])
+    while queue:
+        var = queue.popleft()
+        for i in occurrences[var]:
+            if i in visited:
+                continue
+            visited.add(i)
+            for literal in clauses[i]:
+                if abs(literal) not in distances:
+                    distances[abs(literal)] = distances[var] + 1
+                    queue.append(abs(literal))
+    return distances
+
+
+def _decision(clauses, occurrences):
+    """ Variable for the decision: the most frequent one, from the equal ones the nearest
+    to the center of the component, so the long chains are split in the middle.
+    """
+    best = max(len(clause_indexes) for clause_indexes in occurrences.values())
+    candidates = [var for var, clause_indexes in occurrences.items() if len(clause_indexes) == best]
+    if len(candidates) == 1:
+        return candidates[0]
+
+    # center is approximated by two sweeps of the breadth-first search from the far variables
+    first = _distances(clauses, occurrences, candidates[0])
+    first = _distances(clauses, occurrences, max(first, key=first.get))
+    second = _distances(clauses, occurrences, max(first, key=first.get))
+    return min(candidates, key=lambda var: max(first[var], second[var]))
+
+
+def _count(component, pairs):
+    """ Generator of the count of the component (see dpll_count).
+
+    It yields the components after the decisions and gets their counts back.
+    """
+    if len(component) == 1:        # all the assignments except the one that falsifies the clause
+        total = falsified = 1
+        for literal in component[0]:
+            total *= sum(pairs[abs(literal)])
+            falsified *= pairs[abs(literal)][literal < 0]
+        return total - falsified
+
+    occurrences = _occurrences(component)
+    var = _decision(component, occurrences)
+
+    total = 0
+    for literal in (var, -var):
+        result = _branch(component, occurrences, literal, pairs)
+        if result is None:
+            continue
+        weight, components = result
+        for other in components:
+            if weight == 0:
+                break
+            weight *= yield other
+        total += weight
+    return total
+
+
+def dpll_count(f, weights=None):
+    """ Number of models (or their weight) by DPLL with the cache of components.
+
+    >>> f = Formula(OR, None, Var('x0'), Var('y0'))
+    >>> for i in range(1, 30):
+    ...     f = f.con(Formula(OR, None, Var(f'x{i}'), Var(f'y{i}')))
+    >>> dpll_count(f) == 3 ** 30
+    True
+    >>> dpll_count(Formula(AND, None, Var('x0'), Var('y0')), {Var('x0'): 0.5, Var('y0'): (1, 3)})
+    1.5
+
+    :param f: Formula or Var
+    :param weights: {Var: (weight of False, weight of True)} or {Var: probability of True}
+    :return: int (without weights) or the sum of weights
+    """
+    clauses, root, variables = tseitin(f)
+    pairs = {index: _weight_pair(var, weights) for var, index in variables.items()}
+    count = max([abs(root)] + [abs(literal) for clause in clauses for literal in clause])
+    for index in range(len(variables) + 1, count + 1):         # new variables of Tseitin encoding
+        pairs[index] = (1, 1)
+
+    clauses = [tuple(sorted(set(clause))) for clause in clauses]
+    clauses = [clause for clause in clauses if not any(-literal in clause for literal in clause)]
+    clauses.append((root,))
+    occurrences = _occurrences(clauses)
+    result = _branch(clauses, occurrences, root, pairs)
+    if result is None:
+        return 0
+    weight, components = result
+    for var in set(pairs).difference(occurrences):             # variables that aren't in the clauses
+        weight *= sum(pairs[var])
+
+    clauses = [clause for component in components for clause in component]
+    free = {abs(literal) for clause in clauses for literal in clause}
+    clauses, eliminated = _eliminate(clauses, len(variables))
+    free.difference_update(eliminated)
+    free.difference_update(abs(literal) for clause in clauses for literal in clause)
+    for var in free:
+        weight *= sum(pairs[var])
+    units = [clause[0] for clause in clauses if len(clause) == 1]
+    while units:               # resolvents could be the unit clauses
+        result = _branch(clauses, _occurrences(clauses), units[0], pairs)
+        if result is None:
+            return 0
+        weight *= result[0]
+        clauses = [clause for component in result[1] for clause in component]
+        units = [clause[0] for clause in clauses if len(clause) == 1]
+    components = _components(clauses)
+
+    cache = {}                 # {component: count}
+    for component in components:
+        if weight == 0:
+            break
+        stack = [(component, _count(component, pairs))]
+        value = None
+        while stack:           # generators instead of recursion
+            task, counter = stack[-1]
+            try:
+                subtask = counter.send(value)
+            except StopIteration as stop:
+                stack.pop()
+                value = cache[task] = stop.value
+                continue
+            if subtask in cache:
+                value = cache[subtask]
+            else:
+                stack.append((subtask, _count(subtask, pairs)))
+                value = None
+        weight *= value
+    return weight
+
+
+def count_models(f, weights=None, engine=AUTO_ENGINE):
+    """ Number of models of formula (or their total weight).
+
+    :param f: Formula or Var
+    :param weights: {Var: (weight of False, weight of True)} or {Var: probability of True}
+    :param engine: TABLE_ENGINE, BDD_ENGINE, SAT_ENGINE (DPLL counter) or AUTO_ENGINE
+                   (table for at most COUNT_TABLE_MAX_VARS variables, then BDD while it has
+                   at most COUNT_BDD_MAX_NODES nodes, DPLL counter otherwise)
+    :return: int (without weights) or the sum of weights
+    """
+    f = Formula(PASS, None, f) if isinstance(f, Var) else f
+    if engine == AUTO_ENGINE:
+        if len(f.vars) <= COUNT_TABLE_MAX_VARS:
+            return table_count(f, weights)
+        result = bdd_count(f, weights, COUNT_BDD_MAX_NODES)
+        return dpll_count(f, weights) if result is None else result
+    if engine in (TABLE_ENGINE, GRAY_ENGINE):
+        return table_count(f, weights)
+    if engine == BDD_ENGINE:
+        return bdd_count(f, weights)
+    if engine == SAT_ENGINE:
+        return dpll_count(f, weights)
+    raise ValueError(f'unknown engine {engine}')
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*-encoding: utf-8-*-
+
+""" Splitting of the formula into the independent parts before the search of counterexample.
+
+Search of the assignment for which formula has the given value goes down by the connectives:
+
+    A & B is False      if A is False or B is False (the same for A | B is True, A -> B is True);
+    A & B is True       if A is True and B is True, when A and B have no common variables
+                        (the same for A | B, A -> B is False, A <-> B and A ^ B with two options);
+    !A has the value    if A has the opposite one.
+
+So the parts with the disjoint sets of variables (see Formula.var_mask) are checked separately
+and 2^n1 + 2^n2 rows are enumerated instead of 2^(n1 + n2). Before the engine is used,
+pure variables (that occur only positively or only negatively) get the value that doesn't
+help the formula, constants are folded and the rest is split again. Variables that disappear
+(together with the other unused ones) get False. Signs of the occurrences are computed once
+for each hash-consed subformula (see _signs), so the levels without pure variables
+don't traverse the formula again.
+"""
+
+from .formulas import *
+from .normal_forms import _transform
+
+
+def _unwrap(f):
+    while isinstance(f, Formula) and f.main_con == PASS:
+        f = f.sons[0]
+    return f
+
+
+# pairs of the values of sons for the given value of binary connective
+_OPTIONS = {(AND, True): ((True, True),),
+            (AND, False): ((False, True), (True, False), (False, False)),
+            (OR, True): ((True, False), (False, True), (True, True)),
+            (OR, False): ((False, False),),
+            (IMPLICATION, True): ((False, False), (True, True), (False, True)),
+            (IMPLICATION, False): ((True, False),),
+            (EQUIV, True): ((True, True), (False, False)),
+            (EQUIV, False): ((True, False), (False, True)),
+            (XOR, True): ((True, False), (False, True)),
+            (XOR, False): ((True, True), (False, False))}
+
+# connective and value for which it is enough that one of the sons has the given value
+_ONE_SON = {(AND, False): (False, False),
+            (OR, True): (True, True),
+            (IMPLICATION, True): (False, True)}
+
+
+def _signs(f) -> tuple:
+    """ (mask of variables with positive occurrences, mask of variables with negative ones).
+
+    Masks are kept in the hash-consed formulas, so each subformula is traversed once.
+    """
+    if isinstance(f, Var):
+        return f.var_mask, 0
+    root = f._canon
+    stack = [(root, False)]
+    while stack:                   # iterative post-order traversal
+        node, ready = stack.pop()
+        if node._signs is not None:
+            continue
+        if not ready:
+            stack.append((node, True))
+            stack.extend((son, False) for son in node.sons if not isinstance(son, Var))
+            continue
+        signs = [_signs(son) if isinstance(son, Var) else son._signs for son in node.sons]
+        if node.main_con == PASS:
+            node._signs = signs[0]
+        elif node.main_con == NOT:
+            node._signs = signs[0][::-1]
+        else:
+            (positive_a, negative_a), (positive_b, negative_b) = signs
+            if node.main_con == IMPLICATION:
+                node._signs = (negative_a | positive_b, positive_a | negative_b)
+            elif node.main_con in (EQUIV, XOR):
+                node._signs = (node.var_mask, node.var_mask)
+            else:
+                node._signs = (positive_a | positive_b, negative_a | negative_b)
+    return root._signs
+
+
+def polarities(f) -> dict:
+    """ Signs of the occurrences of variables.
+
+    >>> a, b = Var('a'), Var('b')
+    >>> sorted((var.name, signs) for var, signs in polarities(Formula(IMPLICATION, None, a, b)).items())
+    [('a', {False}), ('b', {True})]
+
+    :param f: Formula or Var
+    :return: {Var: set of signs}, True for positive occurrence, False for negative
+    """
+    positive, negative = _signs(f)
+    return {var: {sign for sign, mask in ((True, positive), (False, negative)) if mask & var.var_mask}
+            for var in f.vars}
+
+
+def restrict(f, values):
+    """ Formula with the given values of some variables (constants are folded).
+
+    >>> a, b = Var('a'), Var('b')
+    >>> str(restrict(Formula(IMPLICATION, None, a, b), {a: True}))
+    'b'
+    >>> restrict(Formula(OR, None, a, b), {b: True})
+    True
+
+    :param f: Formula or Var
+    :param values: {Var: bool}
+    :return: Formula (or Var) or bool if the value doesn't depend on the other variables
+    """
+    def combine(node, sons):
+        if isinstance(node, Var):
+            return values.get(node, node)
+        if node.main_con == NOT:
+            a = sons[0]
+            return (not a) if isinstance(a, bool) else Formula(NOT, None, a)
+        a, b = sons
+        if isinstance(a, bool) and isinstance(b, bool):
+            return FUNCTIONS[node.main_con](a, b)
+        if node.main_con == IMPLICATION and isinstance(a, bool):
+            return b if a else True
+        if isinstance(a, bool):                # other connectives are commutative
+            a, b = b, a
+        if not isinstance(b, bool):
+            return Formula(node.main_con, None, a, b)
+        if node.main_con == AND:
+            return a if b else False
+        if node.main_con == OR:
+            return True if b else a
+        if node.main_con == IMPLICATION:
+            return True if b else Formula(NOT, None, a)
+        if (node.main_con == EQUIV) == b:       # a <-> True, a ^ False
+            return a
+        return Formula(NOT, None, a)
+
+    return _transform(f, combine)
+
+
+def _search(f, value, workers, engine):
+    """ Generator of the search of assignment for which f has the value (see decomposed_counterexample).
+
+    It yields the subtasks (formula, value) and gets their results back.
+    """
+    node = _unwrap(f)
+    if isinstance(node, Var):
+        return {node: value}
+    if node.main_con == NOT:
+        return (yield node.sons[0], not value)
+
+    a, b = node.sons
+    key = (node.main_con, value)
+    if key in _ONE_SON:
+        value_a, value_b = _ONE_SON[key]
+        result = yield a, value_a
+        if result is None:
+            result = yield b, value_b
+        return result
+    if not a.var_mask & b.var_mask:           # independent parts
+        for value_a, value_b in _OPTIONS[key]:
+            result_a = yield a, value_a
+            if result_a is None:
+                continue
+            result_b = yield b, value_b
+            if result_b is not None:
+                return {**result_a, **result_b}
+        return None
+
+    target = node if not value else node.neg()         # assignment for which target is False
+    positive, negative = _signs(target)
+    pure = positive ^ negative
+    if not pure:
+        return target.find_counterexample(workers, engine, decompose=False)
+    fixed = {var: not positive & var.var_mask for var in target.vars if var.var_mask & pure}
+    rest = restrict(target, fixed)
+    if isinstance(rest, bool):
+        return None if rest else fixed
+    result = yield rest, False
+    return None if result is None else {**fixed, **result}
+
+
+def decomposed_counterexample(f, workers=None, engine=AUTO_ENGINE):
+    """ Find assignment for which formula is False checking its independent parts separately.
+
+    >>> a, b, c, d = Var('a'), Var('b'), Var('c'), Var('d')
+    >>> f = Formula(OR, None, Formula(XOR, None, a, b), Formula(EQUIV, None, c, d))
+    >>> sorted((var.name, value) for var, value in decomposed_counterexample(f).items())
+    [('a', True), ('b', True), ('c', True), ('d', False)]
+
+    :param f: Formula
+    :param workers: number of processes for the engine (see Formula.find_counterexample)
+    :param engine: engine for the parts that can't be split
+    :return: {Var: bool} or None if formula is tautology
+    """
+    memo = {}                  # {(hash-consed subformula, value): result}
+    stack = [((f, False), _search(f, False, workers, engine))]
+    result = None
+    while stack:               # generators instead of recursion
+        task, search = stack[-1]
+        try:
+            subtask = search.send(result)
+        except StopIteration as stop:
+            stack.pop()
+            result = memo[task] = stop.value
+            continue
+        subtask = (_unwrap(subtask[0]) if isinstance(_unwrap(subtask[0]), Var) else subtask[0]._canon,
+                   subtask[1])
+        if subtask in memo:
+            result = memo[subtask]
+        else:
+            stack.append((subtask, _search(*subtask, workers, engine)))
+            result = None
+
+    if result is None:
+        return None
+    return {var: result.get(var, False) for var in f.vars}
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*-encoding: utf-8-*-
+
+""" Equivalence and implication of formulas with the shared cache of results.
+
+Result of the check doesn't depend on the names of variables, so the key of formula is
+the hash of its structure where variables are renamed by the order of their first
+occurrence: (a -> b) and (b -> a) have the same key and the counterexample found for one
+of them is used for the other. Cache is shared by all the formulas of the process,
+it keeps at most size of the last used results and could be saved to the file
+(JSON lines {"key": ..., "counterexample": ...}) and loaded in the next run.
+"""
+
+import json
+import os
+from collections import OrderedDict
+from hashlib import blake2b
+from threading import RLock
+from weakref import WeakKeyDictionary
+
+from .formulas import *
+
+CACHE_SIZE = 1 << 16         # results kept by the default cache
+
+
+def canonical_key(f) -> tuple:
+    """ Key of the formula that doesn't depend on the names of variables.
+
+    >>> a, b = Var('a'), Var('b')
+    >>> key, variables = canonical_key(Formula(IMPLICATION, None, a, b))
+    >>> key == canonical_key(Formula(IMPLICATION, None, b, a))[0], variables
+    (True, (Var('a'), Var('b')))
+
+    Key of the formula is built from the keys of its sons and the places of the variables
+    of the second son among the variables of formula, so each hash-consed subformula
+    is hashed once (keys of all the subformulas are kept) and the shared parts cost nothing.
+
+    :param f: Formula or Var
+    :return: hash of the structure (hex string), tuple of Vars by the order of the first occurrence
+    """
+    f = Formula(PASS, None, f) if isinstance(f, Var) else f._canon
+    if f in _keys:
+        return _keys[f]
+
+    stack = [(f, False)]
+    while stack:                     # iterative post-order traversal
+        node, ready = stack.pop()
+        if node in _keys:
+            continue
+        if node.main_con == PASS and isinstance(node.sons[0], Var):
+            _keys[node] = _VARIABLE_KEY, node.sons
+        elif not ready:
+            stack.append((node, True))
+            stack.extend((son, False) for son in reversed(node.sons))
+        elif node.main_con == PASS:
+            _keys[node] = _keys[node.sons[0]]
+        elif len(node.sons) == 1:
+            key, variables = _keys[node.sons[0]]
+            _keys[node] = _digest(f'{node.main_con} {key}'), variables
+        else:
+            (left, variables), (right, right_variables) = _keys[node.sons[0]], _keys[node.sons[1]]
+            places = {var: k for k, var in enumerate(variables)}
+            for var in right_variables:
+                places.setdefault(var, len(places))
+            _keys[node] = (_digest(f"{node.main_con} {left} {right} "
+                                   f"{','.join(str(places[var]) for var in right_variables)}"),
+                           tuple(places))
+    return _keys[f]
+
+
+def _digest(text) -> str:
+    return blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+_VARIABLE_KEY = _digest('0')
+_keys = WeakKeyDictionary()          # {hash-consed formula: result of canonical_key} for all the subformulas
+
+
+class ResultCache:
+    """ LRU cache {canonical key: counterexample} for the checks of tautology.
+
+    Counterexample is stored as the string of '0' and '1' (values of variables by the order
+    of canonical_key) or None for tautology.
+    """
+
+    def __init__(self, size=CACHE_SIZE, path=None):
+        """
+        :param size: maximal number of results
+        :param path: file for save(), results from it are loaded if it exists
+        """
+        self.size = size
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._lock = RLock()
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._results:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._results.move_to_end(key)
+            return self._results[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._results[key] = value
+            self._results.move_to_end(key)
+            while len(self._results) > self.size:
+                self._results.popitem(last=False)       # the least recently used
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self.hits = self.misses = 0
+
+    def load(self, path):
+        """ Add the results from the file (see save).
+        """
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    record = json.loads(line)
+                    self.put(record['key'], record['counterexample'])
+
+    def save(self, path=None):
+        """ Write all the results to the file (by default to the path of cache).
+        """
+        path = self.path if path is None else path
+        assert path is not None, 'no path for the cache'
+        with self._lock:
+            lines = [json.dumps({'key': key, 'counterexample': value}) + '\n'
+                     for key, value in self._results.items()]
+        with open(path, 'w', encoding='utf-8') as file:
+            file.writelines(lines)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._results
+
+    def __len__(self):
+        with self._lock:
+            return len(self._results)
+
+    def __repr__(self):
+        with self._lock:
+            return f'ResultCache(<{len(self)} of {self.size} results, {self.hits} hits, {self.misses} misses>)'
+
+
+default_cache = ResultCache()
+
+
+def find_counterexample(f, workers=None, engine=AUTO_ENGINE, cache=None):
+    """ Formula.find_counterexample with the shared cache of results.
+
+    >>> a, b = Var('a'), Var('b')
+    >>> cache = ResultCache()
+    >>> find_counterexample(Formula(IMPLICATION, None, a, b), cache=cache) == {a: True, b: False}
+    True
+    >>> find_counterexample(Formula(IMPLICATION, None, b, a), cache=cache) == {b: True, a: False}
+    True
+    >>> cache
+    ResultCache(<1 of 65536 results, 1 hits, 1 misses>)
+
+    :param f: Formula or Var
+    :param workers: number of processes (see Formula.find_counterexample)
+    :param engine: engine for the formulas that aren't in the cache
+    :param cache: ResultCache, by default default_cache
+    :return: {Var: bool} or None if formula is tautology
+    """
+    cache = default_cache if cache is None else cache
+    key, variables = canonical_key(f)
+    value = cache.get(key, False)
+    if value is False:
+        f = Formula(PASS, None, f) if isinstance(f, Var) else f
+        if Formula.store is not None:        # persistent store (see store.py)
+            counterexample = Formula.store.find_counterexample(f, workers, engine)
+        else:
+            counterexample = f.find_counterexample(workers, engine)
+        value = None if counterexample is None else ''.join('01'[counterexample[var]] for var in variables)
+        cache.put(key, value)
+    if value is None:
+        return None
+    return {var: bit == '1' for var, bit in zip(variables, value)}
+
+
+def cached_check_tautology(f, workers=None, engine=AUTO_ENGINE, cache=None) -> bool:
+    """ Formula.check_tautology with the shared cache of results.
+    """
+    return find_counterexample(f, workers, engine, cache) is None
+
+
+def equivalent(f, g, workers=None, engine=AUTO_ENGINE, cache=None) -> bool:
+    """ Check if formulas have the same values for all the assignments.
+
+    >>> a, b = Var('a'), Var('b')
+    >>> equivalent(Formula(IMPLICATION, None, a, b), Formula(OR, None, Formula(NOT, None, a), b))
+    True
+
+    :param f: Formula or Var
+    :param g: Formula or Var
+    :param engine: with BDD_ENGINE the BDDs of formulas in the shared manager are compared
+                   (see bdd_equivalent), the cache isn't used
+    :return: bool
+    """
+    if engine == BDD_ENGINE:
+        from .bdd import bdd_equivalent
+        return bdd_equivalent(f, g)
+    return cached_check_tautology(Formula(EQUIV, None, f, g), workers, engine, cache)
+
+
+def implies(f, g, workers=None, engine=AUTO_ENGINE, cache=None) -> bool:
+    """ Check if g is True for all the assignments for which f is True.
+
+    >>> a, b = Var('a'), Var('b')
+    >>> implies(Formula(AND, None, a, b), a), implies(a, Formula(AND, None, a, b))
+    (True, False)
+
+    :param f: Formula or Var
+    :param g: Formula or Var
+    :return: bool
+    """
+    return cached_check_tautology(Formula(IMPLICATION, None, f, g), workers, engine, cache)
@@ -7,8 +7,12 @@
 # Taras Shevchenko National University of Kyiv
 # email: davendiy@gmail.com
 
-from itertools import product
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from functools import lru_cache
+from multiprocessing import Event
 from threading import RLock
+from warnings import warn
+from weakref import WeakValueDictionary
 
 # Global constants for operations
 IMPLICATION = '->'
@@ -37,6 +41,42 @@ FUNCTIONS = {OR: lambda a, b: a or b,
              PASS: lambda a: a,
              }
 
+# templates of python expressions for each operation (used for compiling formulas)
+EXPRESSIONS = {OR: '{} or {}',
+               AND: '{} and {}',
+               EQUIV: '{} == {}',
+               XOR: '{} != {}',
+               IMPLICATION: 'not {} or {}',
+               NOT: 'not {}',
+               PASS: '{}',
+               }
+
+# the same for the bitwise evaluation (each bit is a row of truth table, m - mask of all the rows)
+BITWISE_EXPRESSIONS = {OR: '{} | {}',
+                       AND: '{} & {}',
+                       EQUIV: '~({} ^ {}) & m',
+                       XOR: '{} ^ {}',
+                       IMPLICATION: '(~{} | {}) & m',
+                       NOT: '~{} & m',
+                       PASS: '{}',
+                       }
+BITWISE_FUNCTIONS = {operation: eval('lambda m, a, b=0: ' + template.format('a', 'b'))
+                     for operation, template in BITWISE_EXPRESSIONS.items()}
+
+CHUNK_BITS = 16      # truth table is computed by the blocks of 2^CHUNK_BITS rows
+SHARDS_PER_WORKER = 4       # number of parts of truth table for each process in parallel mode
+
+# engines for checking tautology
+TABLE_ENGINE = 'table'      # full truth table (see TruthTable)
+GRAY_ENGINE = 'gray'        # truth table with the incremental blocks (see GrayCodeTable)
+SAT_ENGINE = 'sat'          # CDCL solver for the negation of formula (see sat.py)
+BDD_ENGINE = 'bdd'          # reduced ordered BDD (see bdd.py)
+# auto engine: table (gray for one process and several blocks, blocks by the processes for several workers)
+# for at most TABLE_MAX_VARS variables (PARALLEL_TABLE_MAX_VARS with several workers), sat otherwise
+AUTO_ENGINE = 'auto'
+TABLE_MAX_VARS = 20
+PARALLEL_TABLE_MAX_VARS = 30    # 2^30 rows are checked by the processes in seconds, sat is used for more
+
 
 class NamewiseSingleton(type):
 
@@ -47,23 +87,41 @@ class NamewiseSingleton(type):
         cls.__instances = {}
 
     def __call__(cls, name, *args, **kwargs):
-        if name not in cls.__instances:
+        instance = cls.__instances.get(name)
+        if instance is None:
             with cls._lock:
-                cls.__instances[name] = super().__call__(name, *args, **kwargs)
-        return cls.__instances[name]
+                instance = cls.__instances.get(name)      # it could be created while we waited for the lock
+                if instance is None:
+                    instance = cls.__instances[name] = super().__call__(name, *args, **kwargs)
+        return instance
 
 
 class Var(metaclass=NamewiseSingleton):
     """ Variable in propositional logic.
 
     Might to be True or False (1 or 0 respectively)
+
+    Each variable has the unique index, so the set of variables of formula
+    is stored as the bitmask (see Formula.vars) and the assignment could be
+    the integer where bit var.index is the value of var (see Formula.evaluate).
     """
 
+    __slots__ = ('name', '_val', 'index', 'var_mask')
+
+    operations_count = 0      # for Kalmar theorem
+    _all = []                 # all the variables by index
+
     def __init__(self, name: str):
         assert name.isidentifier()     # check name
         self.name = name
         self._val = 0
-        self.operations_count = 0      # for Kalmar theorem
+        self.index = len(Var._all)
+        self.var_mask = 1 << self.index
+        Var._all.append(self)
+
+    @property
+    def vars(self):
+        return {self}
 
     def set_val(self, value):
         assert value in (0, 1, True, False), 'bad value for variable'
@@ -72,12 +130,24 @@ class Var(metaclass=NamewiseSingleton):
     def copy(self):
         return self
 
+    def evaluate(self, assignment):
+        """ Value of variable in the given assignment (see Formula.evaluate).
+        """
+        if isinstance(assignment, dict):
+            return bool(assignment[self] if self in assignment else assignment[self.name])
+        elif isinstance(assignment, int):
+            return bool(assignment >> self.index & 1)
+        return bool(assignment[0])
+
     def __call__(self, *args, **kwargs):
         return self._val
 
     def __hash__(self):          # this is for possibility to use the set of Vars
         return hash(self.name)
 
+    def __reduce__(self):
+        return Var, (self.name,)
+
     def __str__(self):
         return self.name
 
@@ -85,15 +155,58 @@ class Var(metaclass=NamewiseSingleton):
         return f"Var('{self.name}')"
 
 
+class _ProofInfo:
+    """ Information about the proof of hash-consed formula (see Formula).
+
+    It is always default, because the hash-consed formula is shared by all the equal formulas,
+    so it could be set only on the copy().
+    """
+
+    def __init__(self, default):
+        self.default = default
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        return self.default
+
+    def __set__(self, instance, value):
+        raise AttributeError(f"can't set {self.name} of hash-consed formula {instance}, it is shared "
+                             f"by all the equal formulas: set it on the copy (f = f.copy(); f.{self.name} = ...)")
+
+
 class Formula:
     """ Formula in propositional logic
 
     Defines recursively just like math definition.
+
+    Formulas are hash-consed: structurally equal formulas are the same object
+    (a variable and the formula that is just this variable are equal as well),
+    so the equality is the identity and the hash is computed once.
+
+    Name belongs to the concrete usage of formula (the line of proof), so it's stored only
+    in the copy() (see NamedFormula) that is equal to the original formula, the other information
+    about the proof (rule and premises) is in the step of the proof (see theorems.Step).
+    Formula built from such copies is not hash-consed itself (it prints the names of its sons),
+    but it's still equal to the hash-consed one.
+
+    Everything that depends only on the structure (variables, number of operations, cached
+    results) is stored once in the hash-consed formula (see _HashConsed), so the copies and
+    the formulas built from them have only their connective, sons and hash.
     """
 
+    __slots__ = ('main_con', 'sons', '_hash', '_canon')
+
     print_name = False
+    store = None        # persistent store of results consulted by check_tautology (see store.ProofStore)
+
+    name = _ProofInfo('')       # default name (see NamedFormula)
+
+    _interned = {con: WeakValueDictionary() for con in CONNECTIONS}   # {main_con: {sons: formula}}
+    _lock = RLock()
 
-    def __init__(self, main_con, variables: set, *sons):
+    def __new__(cls, main_con, variables, *sons):
         """ Create the formula in logic of utterances with the given main connectivity,
         that have given variables and subformulas
 
@@ -101,35 +214,80 @@ class Formula:
         >>> x2 = Var('x2')
         >>> F1 = Formula(IMPLICATION, {x1, x2}, x1, x2)
         >>> F2 = F1.con(x2)
-        >>> F2
-        ((x1 -> x2) & x2)
+        >>> print(F2)
+        ((x1->x2)&x2)
+        >>> F2 is Formula(IMPLICATION, {x1, x2}, x1, x2).con(x2)
+        True
+        >>> Formula(PASS, None, x1) == x1, x1 in {Formula(PASS, None, x1)}
+        (True, True)
 
         :param main_con: main connectivity (binary or unary)
-        :param variables: set of Vars
+        :param variables: set of Vars (it is always the union of sons' variables,
+                          so it's computed from sons and this argument is just checked)
         :param sons: subformulas that are connected by main_con
         """
         assert main_con in CONNECTIONS, 'bad connection'
-        assert all(isinstance(var, Var) for var in variables)
 
+        if main_con == PASS and isinstance(sons[0], Var):
+            key = sons
+            hash_value = hash(sons[0])          # it is equal to the variable, so it has the same hash
+        else:
+            key = tuple(son._canon if isinstance(son, Formula) else Formula(PASS, None, son) for son in sons)
+            hash_value = hash((main_con, key))
+        interned = cls._interned[main_con]
+        canon = interned.get(key)
+        if canon is None:
+            with cls._lock:
+                canon = interned.get(key)
+                if canon is None:
+                    canon = object.__new__(_HashConsed)
+                    canon._init(main_con, key, hash_value, None)       # the key is the tuple of sons
+                    assert variables is None or canon.vars == set(variables), 'bad variables'
+                    interned[key] = canon
+
+        if cls is Formula and all(isinstance(son, Var) or son._canon is son for son in sons):
+            return canon
+        # some of sons are copies with own names, so the result should print them
+        res = object.__new__(cls)
+        res._init(main_con, sons, canon._hash, canon)
+        return res
+
+    def _init(self, main_con, sons, hash_value, canon):
         self.main_con = main_con
         self.sons = sons
-        self.vars = variables
-        self._is_tautology = None
-        self.is_axiom = False        # it is True if we created this formula from scheme of axioms
-        self.name = ''               # for norm output
+        self._hash = hash_value
+        self._canon = canon          # hash-consed formula
+
+    @property
+    def var_mask(self) -> int:
+        """ Bitmask of the variables of the formula (k-th bit is the variable with index k).
+        """
+        return self._canon._var_mask
+
+    @property
+    def operations_count(self) -> int:
+        """ Number of the connectives in the formula (for Kalmar theorem).
+        """
+        return self._canon._operations_count
 
-        self.by_modus_pones = False
-        self.from_modus_pones = ()
-        self.operations_count = sum(son.operations_count for son in self.sons)   # for Kalmar theorem
-        if main_con != PASS:
-            self.operations_count += 1
+    @property
+    def vars(self):
+        """ Set of variables of the formula (built from the bitmask).
+        """
+        result = set()
+        mask = self.var_mask
+        while mask:
+            low = mask & -mask
+            result.add(Var._all[low.bit_length() - 1])
+            mask ^= low
+        return result
 
     def neg(self):
         """ !self
 
         :return: Formula
         """
-        return Formula(NOT, self.vars, self)
+        return Formula(NOT, None, self)
 
     def _binary(self, other, operation_type):
         """ Binary operation between 2 formulas
@@ -140,10 +298,7 @@ class Formula:
         """
         assert isinstance(other, Formula) or isinstance(other, Var), 'bad component'
 
-        if isinstance(other, Formula):
-            return Formula(operation_type, self.vars | other.vars, self, other)
-        else:
-            return Formula(operation_type, self.vars | {other}, self, other)
+        return Formula(operation_type, None, self, other)
 
     def implication(self, other):
         """ self -> other
@@ -170,55 +325,248 @@ class Formula:
         """
         return self._binary(other, EQUIV)
 
-    def check_tautology(self):
-        """ Check if this formula is tautology using full permute.
+    def compile(self, bitwise=False):
+        """ Compile formula into the flat python function.
+
+        Each subformula becomes one assignment to the local variable, so the
+        result is the straight-line code without recursion and lookups in FUNCTIONS:
+
+        >>> x1 = Var('x1')
+        >>> x2 = Var('x2')
+        >>> F = Formula(IMPLICATION, {x1, x2}, x1, x2)
+        >>> variables, function = F.compile()
+        >>> function(True, False)
+        False
+
+        If bitwise is True, function takes the mask of rows as the first argument
+        and integers-columns of truth table instead of bools (see TruthTable):
+
+        >>> variables, function = F.compile(bitwise=True)
+        >>> bin(function(0b1111, 0b1010, 0b1100))
+        '0b1101'
+
+        Result is cached in the formula.
+
+        :param bitwise: if True then compile for the bit-parallel evaluation
+        :return: tuple of Vars (order of arguments), function of len(variables) arguments
+        """
+        canon = self._canon
+        if canon._compiled is None:
+            canon._compiled = {}
+        if bitwise not in canon._compiled:
+            templates = BITWISE_EXPRESSIONS if bitwise else EXPRESSIONS
+            variables = tuple(sorted(canon.vars, key=lambda var: var.name))
+            names = {var: f'x{i}' for i, var in enumerate(variables)}
+            lines = []
+            stack = [(canon, False)]       # (node, sons are already compiled)
+            while stack:                   # iterative post-order traversal
+                node, ready = stack.pop()
+                if isinstance(node, Var) or id(node) in names:
+                    continue
+                if ready:
+                    if node.main_con == PASS:
+                        names[id(node)] = names[node.sons[0]] if isinstance(node.sons[0], Var) \
+                            else names[id(node.sons[0])]
+                        continue
+                    args = [names[son] if isinstance(son, Var) else names[id(son)] for son in node.sons]
+                    names[id(node)] = f't{len(lines)}'
+                    lines.append(f'    t{len(lines)} = ' + templates[node.main_con].format(*args))
+                else:
+                    stack.append((node, True))
+                    stack.extend((son, False) for son in reversed(node.sons))
+
+            args = [names[var] for var in variables]
+            if bitwise:
+                args.insert(0, 'm')
+            source = 'def _compiled({}):\n{}\n    return {}\n'.format(', '.join(args), '\n'.join(lines),
+                                                                      names[id(canon)])
+            canon._compiled[bitwise] = variables, _load_source(source)
+        return canon._compiled[bitwise]
+
+    def compiled_source(self, bitwise=False):
+        """ Source code of the compiled formula (see compile()).
+
+        Unlike the function it could be pickled and sent to the other process.
+
+        :return: string
+        """
+        return self.compile(bitwise)[1].source
+
+    def truth_table(self, chunk_bits=CHUNK_BITS, incremental=False):
+        """ Bit-parallel truth table of the formula (see TruthTable).
+
+        :param chunk_bits: log2 of the number of rows in one block
+        :param incremental: if True then blocks are computed incrementally (see GrayCodeTable)
+        :return: TruthTable
+        """
+        if incremental:
+            return GrayCodeTable(self, chunk_bits)
+        return TruthTable(self, chunk_bits)
+
+    def check_tautology(self, workers=None, engine=AUTO_ENGINE, decompose=True):
+        """ Check if this formula is tautology.
+
+        By default (for not so many variables) it uses full permute: rows of the
+        truth table are computed by blocks with bitwise operations (see truth_table()).
+        With workers > 1 the blocks are checked by the processes, and AUTO_ENGINE uses
+        the table up to PARALLEL_TABLE_MAX_VARS variables instead of TABLE_MAX_VARS.
+        Only the table engines use the processes. The trade-off: formulas with more than
+        PARALLEL_TABLE_MAX_VARS variables are too big for any table, so AUTO_ENGINE checks them
+        by the SAT solver in this process and ignores workers (RuntimeWarning is issued),
+        the same as SAT_ENGINE and BDD_ENGINE do for any formula.
+
+        :param workers: number of processes for the table engines, by default all the rows
+                        are checked in this process
+        :param engine: TABLE_ENGINE, GRAY_ENGINE, SAT_ENGINE, BDD_ENGINE or AUTO_ENGINE
+        :param decompose: if True then independent parts of formula are checked separately
+                          (see decomposition.py)
+        :return: bool
+        """
+        canon = self._canon                 # result is shared by all the copies of formula
+        if canon._is_tautology is None and Formula.store is not None:
+            canon._is_tautology = Formula.store.check_tautology(self, workers, engine, decompose)
+        elif canon._is_tautology is None:   # if we haven't already check
+            canon._is_tautology = self.find_counterexample(workers, engine, decompose) is None
+        return canon._is_tautology
+
+    def find_counterexample(self, workers=None, engine=AUTO_ENGINE, decompose=True):
+        """ Find assignment for which formula is False.
+
+        :param workers: number of processes for the table engines (see TruthTable.counterexample),
+                        SAT and BDD check formula in this process (see check_tautology)
+        :param engine: TABLE_ENGINE, GRAY_ENGINE, SAT_ENGINE, BDD_ENGINE or AUTO_ENGINE (see check_tautology)
+        :param decompose: if True then independent parts of formula are checked separately
+        :return: {Var: bool} or None if formula is tautology
+        """
+        assert engine in (TABLE_ENGINE, GRAY_ENGINE, SAT_ENGINE, BDD_ENGINE, AUTO_ENGINE), 'bad engine'
+        if decompose:
+            from .decomposition import decomposed_counterexample
+            return decomposed_counterexample(self, workers, engine)
+        parallel = workers is not None and workers > 1
+        if engine == AUTO_ENGINE and len(self.vars) > (PARALLEL_TABLE_MAX_VARS if parallel else TABLE_MAX_VARS):
+            engine = SAT_ENGINE
+        if parallel and engine in (SAT_ENGINE, BDD_ENGINE):
+            warn(f'workers are ignored by {engine} engine (formula with {len(self.vars)} variables)',
+                 RuntimeWarning, stacklevel=2)
+        if engine == BDD_ENGINE:
+            from .bdd import bdd_counterexample
+            return bdd_counterexample(self)
+        if engine == SAT_ENGINE:
+            from .sat import sat_counterexample
+            return sat_counterexample(self)
+        incremental = engine == GRAY_ENGINE or \
+            engine == AUTO_ENGINE and len(self.vars) > CHUNK_BITS and not parallel
+        return self.truth_table(incremental=incremental).counterexample(workers)
+
+    def check_satisfiable(self, workers=None, engine=AUTO_ENGINE, decompose=True):
+        """ Check if there is assignment for which formula is True (its negation isn't tautology).
+
+        :param workers: number of processes (see check_tautology)
+        :param engine: TABLE_ENGINE, GRAY_ENGINE, SAT_ENGINE, BDD_ENGINE or AUTO_ENGINE (see check_tautology)
+        :param decompose: if True then independent parts of formula are checked separately
+        :return: bool
+        """
+        return self.neg().find_counterexample(workers, engine, decompose) is not None
+
+    def count_models(self, weights=None, engine=AUTO_ENGINE):
+        """ Number of assignments for which formula is True (or their total weight).
+
+        >>> x1 = Var('x1')
+        >>> x2 = Var('x2')
+        >>> F = Formula(IMPLICATION, {x1, x2}, x1, x2)
+        >>> F.count_models(), F.count_models({x1: 0.5, x2: 0.5})
+        (3, 0.75)
+
+        :param weights: {Var: (weight of False, weight of True)} or {Var: probability of True},
+                        the other variables have weights (1, 1)
+        :param engine: TABLE_ENGINE, BDD_ENGINE, SAT_ENGINE or AUTO_ENGINE (see counting.py)
+        :return: int (without weights) or the sum of weights
+        """
+        from .counting import count_models
+        return count_models(self, weights, engine)
+
+    def evaluate(self, assignment):
+        """ Compute value of formula for the given assignment.
 
+        Unlike __call__ it doesn't use values of Vars, so it can be
+        used from the different threads at the same time.
+
+        >>> x1 = Var('x1')
+        >>> x2 = Var('x2')
+        >>> F = Formula(IMPLICATION, {x1, x2}, x1, x2)
+        >>> F.evaluate({x1: True, x2: False}), F.evaluate({'x1': False, 'x2': False})
+        (False, True)
+        >>> F.evaluate((True, True)), F.evaluate(x1.var_mask)
+        (True, False)
+
+        :param assignment: dictionary {Var or name of variable: value},
+                           tuple of values in the order of variables of compile()
+                           or bitmask (bit var.index is the value of var, just like in var_mask)
         :return: bool
         """
-        if self._is_tautology is None:      # if we haven't already check
-            success = True
-            for el in product([True, False], repeat=len(self.vars)):
-                tmp = list(self.vars)
-                for var, val in zip(tmp, el):    # set value for each variable
-                    var.set_val(val)
-                if not self.__call__():        # compute value of formula
-                    success = False
-                    break
-            self._is_tautology = success
-        return self._is_tautology
-
-    def pow_alpha(self):
-        if self.__call__():
+        variables, function = self.compile()
+        if isinstance(assignment, (dict, int)):
+            values = [var.evaluate(assignment) for var in variables]
+        else:
+            assert len(assignment) == len(variables), 'bad assignment'
+            values = map(bool, assignment)
+        return function(*values)
+
+    def pow_alpha(self, assignment=None):
+        """ self if it is True else !self.
+
+        :param assignment: see evaluate(), by default values of Vars are used
+        :return: Formula
+        """
+        value = self() if assignment is None else self.evaluate(assignment)
+        if value:
             return self
         else:
             return self.neg()
 
     def copy(self):
-        return Formula(self.main_con, self.vars, *self.sons)
+        """ New object for the same formula (equal to self) with its own name and proof's information.
+
+        :return: NamedFormula
+        """
+        res = object.__new__(NamedFormula)
+        res._init(self.main_con, self.sons, self._hash, self._canon)
+        return res
 
     def print_form(self):
         """ Print formula's representation
+
+        Sons are printed by str() (so if Formula.print_name == True, named sons are printed
+        by their names). String is built by one pass without recursion.
         """
-        if self.main_con in BINARY:
-            return LEFT_PAR + str(self.sons[0]) + self.main_con + str(self.sons[1]) + RIGHT_PAR
-        elif self.main_con != PASS:
-            return LEFT_PAR + self.main_con + str(self.sons[0]) + RIGHT_PAR
-        else:
-            return str(self.sons[0])
+        parts = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if not isinstance(node, Formula) or (node is not self and Formula.print_name and node.name):
+                parts.append(node if isinstance(node, str) else str(node))
+            elif node is not self and node._canon is node and self._canon is not self:
+                parts.append(_canonical_form(node))      # hash-consed formulas don't have names inside
+            elif node.main_con in BINARY:
+                stack += [RIGHT_PAR, node.sons[1], node.main_con, node.sons[0], LEFT_PAR]
+            elif node.main_con != PASS:
+                stack += [RIGHT_PAR, node.sons[0], node.main_con, LEFT_PAR]
+            else:
+                stack.append(node.sons[0])
+        return ''.join(parts)
 
     def __eq__(self, other):
-        success = True
         if isinstance(other, Var):
-            other = Formula(PASS, {other, }, other)
+            other = Formula(PASS, None, other)
+        if not isinstance(other, Formula):
+            return NotImplemented
+        return self._canon is other._canon
 
-        if len(self.sons) != len(other.sons) or self.main_con != other.main_con:
-            success = False
+    def __hash__(self):
+        return self._hash
 
-        for el1, el2 in zip(self.sons, other.sons):
-            if el1 != el2:
-                success = False
-                break
-        return success
+    def __reduce__(self):
+        return Formula, (self.main_con, None) + self.sons
 
     def __call__(self, *args, **kwargs):
         """ Recursively compute value of formula.
@@ -232,6 +580,8 @@ class Formula:
         """
         if Formula.print_name and self.name:
             return self.name
+        elif self._canon is self:
+            return _canonical_form(self)
         else:
             return self.print_form()
 
@@ -239,6 +589,338 @@ class Formula:
         return f'Formula({self.main_con}, {self.vars}, {self.sons})'
 
 
+class _HashConsed(Formula):
+    """ The only object of the structurally equal formulas (see Formula.__new__).
+    """
+
+    __slots__ = ('_var_mask', '_operations_count', '_is_tautology', '_compiled', '_text', '_signs', '__weakref__')
+
+    def _init(self, main_con, sons, hash_value, canon):
+        super()._init(main_con, sons, hash_value, self)
+        self._var_mask = 0
+        self._operations_count = 0 if main_con == PASS else 1
+        for son in sons:
+            self._var_mask |= son.var_mask
+            self._operations_count += son.operations_count
+        self._is_tautology = None
+        self._compiled = None        # {bitwise: (variables, function)} (see compile)
+        self._text = None            # print_form() (see _canonical_form)
+        self._signs = None           # masks of variables with positive and negative occurrences (see decomposition.py)
+
+
+class NamedFormula(Formula):
+    """ Copy of formula with the name of its line in the proof.
+    """
+
+    __slots__ = ('name', '__weakref__')
+
+    def _init(self, main_con, sons, hash_value, canon):
+        super()._init(main_con, sons, hash_value, canon)
+        self.name = ''               # for norm output
+
+
+class TruthTable:
+    """ Truth table of formula where each column is a python integer.
+
+    Row r assigns to the k-th variable (in order of Formula.compile()) the value
+    of the k-th bit of r, so the value of formula on row r is the r-th bit of the column.
+    Rows are computed by blocks of 2^chunk_bits, each block is just one call of
+    the bitwise compiled formula, so the memory doesn't depend on the number of variables.
+    """
+
+    def __init__(self, formula: Formula, chunk_bits=CHUNK_BITS, compiled=None):
+        """
+        :param formula: Formula
+        :param chunk_bits: log2 of the number of rows in one block
+        :param compiled: (variables, function) to use instead of formula.compile(bitwise=True)
+        """
+        self.formula = formula
+        self.chunk_bits = chunk_bits
+        self.variables, self._function = formula.compile(bitwise=True) if compiled is None else compiled
+        self.rows = 1 << len(self.variables)
+
+        self._low = min(len(self.variables), chunk_bits)    # variables that change inside the block
+        self._size = 1 << self._low                          # rows in one block
+        self._mask = (1 << self._size) - 1
+
+        self._columns = []           # columns of low variables - the same for each block
+        for k in range(self._low):
+            width = 1 << k
+            column = ((1 << width) - 1) << width            # 2^k zeros, then 2^k ones
+            period = 2 * width
+            while period < self._size:                      # repeat it for the whole block
+                column |= column << period
+                period *= 2
+            self._columns.append(column)
+
+    def chunks(self, start=0, stop=None):
+        """ Compute blocks of the truth table.
+
+        :param start: index of the first block
+        :param stop: index of the block after the last one (by default - all the blocks)
+        :return: generator of (first row of the block, integer with values of rows in the block)
+        """
+        if stop is None:
+            stop = self.rows // self._size
+        high = len(self.variables) - self._low
+        for block in range(start, stop):
+            columns = self._columns + [self._mask if block >> k & 1 else 0 for k in range(high)]
+            yield block * self._size, self._function(self._mask, *columns) & self._mask
+
+    def assignment(self, row: int) -> dict:
+        """ Values of variables for the given row.
+
+        :return: {Var: bool}
+        """
+        return {var: bool(row >> k & 1) for k, var in enumerate(self.variables)}
+
+    def is_tautology(self):
+        return all(bits == self._mask for _, bits in self.chunks())
+
+    def is_satisfiable(self):
+        return any(bits for _, bits in self.chunks())
+
+    def counterexample(self, workers=None):
+        """ The first assignment for which formula is False.
+
+        If workers > 1 the blocks are split into the ranges (each range is the
+        fixed values of the last variables) which are checked in ProcessPoolExecutor.
+        Processes get the source of compiled formula and all of them stop as soon
+        as any finds the falsifying row, so the result is any assignment for which formula
+        is False, not necessarily the first.
+
+        :param workers: number of processes
+        :return: {Var: bool} or None if formula is tautology
+        """
+        blocks = self.rows // self._size
+        if workers is None or workers < 2 or blocks < 2:
+            row = _find_false_row(self, 0, blocks)
+        else:
+            row = self._parallel_find_false_row(workers, blocks)
+        return None if row is None else self.assignment(row)
+
+    def _parallel_find_false_row(self, workers, blocks):
+        source = self._function.source
+        shards = min(blocks, workers * SHARDS_PER_WORKER)
+        bounds = [blocks * i // shards for i in range(shards + 1)]
+
+        stop_event = Event()
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(stop_event,)) as executor:
+            pending = {executor.submit(_find_false_row_in_shard, source, len(self.variables), self.chunk_bits,
+                                       start, stop)
+                       for start, stop in zip(bounds, bounds[1:])}
+            row = None
+            while pending and row is None:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.result() is not None:
+                        row = future.result()
+                        break
+            stop_event.set()             # stop all the working processes
+            for future in pending:
+                future.cancel()
+        return row
+
+    def model(self):
+        """ The first assignment for which formula is True.
+
+        :return: {Var: bool} or None if formula is unsatisfiable
+        """
+        for row, bits in self.chunks():
+            if bits:
+                return self.assignment(row + _lowest_bit(bits))
+        return None
+
+    def count_models(self):
+        """ Number of assignments for which formula is True.
+        """
+        return sum(bin(bits).count('1') for _, bits in self.chunks())
+
+    def __iter__(self):
+        """ Values of formula row by row.
+        """
+        for _, bits in self.chunks():
+            for i in range(self._size):
+                yield bool(bits >> i & 1)
+
+    def __len__(self):
+        return self.rows
+
+
+class GrayCodeTable(TruthTable):
+    """ Truth table whose blocks are computed incrementally.
+
+    Blocks go in the order of Gray code of the high variables (that don't change inside
+    the block), so only one variable flips between the neighbouring blocks. Columns of all
+    the hash-consed subformulas are kept, and after the flip only the subformulas
+    that contain this variable are recomputed (by the straight-line code compiled for each
+    variable, just like in Formula.compile), so for the formulas with localized variables
+    the work for the block is the size of the affected part instead of the whole formula.
+    Variables with the biggest affected parts change inside the block, so the order of
+    variables (and rows) differs from Formula.compile and the table is computed in one process.
+
+    >>> x = [Var(f'x{i}') for i in range(3)]
+    >>> F = Formula(IMPLICATION, None, Formula(AND, None, x[0], x[1]), x[2])
+    >>> table = GrayCodeTable(F, chunk_bits=1)
+    >>> [(row, bin(bits)) for row, bits in table.chunks()]
+    [(0, '0b11'), (2, '0b1'), (6, '0b11'), (4, '0b11')]
+    """
+
+    def __init__(self, formula: Formula, chunk_bits=CHUNK_BITS):
+        super().__init__(formula, chunk_bits)
+
+        indexes = {}            # {id(subformula): index of its column}
+        parents = []            # parents[i] - indexes of formulas that have the i-th as son
+        lines = []              # lines[i] - code that computes the i-th column
+        self._nodes = []        # (index, function, indexes of sons) in the post-order
+        stack = [(formula._canon, False)]
+        while stack:                   # iterative post-order traversal
+            node, ready = stack.pop()
+            if id(node) in indexes:
+                continue
+            if isinstance(node, Var):
+                indexes[id(node)] = len(lines)
+                lines.append(None)
+                parents.append([])
+            elif node.main_con == PASS and ready:
+                indexes[id(node)] = indexes[id(node.sons[0])]
+            elif ready:
+                sons = [indexes[id(son)] for son in node.sons]
+                indexes[id(node)] = len(lines)
+                for son in sons:
+                    parents[son].append(len(lines))
+                self._nodes.append((len(lines), BITWISE_FUNCTIONS[node.main_con], sons))
+                lines.append(f'    v[{len(lines)}] = ' +
+                             BITWISE_EXPRESSIONS[node.main_con].format(*(f'v[{son}]' for son in sons)))
+                parents.append([])
+            else:
+                stack.append((node, True))
+                stack.extend((son, False) for son in reversed(node.sons))
+
+        affected = {}           # {Var: indexes of the formulas that contain it}
+        for var in self.variables:
+            affected[var] = set()
+            stack = [indexes[id(var)]]
+            while stack:
+                for parent in parents[stack.pop()]:
+                    if parent not in affected[var]:
+                        affected[var].add(parent)
+                        stack.append(parent)
+        self.variables = tuple(sorted(self.variables, key=lambda var: (-len(affected[var]), var.name)))
+
+        self._root = indexes[id(formula._canon)]
+        self._leaves = [indexes[id(var)] for var in self.variables]
+        self._values = [0] * len(lines)
+        for k in range(self._low):
+            self._values[self._leaves[k]] = self._columns[k]
+        # function for each high variable that recomputes its ancestors
+        self._updates = [_load_source(self._update_source(sorted(affected[var]), lines))
+                         for var in self.variables[self._low:]]
+
+    @staticmethod
+    def _update_source(indexes, lines):
+        return 'def _compiled(v, m):\n{}\n'.format('\n'.join(lines[i] for i in indexes) or '    pass')
+
+    def chunks(self, start=0, stop=None):
+        """ Compute blocks of the truth table in the order of Gray code.
+
+        :param start: position of the first block in this order
+        :param stop: position of the block after the last one (by default - all the blocks)
+        :return: generator of (first row of the block, integer with values of rows in the block)
+        """
+        if stop is None:
+            stop = self.rows // self._size
+        values = self._values
+        high = self._leaves[self._low:]
+        for position in range(start, stop):
+            block = position ^ (position >> 1)
+            if position == start:
+                for k, leaf in enumerate(high):
+                    values[leaf] = self._mask if block >> k & 1 else 0
+                for i, function, sons in self._nodes:          # all the columns
+                    values[i] = function(self._mask, *(values[son] for son in sons))
+            else:
+                k = _lowest_bit(position)          # the variable that flips
+                values[high[k]] ^= self._mask
+                self._updates[k](values, self._mask)
+            yield block * self._size, values[self._root] & self._mask
+
+    def counterexample(self, workers=None):
+        """ The first assignment in the order of chunks() for which formula is False
+        (workers are ignored, see above).
+
+        :return: {Var: bool} or None if formula is tautology
+        """
+        return super().counterexample()
+
+    def __iter__(self):
+        """ Values of formula row by row (each block is computed from scratch).
+        """
+        for block in range(self.rows // self._size):
+            position = block
+            shift = 1
+            while block >> shift:                   # inverse of Gray code
+                position ^= block >> shift
+                shift += 1
+            for _, bits in self.chunks(position, position + 1):
+                for i in range(self._size):
+                    yield bool(bits >> i & 1)
+
+
+def _canonical_form(f: Formula):
+    """ print_form() of the hash-consed formula (it's computed once and kept in the formula,
+    so it's removed together with it).
+    """
+    if f._text is None:
+        f._text = f.print_form()
+    return f._text
+
+
+def _lowest_bit(bits):
+    return (bits & -bits).bit_length() - 1
+
+
+@lru_cache(maxsize=32)
+def _load_source(source):
+    """ Create the function from the source of compiled formula.
+    """
+    namespace = {}
+    exec(source, namespace)
+    function = namespace['_compiled']
+    function.source = source
+    return function
+
+
+def _find_false_row(table: TruthTable, start, stop, stop_event=None):
+    """ Index of the first row in the given blocks for which formula is False.
+    """
+    for row, bits in table.chunks(start, stop):
+        if bits != table._mask:
+            return row + _lowest_bit(~bits & table._mask)
+        if stop_event is not None and stop_event.is_set():
+            break
+    return None
+
+
+_stop_event = None      # event of the pool in the working process (see TruthTable.counterexample)
+
+
+def _init_worker(stop_event):
+    global _stop_event
+    _stop_event = stop_event
+
+
+def _find_false_row_in_shard(source, variables_count, chunk_bits, start, stop):
+    """ The same as _find_false_row in the working process.
+    """
+    function = _load_source(source)
+    table = TruthTable(None, chunk_bits, compiled=(tuple(range(variables_count)), function))
+    row = _find_false_row(table, start, stop, _stop_event)
+    if row is not None:
+        _stop_event.set()
+    return row
+
+
 if __name__ == '__main__':
     x1 = Var('x1')
     x2 = Var('x2')
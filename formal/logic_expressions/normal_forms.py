@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+# -*-encoding: utf-8-*-
+
+""" Simplification and normal forms of formulas.
+
+All the transformations go through the subformulas from the leaves without recursion
+and each hash-consed subformula is transformed once (results are memoized), so the
+shared parts of formula cost nothing.
+
+    eliminate   - only !, & and | (or only ! and ->) are left
+    nnf         - negation normal form: ! only before variables
+    simplify    - NNF with constant folding, idempotence, complementary literals and absorption
+    cnf, dnf    - sets of clauses (terms) by distribution
+    tseitin_cnf - equisatisfiable clauses with the new variables (for the big CNF)
+    anf         - algebraic normal form (Zhegalkin polynomial): XOR of conjunctions
+
+CNF and DNF are lists of clauses of non-zero integers, k-th variable is k and its negation is -k
+(just like in sat.py).
+"""
+
+from .formulas import *
+from .sat import tseitin
+
+BASIS_AND_OR = 'and-or'             # !, &, |
+BASIS_IMPLICATION = 'implication'   # !, -> (the one of the axioms and adequacy_theorem)
+
+CNF_MAX_CLAUSES = 1 << 12
+DNF_MAX_TERMS = 1 << 12
+ANF_MAX_MONOMIALS = 1 << 12
+
+
+class ErrorNormalForm(Exception):
+    pass
+
+
+def _formula(x):
+    return Formula(PASS, None, x) if isinstance(x, Var) else x
+
+
+def _transform(f, combine):
+    """ Apply combine(subformula, results for its sons) to all the subformulas of f from the leaves.
+
+    PASS nodes are skipped, results are memoized by the hash-consed subformulas.
+    """
+    results = {}
+    stack = [(f, False)]
+    while stack:                   # iterative post-order traversal
+        node, ready = stack.pop()
+        if isinstance(node, Formula) and node.main_con == PASS:
+            stack.append((node.sons[0], ready))
+            if ready:
+                stack.pop()
+                results[node._canon] = results[node.sons[0] if isinstance(node.sons[0], Var)
+                                               else node.sons[0]._canon]
+            else:
+                stack[-1:] = [(node, True), (node.sons[0], False)]
+            continue
+        key = node if isinstance(node, Var) else node._canon
+        if key in results:
+            continue
+        if isinstance(node, Var):
+            results[key] = combine(node, ())
+        elif ready:
+            results[key] = combine(node, [results[son if isinstance(son, Var) else son._canon]
+                                          for son in node.sons])
+        else:
+            stack.append((node, True))
+            stack.extend((son, False) for son in reversed(node.sons))
+    return results[f if isinstance(f, Var) else f._canon]
+
+
+def eliminate(f, basis=BASIS_AND_OR) -> Formula:
+    """ Equivalent formula with the connectives only from the basis.
+
+    >>> a, b = Var('a'), Var('b')
+    >>> eliminate(Formula(EQUIV, None, a, b)).print_form()
+    '((a&b)|((!a)&(!b)))'
+    >>> eliminate(Formula(OR, None, a, b), BASIS_IMPLICATION).print_form()
+    '((!a)->b)'
+
+    :param f: Formula
+    :param basis: BASIS_AND_OR or BASIS_IMPLICATION
+    """
+    assert basis in (BASIS_AND_OR, BASIS_IMPLICATION), 'bad basis'
+    and_or = basis == BASIS_AND_OR
+
+    def combine(node, sons):
+        if isinstance(node, Var):
+            return _formula(node)
+        if node.main_con == NOT:
+            return sons[0].neg()
+        a, b = sons
+        if node.main_con == AND:
+            return a.con(b) if and_or else a.implication(b.neg()).neg()
+        if node.main_con == OR:
+            return a.dis(b) if and_or else a.neg().implication(b)
+        if node.main_con == IMPLICATION:
+            return a.neg().dis(b) if and_or else a.implication(b)
+        if and_or:
+            same, different = a.con(b).dis(a.neg().con(b.neg())), a.con(b.neg()).dis(a.neg().con(b))
+        else:
+            same = a.implication(b).implication(b.implication(a).neg()).neg()
+            different = same.neg()
+        return same if node.main_con == EQUIV else different
+
+    return _transform(f, combine)
+
+
+def nnf(f) -> Formula:
+    """ Negation normal form: formula with &, | and negations only before variables.
+
+    >>> a, b = Var('a'), Var('b')
+    >>> nnf(Formula(NOT, None, Formula(IMPLICATION, None, a, b))).print_form()
+    '(a&(!b))'
+
+    :param f: Formula
+    """
+    f = eliminate(f)
+    results = {}              # {(hash-consed subformula, it is under negation): result}
+    stack = [(f._canon, False, False)]
+    while stack:
+        node, negated, ready = stack.pop()
+        if (node, negated) in results:
+            continue
+        if node.main_con == PASS:
+            results[node, negated] = node.neg() if negated else node
+        elif node.main_con == NOT:
+            son = _formula(node.sons[0])._canon
+            if (son, not negated) in results:
+                results[node, negated] = results[son, not negated]
+            else:
+                stack += [(node, negated, True), (son, not negated, False)]
+        elif ready:
+            a, b = (results[_formula(son)._canon, negated] for son in node.sons)
+            results[node, negated] = a.dis(b) if (node.main_con == AND) == negated else a.con(b)
+        else:
+            stack.append((node, negated, True))
+            stack.extend((_formula(son)._canon, negated, False) for son in node.sons)
+    return results[f._canon, False]
+
+
+# ------------------------------------------------simplification---------------------------------------------------
+# Simplified formula is True, False, literal (Var, value) or (AND or OR, frozenset of simplified formulas).
+
+def _is_literal(x):
+    return isinstance(x, tuple) and isinstance(x[0], Var)
+
+
+def _junction(operation, items):
+    """ Simplified conjunction (disjunction) of the simplified formulas.
+    """
+    unit = operation == AND          # neutral constant
+    result = set()
+    for item in items:
+        if item is unit:
+            continue
+        if item is (not unit):
+            return not unit
+        if isinstance(item, tuple) and item[0] == operation:     # (a & b) & c = a & b & c
+            result |= item[1]
+        else:
+            result.add(item)
+
+    if any(_is_literal(x) and (x[0], not x[1]) in result for x in result):     # a & !a = False
+        return not unit
+
+    dual = [x for x in result if isinstance(x, tuple) and not _is_literal(x)]
+    for x in dual:                     # absorption: a & (a | b) = a
+        if any(y is not x and (y in x[1] or y in dual and y[1] < x[1]) for y in result):
+            result.discard(x)
+
+    if not result:
+        return unit
+    if len(result) == 1:
+        return result.pop()
+    return operation, frozenset(result)
+
+
+def _simplified(f):
+    def combine(node, sons):
+        if isinstance(node, Var):
+            return node, True
+        if node.main_con == NOT:
+            var = _formula(node.sons[0]).sons[0]
+            return var, False
+        return _junction(node.main_con, sons)
+
+    return _transform(nnf(f), combine)
+
+
+def _from_simplified(x, variables):
+    """ Formula from the simplified one (variables are used for constants).
+    """
+    var = min(variables, key=lambda v: v.name)
+    if x is True:
+        return _formula(var).dis(_formula(var).neg())
+    if x is False:
+        return _formula(var).con(_formula(var).neg())
+
+    results = {}
+    stack = [(x, False)]
+    while stack:
+        node, ready = stack.pop()
+        if node in results:
+            continue
+        if _is_literal(node):
+            results[node] = _formula(node[0]) if node[1] else _formula(node[0]).neg()
+        elif ready:
+            sons = sorted((results[son] for son in node[1]), key=str)
+            res = sons[0]
+            for son in sons[1:]:
+                res = res.con(son) if node[0] == AND else res.dis(son)
+            results[node] = res
+        else:
+            stack.append((node, True))
+            stack.extend((son, False) for son in node[1])
+    return results[x]
+
+
+def simplify(f) -> Formula:
+    """ Simplified equivalent formula in NNF.
+
+    Constants are folded, repeated and complementary parts are removed and the absorbed
+    parts (a in a & (a | b)) as well, so checking of the result is faster. It isn't
+    the minimal formula: variables that don't affect the value might stay in the result
+    (if the formula is simplified to constant, the result is (a | !a) or (a & !a) for
+    its first variable).
+
+    >>> a, b, c = Var('a'), Var('b'), Var('c')
+    >>> simplify(Formula(AND, None, a, Formula(OR, None, a, Formula(IMPLICATION, None, b, c)))).print_form()
+    'a'
+    >>> simplify(Formula(OR, None, Formula(AND, None, b, c), Formula(IMPLICATION, None, a, a))).print_form()
+    '(a|(!a))'
+
+    :param f: Formula
+    """
+    return _from_simplified(_simplified(f), f.vars)
+
+
+# ------------------------------------------------CNF and DNF------------------------------------------------------
+
+def _variables(f) -> dict:
+    return {var: i for i, var in enumerate(sorted(f.vars, key=lambda var: var.name), 1)}
+
+
+def _remove_subsumed(clauses):
+    """ Clauses without the ones that contain another clause.
+    """
+    result = []
+    for clause in sorted(set(clauses), key=len):
+        if not any(other <= clause for other in result):
+            result.append(clause)
+    return result
+
+
+def _clauses(x, variables, inner, limit):
+    """ Clauses of the simplified formula (conjunctions of disjunctions if inner is OR) by distribution.
+
+    :return: list of frozensets of literals or None if there are more than limit of them
+    """
+    outer = AND if inner == OR else OR
+    results = {}
+    stack = [(x, False)]
+    while stack:
+        node, ready = stack.pop()
+        if node in results:
+            continue
+        if node is True or node is False:
+            results[node] = [] if node == (outer == AND) else [frozenset()]
+        elif _is_literal(node):
+            var, value = node
+            results[node] = [frozenset([variables[var] if value else -variables[var]])]
+        elif not ready:
+            stack.append((node, True))
+            stack.extend((son, False) for son in node[1])
+            continue
+        elif node[0] == outer:
+            results[node] = _remove_subsumed(clause for son in node[1] for clause in results[son])
+        else:
+            product = [frozenset()]
+            for son in node[1]:           # distribution: (a & b) | c = (a | c) & (b | c)
+                product = [clause | other for clause in product for other in results[son]]
+                product = _remove_subsumed(clause for clause in product
+                                           if not any(-lit in clause for lit in clause))
+                if len(product) > limit:
+                    return None
+            results[node] = product
+        if len(results[node]) > limit:
+            return None
+    return sorted((sorted(clause, key=abs) for clause in results[x]), key=lambda clause: (len(clause), clause))
+
+
+def cnf(f, max_clauses=CNF_MAX_CLAUSES) -> tuple:
+    """ Conjunctive normal form of the formula.
+
+    Clauses are built by distribution from the simplified formula (if there are too many
+    of them, use tseitin_cnf).
+
+    >>> a, b, c = Var('a'), Var('b'), Var('c')
+    >>> cnf(Formula(OR, None, a, Formula(AND, None, b, c)))
+    ([[1, 2], [1, 3]], {Var('a'): 1, Var('b'): 2, Var('c'): 3})
+
+    :param f: Formula
+    :param max_clauses: maximal number of clauses
+    :return: list of clauses (lists of literals), dictionary {Var: index of variable}
+    """
+    variables = _variables(f)
+    clauses = _clauses(_simplified(f), variables, OR, max_clauses)
+    if clauses is None:
+        raise ErrorNormalForm(f'CNF of {f} has more than {max_clauses} clauses')
+    return clauses, variables
+
+
+def tseitin_cnf(f) -> tuple:
+    """ Clauses of Tseitin encoding of the formula (see sat.tseitin), their size is linear.
+
+    Subformulas get the new variables with the indexes after the ones of the formula's
+    variables, so the clauses are equisatisfiable with the formula, but not equivalent
+    (clauses_formula can't be used for them).
+
+    >>> a, b = Var('a'), Var('b')
+    >>> tseitin_cnf(Formula(AND, None, a, b))
+    ([[-3, 1], [-3, 2], [3, -1, -2], [3]], {Var('a'): 1, Var('b'): 2})
+
+    :param f: Formula
+    :return: list of clauses (lists of literals), dictionary {Var: index of variable}
+             for the variables of the formula only
+    """
+    clauses, root, variables = tseitin(f)
+    return clauses + [[root]], variables
+
+
+def dnf(f, max_terms=DNF_MAX_TERMS) -> tuple:
+    """ Disjunctive normal form of the formula.
+
+    :param f: Formula
+    :param max_terms: maximal number of terms
+    :return: list of terms (lists of literals), dictionary {Var: index of variable}
+    """
+    variables = _variables(f)
+    terms = _clauses(_simplified(f), variables, AND, max_terms)
+    if terms is None:
+        raise ErrorNormalForm(f'DNF of {f} has more than {max_terms} terms')
+    return terms, variables
+
+
+def clauses_formula(clauses, variables, inner=OR) -> Formula:
+    """ Formula from the clauses of cnf (or the terms of dnf if inner is AND).
+
+    :param clauses: list of clauses (lists of literals)
+    :param variables: dictionary {Var: index of variable}
+    :param inner: connective inside the clauses
+    """
+    outer = AND if inner == OR else OR
+    by_index = {i: var for var, i in variables.items()}
+    x = _junction(outer, (_junction(inner, ((by_index[abs(lit)], lit > 0) for lit in clause))
+                          for clause in clauses))
+    return _from_simplified(x, variables)
+
+
+# -----------------------------------------------------ANF---------------------------------------------------------
+
+def anf(f, max_monomials=ANF_MAX_MONOMIALS) -> frozenset:
+    """ Algebraic normal form: formula is XOR of the monomials (conjunctions of variables),
+    empty monomial is True.
+
+    >>> a, b = Var('a'), Var('b')
+    >>> sorted(sorted(var.name for var in m) for m in anf(Formula(OR, None, a, b)))
+    [['a'], ['a', 'b'], ['b']]
+
+    :param f: Formula
+    :param max_monomials: maximal number of monomials in the form of any subformula
+    :return: frozenset of frozensets of Vars
+    """
+    one = frozenset([frozenset()])
+
+    def product(a, b):
+        result = set()
+        for x in a:
+            for y in b:
+                result ^= {x | y}          # x * y, the same monomials are cancelled
+        return frozenset(result)
+
+    def combine(node, sons):
+        if isinstance(node, Var):
+            result = frozenset([frozenset([node])])
+        elif node.main_con == NOT:
+            result = sons[0] ^ one
+        else:
+            a, b = sons
+            if node.main_con == XOR:
+                result = a ^ b
+            elif node.main_con == EQUIV:
+                result = a ^ b ^ one
+            elif node.main_con == AND:
+                result = product(a, b)
+            elif node.main_con == OR:
+                result = a ^ b ^ product(a, b)
+            else:                          # a -> b = 1 + a + ab
+                result = one ^ a ^ product(a, b)
+        if len(result) > max_monomials:
+            raise ErrorNormalForm(f'ANF of {node} has more than {max_monomials} monomials')
+        return result
+
+    return _transform(f, combine)
+
+
+def anf_formula(monomials, variables) -> Formula:
+    """ Formula from the anf (XOR of conjunctions, True is !a ^ a for the first variable).
+
+    :param monomials: result of anf
+    :param variables: variables for the constants (for example, the variables of original formula)
+    """
+    var = _formula(min(variables, key=lambda v: v.name))
+    parts = []
+    for monomial in sorted(monomials, key=lambda m: (len(m), sorted(v.name for v in m))):
+        if not monomial:
+            parts.append(var.neg().xor(var))
+            continue
+        names = sorted(monomial, key=lambda v: v.name)
+        res = _formula(names[0])
+        for v in names[1:]:
+            res = res.con(v)
+        parts.append(res)
+    if not parts:
+        return var.xor(var)
+    res = parts[0]
+    for part in parts[1:]:
+        res = res.xor(part)
+    return res
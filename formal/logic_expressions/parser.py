@@ -14,135 +14,120 @@ from logic_expressions.formulas import *
 import re
 
 
-ident_regex = re.compile(r'[_a-zA-Z][_a-zA-Z0-9]*')
-binary_regex = re.compile(r'&|->|<->|\^|\|')
+# tokens (each of them could be preceded by whitespaces)
+IDENT = 'identifier'
+BINARY_OPERATION = 'binary operation'
+NOT_TOKEN = NOT
+LEFT_PAR_TOKEN = LEFT_PAR
+RIGHT_PAR_TOKEN = RIGHT_PAR
 
-
-class ErrorLogicExpression(Exception):
-
-    def __str__(self):
-        return 'Bad logic expression'
+token_regex = re.compile(r'\s*(?:(?P<IDENT>[_a-zA-Z][_a-zA-Z0-9]*)|(?P<BINARY><->|->|&|\^|\|)|(?P<NOT>!)|'
+                         r'(?P<LEFT>\()|(?P<RIGHT>\)))')
+_kinds = {'IDENT': IDENT, 'BINARY': BINARY_OPERATION, 'NOT': NOT_TOKEN,
+          'LEFT': LEFT_PAR_TOKEN, 'RIGHT': RIGHT_PAR_TOKEN}
 
 
-def sequence(*funcs):
-    """ Sequence of functions-generators (from https://habr.com/ru/post/309242/)
-
-    :param funcs: callable
-    :return: callable for parsing
-    """
-    if len(funcs) == 0:
-        def result(src):
-            yield (), src
-        return result
-
-    def result(src):
-        for arg1, src in funcs[0](src):
-            for others, src in sequence(*funcs[1:])(src):
-                yield (arg1,) + others, src
-    return result
+class ErrorLogicExpression(Exception):
 
+    def __init__(self, message='', position=None):
+        super().__init__(message, position)
+        self.message = message
+        self.position = position      # index of the bad symbol in the source
 
-def parse_ident(src):
-    """ Parse the first identifier
+    def __str__(self):
+        if self.position is None:
+            return 'Bad logic expression'
+        return f'Bad logic expression at position {self.position}: {self.message}'
 
-    :param src: string
-    :return: first identifier, other string
-    """
-    match = ident_regex.match(src)
-    if match is not None:
-        val = match.group()
-        yield val, src[len(val):].lstrip()
 
+def tokenize(src):
+    """ Split the string into tokens.
 
-def parse_binary(src):
-    """ Parse the binary operation
+    >>> [kind for kind, _, _ in tokenize('(x1 -> (!x2))')]
+    ['(', 'identifier', 'binary operation', '(', '!', 'identifier', ')', ')']
 
     :param src: string
-    :return: first binary operation, other string
+    :return: generator of (kind of token, text of token, position in src)
     """
-    match = binary_regex.match(src)
-    if match is not None:
-        val = match.group()
-        yield val, src[len(val):].lstrip()
-
+    position = 0
+    length = len(src)
+    while True:
+        match = token_regex.match(src, position)
+        if match is None:
+            if src[position:].strip():
+                bad = position + len(src[position:]) - len(src[position:].lstrip())
+                raise ErrorLogicExpression(f'unexpected symbol {src[bad]!r}', bad)
+            return
+        position = match.end()
+        kind = match.lastgroup
+        yield _kinds[kind], match.group(kind), match.start(kind)
+        if position == length:
+            return
 
-def parse_word(word, value=None):
-    """ Create the function that parses the given word
 
-    :param word: string
-    :param value: default value that will returns the function
-    :return: callable
-    """
-    start = len(word)
-
-    def result(src: str):
-        if src.startswith(word):
-            yield value, src[start:].lstrip()
-
-    result.__name__ = f"parse_{word}"
-    return result
-
-
-# addintion parsers
-parse_not = parse_word('!', NOT)
-parse_left_par = parse_word('(', LEFT_PAR)
-parse_right_par = parse_word(')', RIGHT_PAR)
-parse_empty_array = sequence(parse_left_par, parse_right_par)
-
-
-def parse_formula(src):
-    """ Parse the first formula in logic utterances.
-
-    :param src: string
-    :return: Formula, other string
-    """
+def parse(s) -> Formula:
+    """ Parse the formula.
 
-    # try to parse the variant, when formula is just one variable
-    for var, src in parse_ident(src):
-        tmp = Var(var)
-        yield Formula(PASS, {tmp, }, tmp), src   # return for stop the iterator
-        return
-
-    # try to parse the variant when formula is like (A * B), * - binary operation
-    for (_, form1, oper, form2, _), src in sequence(parse_left_par,
-                                                    parse_formula,
-                                                    parse_binary,
-                                                    parse_formula,
-                                                    parse_right_par)(src):
-        yield form1._binary(form2, operation_type=oper), src
-        return
-
-    # try to parse the variant when formula is like (*A), * - unary operation (still just not)
-    for (_, _, form, _), src in sequence(parse_left_par,
-                                         parse_not,
-                                         parse_formula,
-                                         parse_right_par)(src):
-        yield form.neg(), src
-        return
-
-    # try to parse the variant when formula is like (A)
-    for (_, form, _), src in sequence(parse_left_par,
-                                      parse_formula,
-                                      parse_right_par)(src):
-        yield form.neg(), src
-        return
-
-    # if there was no variant that satisfies src returns None (bad logic expression)
+    Grammar (each formula except variable should be in parenthesis):
+        formula := identifier | (formula binary formula) | (!formula) | (formula)
 
+    Parser uses an explicit stack of opened parenthesis instead of recursion,
+    so it works for linear time and doesn't depend on the nesting depth.
 
-def parse(s) -> Formula:
-    """ Parse the formula using the function from above.
+    Result is hash-consed (shared by all the equal formulas), so its name can't be set:
+    use parse(s).copy() for the named formula.
 
     :param s: string
     :return: Formula
     """
-    s = s.strip()
-    match = list(parse_formula(s))
-    if len(match) != 1:          # if we haven't found formula or any other symbols have left
-        raise ErrorLogicExpression   # it means that given expresiion is bad
-    result, src = match[0]
-    if src.strip():
-        raise ErrorLogicExpression
+    stack = []          # opened parenthesis: [position, negation, left formula, operation, right formula]
+    result = None
+    formula = None      # parsed formula that should be put to the top of stack
+    position = 0
+
+    for kind, value, position in tokenize(s):
+        if result is not None:
+            raise ErrorLogicExpression(f'unexpected {kind} after the end of formula', position)
+
+        frame = stack[-1] if stack else None
+        expected_formula = frame is None or frame[2] is None or (frame[3] is not None and frame[4] is None)
+
+        if kind == IDENT and expected_formula:
+            var = Var(value)
+            formula = Formula(PASS, {var, }, var)
+        elif kind == LEFT_PAR_TOKEN and expected_formula:
+            stack.append([position, False, None, None, None])
+            continue
+        elif kind == NOT_TOKEN and frame is not None and frame[2] is None and not frame[1]:
+            frame[1] = True
+            continue
+        elif kind == BINARY_OPERATION and frame is not None and frame[2] is not None \
+                and frame[3] is None and not frame[1]:
+            frame[3] = value
+            continue
+        elif kind == RIGHT_PAR_TOKEN and frame is not None and not expected_formula:
+            _, negation, left, operation, right = stack.pop()
+            if negation:
+                formula = left.neg()
+            elif operation is not None:
+                formula = left._binary(right, operation_type=operation)
+            else:
+                formula = left
+        else:
+            raise ErrorLogicExpression(f'unexpected {kind} {value!r}', position)
+
+        # put the parsed formula to the opened parenthesis
+        if not stack:
+            result = formula
+        elif stack[-1][2] is None:
+            stack[-1][2] = formula
+        else:
+            stack[-1][4] = formula
+
+    if stack:
+        raise ErrorLogicExpression('unclosed parenthesis', stack[-1][0])
+    if result is None:
+        raise ErrorLogicExpression('formula is expected', len(s))
     return result
 
 
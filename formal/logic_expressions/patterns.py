@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*-encoding: utf-8-*-
+
+""" Pattern matching of formulas and the discrimination tree for the fast search of them.
+
+Pattern is a formula whose variables (metavariables) could be replaced by any formulas,
+just like F, G, H in the schemas of axioms. Formula is a sequence of symbols in the
+prefix order (connectives and variables, PASS nodes are skipped), so the discrimination
+tree is a trie of these sequences: search goes along the symbols and a metavariable
+skips the whole subformula at once.
+"""
+
+from .formulas import *
+
+
+def _unwrap(f):
+    """ f without PASS nodes: Var or Formula with the other main connective.
+    """
+    while isinstance(f, Formula) and f.main_con == PASS:
+        f = f.sons[0]
+    return f
+
+
+def _symbols(f):
+    """ Generator of symbols of formula in the prefix order (connectives and Vars).
+    """
+    stack = [f]
+    while stack:
+        node = _unwrap(stack.pop())
+        if isinstance(node, Var):
+            yield node
+        else:
+            yield node.main_con
+            stack.extend(reversed(node.sons))
+
+
+def match(pattern, f, metavars=None) -> dict:
+    """ Substitution of formulas for the metavariables that turns pattern into f.
+
+    >>> x, y, a, b = Var('x'), Var('y'), Var('a'), Var('b')
+    >>> pattern = Formula(IMPLICATION, None, x, Formula(IMPLICATION, None, y, x))
+    >>> a_b = Formula(AND, None, a, b)
+    >>> substitution = match(pattern, Formula(IMPLICATION, None, a_b, Formula(IMPLICATION, None, b, a_b)))
+    >>> str(substitution[x]), str(substitution[y])
+    ('(a&b)', 'b')
+    >>> match(pattern, Formula(IMPLICATION, None, a, Formula(IMPLICATION, None, b, b))) is None
+    True
+
+    :param pattern: Formula or Var
+    :param f: Formula or Var
+    :param metavars: set of Vars that could be replaced, by default all the variables of pattern
+    :return: {Var: Formula} or None if f isn't an instance of pattern
+    """
+    substitution = {}
+    stack = [(pattern, f)]
+    while stack:
+        p, g = stack.pop()
+        p, g = _unwrap(p), _unwrap(g)
+        if isinstance(p, Var) and (metavars is None or p in metavars):
+            g = Formula(PASS, None, g) if isinstance(g, Var) else g
+            if substitution.setdefault(p, g) != g:     # the same metavariable for the different formulas
+                return None
+        elif isinstance(p, Var) or isinstance(g, Var):
+            if p is not g:
+                return None
+        elif p.main_con != g.main_con:
+            return None
+        else:
+            stack.extend(zip(p.sons, g.sons))
+    return substitution
+
+
+class _Node:
+    """ Node of the discrimination tree.
+    """
+
+    __slots__ = ('children', 'vars', 'entries')
+
+    def __init__(self):
+        self.children = {}        # {connective: node}
+        self.vars = {}            # {Var: node}
+        self.entries = {}         # {formula: value} for the formulas that end here
+
+
+def _skip(node):
+    """ Nodes of the tree that are reachable from node by exactly one formula.
+    """
+    stack = [(node, 1)]
+    while stack:
+        node, need = stack.pop()          # need - number of formulas that should be skipped
+        if need == 0:
+            yield node
+            continue
+        for child in node.vars.values():
+            stack.append((child, need - 1))
+        for connective, child in node.children.items():
+            stack.append((child, need - 1 + (2 if connective in BINARY else 1)))
+
+
+class DiscriminationTree:
+    """ Index of formulas by their structure.
+
+    Variables of the stored formulas are metavariables for generalizations() (stored
+    formulas are patterns, like the schemas of axioms) and the usual variables for
+    instances() (stored formulas are proved ones and the pattern is the query).
+    generalizations() follows f along the tree, and a metavariable of the stored pattern skips
+    the whole subformula of f in one step. So the walk doesn't depend on the size of the
+    subformulas that are substituted. instances() is different: each metavariable of the query
+    has to skip a whole stored subformula node by node (see _skip). Its walk is up to the size of
+    the part of the tree below such positions, which could be all the stored formulas (e.g.
+    for the query x). In both cases each candidate is then checked by match().
+
+    >>> x, y, a, b = Var('x'), Var('y'), Var('a'), Var('b')
+    >>> tree = DiscriminationTree()
+    >>> tree.add(Formula(IMPLICATION, None, a, b), 'F_1')
+    >>> tree.add(Formula(IMPLICATION, None, b, b), 'F_2')
+    >>> [value for _, value, _ in tree.instances(Formula(IMPLICATION, None, x, b))]
+    ['F_1', 'F_2']
+    >>> [(str(f), str(subst[y])) for f, _, subst in tree.instances(Formula(IMPLICATION, None, y, y))]
+    [('(b->b)', 'b')]
+    """
+
+    def __init__(self, items=()):
+        """
+        :param items: iterable of (formula, value)
+        """
+        self.root = _Node()
+        self.size = 0
+        for f, value in items:
+            self.add(f, value)
+
+    def _find(self, f, create=False):
+        node = self.root
+        for symbol in _symbols(f):
+            children = node.vars if isinstance(symbol, Var) else node.children
+            child = children.get(symbol)
+            if child is None:
+                if not create:
+                    return None
+                child = children[symbol] = _Node()
+            node = child
+        return node
+
+    def add(self, f, value=None):
+        """ Store formula with the value (value of the formula stored before is replaced).
+
+        :param f: Formula or Var
+        """
+        node = self._find(f, create=True)
+        if f not in node.entries:
+            self.size += 1
+        node.entries[f] = value
+
+    def get(self, f, default=None):
+        """ Value of the stored formula f.
+        """
+        node = self._find(f)
+        if node is None:
+            return default
+        return node.entries.get(f, default)
+
+    def generalizations(self, f):
+        """ Stored patterns that have f as an instance.
+
+        :param f: Formula or Var
+        :return: generator of (pattern, value, substitution)
+        """
+        stack = [(self.root, (f, None))]        # (node, linked list of formulas that aren't passed)
+        while stack:
+            node, pending = stack.pop()
+            if pending is None:
+                for pattern, value in node.entries.items():
+                    substitution = match(pattern, f)
+                    if substitution is not None:
+                        yield pattern, value, substitution
+                continue
+            g, rest = pending
+            g = _unwrap(g)
+            for child in node.vars.values():       # metavariable is any formula
+                stack.append((child, rest))
+            if isinstance(g, Formula):
+                child = node.children.get(g.main_con)
+                if child is not None:
+                    for son in reversed(g.sons):
+                        rest = (son, rest)
+                    stack.append((child, rest))
+
+    def instances(self, pattern, metavars=None):
+        """ Stored formulas that are instances of pattern.
+
+        :param pattern: Formula or Var
+        :param metavars: set of Vars that could be replaced, by default all the variables of pattern
+        :return: generator of (formula, value, substitution)
+        """
+        stack = [(self.root, (pattern, None))]
+        while stack:
+            node, pending = stack.pop()
+            if pending is None:
+                for f, value in node.entries.items():
+                    substitution = match(pattern, f, metavars)
+                    if substitution is not None:
+                        yield f, value, substitution
+                continue
+            p, rest = pending
+            p = _unwrap(p)
+            if isinstance(p, Var):
+                if metavars is None or p in metavars:
+                    stack.extend((child, rest) for child in _skip(node))
+                elif p in node.vars:
+                    stack.append((node.vars[p], rest))
+                continue
+            child = node.children.get(p.main_con)
+            if child is not None:
+                for son in reversed(p.sons):
+                    rest = (son, rest)
+                stack.append((child, rest))
+
+    def __contains__(self, f):
+        node = self._find(f)
+        return node is not None and f in node.entries
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return f'DiscriminationTree(<{self.size} formulas>)'
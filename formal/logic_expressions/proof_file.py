@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*-encoding: utf-8-*-
+
+""" Binary file of the formal output with the random access to the steps.
+
+File is written by one pass (see write_proof_file), so the proof isn't kept in memory
+(only the offsets of the records, the recent strings and the indexes of the formulas that are
+alive, see FormulaTable):
+
+    MAGIC
+    records of strings, formulas and steps (in the order of appearance)
+    index of strings, index of formulas, index of steps (offsets of the records, 8 bytes each)
+    trailer: number of records and offset of the index for each kind, MAGIC
+
+Formulas are the records of FormulaTable (hash-consed nodes and named copies in postfix order),
+names, rules and templates of messages are the indexes of strings. ProofFile maps the file
+to memory and decodes only the steps that are asked (with the formulas they need), so any
+step or range of steps could be rendered without reading the whole file.
+"""
+
+import mmap
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+from collections import OrderedDict
+
+from .formulas import *
+from .theorems import *
+from .theorems import _unpack_formula
+
+MAGIC = b'LOGPRF02'
+NONE_INDEX = 0xFFFFFFFF         # index of the absent string (basis of the step without message)
+VARIABLE_CODE = 0xFF            # connective code of variable (codes of formulas are indexes in CONNECTIONS)
+WRITE_BUFFER_SIZE = 1 << 20     # bytes of records written to the file at once
+STRINGS_CACHE_SIZE = 1 << 12    # recent strings written once and kept by ProofFile (the older ones are repeated)
+OFFSETS_BUFFER_SIZE = 1 << 16   # offsets of records kept in memory before moving them to the temporary file
+FORMULAS_CACHE_SIZE = 1 << 16   # recent formulas decoded by ProofFile (the older ones are decoded again)
+
+# flags of the formula's record
+COPY_FLAG = 1
+
+_U32 = struct.Struct('<I')
+_U64 = struct.Struct('<Q')
+_FORMULA = struct.Struct('<BBI')      # connective code, flags, name
+_STEP = struct.Struct('<IIB')         # formula, rule, number of premises
+_BASIS = struct.Struct('<IB')         # template of basis, number of its arguments
+_TRAILER = struct.Struct('<6Q8s')
+
+
+class ErrorProofFile(Exception):
+    pass
+
+
+def write_proof_file(steps, file):
+    """ Write the steps to the binary file.
+
+    Offsets of the records are collected in the temporary files until the index is written.
+
+    :param steps: iterable of Steps
+    :param file: binary file opened for writing
+    :return: number of written steps, last Step (or None)
+    """
+    table = FormulaTable()
+    strings = OrderedDict()       # {string: index} of the recent strings
+    offsets = (array('Q'), array('Q'), array('Q'))        # offsets of strings, formulas, steps
+    counts = [0, 0, 0]            # numbers of records of each kind
+    position = len(MAGIC)
+    buffer = bytearray()
+
+    def write(kind, record):
+        kind_offsets = offsets[kind]
+        kind_offsets.append(position + len(buffer))
+        counts[kind] += 1
+        buffer.extend(record)
+        if len(kind_offsets) >= OFFSETS_BUFFER_SIZE:
+            save_offsets(kind)
+
+    def save_offsets(kind):
+        if sys.byteorder == 'big':
+            offsets[kind].byteswap()
+        offsets[kind].tofile(spills[kind])
+        del offsets[kind][:]
+
+    def string(s):
+        if s is None:
+            return NONE_INDEX
+        index = strings.get(s)
+        if index is not None:
+            strings.move_to_end(s)
+            return index
+        index = strings[s] = counts[0]
+        data = s.encode('utf-8')
+        write(0, _U32.pack(len(data)) + data)
+        if len(strings) > STRINGS_CACHE_SIZE:
+            strings.popitem(last=False)
+        return index
+
+    with tempfile.TemporaryFile() as spill0, tempfile.TemporaryFile() as spill1, \
+            tempfile.TemporaryFile() as spill2:
+        spills = (spill0, spill1, spill2)
+        file.write(MAGIC)
+        step = None
+        for step in steps:
+            x, rule, premises, basis, args = table.pack(step)
+            for record in table.records:
+                if record[0] is None:
+                    write(1, bytes([VARIABLE_CODE]) + _U32.pack(string(record[1])))
+                    continue
+                main_con, sons, copy, name = record
+                write(1, _FORMULA.pack(CONNECTIONS.index(main_con), COPY_FLAG * copy, string(name))
+                      + struct.pack(f'<{len(sons)}I', *sons))
+            write(2, _STEP.pack(x, string(rule), len(premises)) + struct.pack(f'<{len(premises)}I', *premises)
+                  + _BASIS.pack(string(basis), len(args)) + struct.pack(f'<{len(args)}I', *args))
+            table.records.clear()        # records are written, only their indexes are needed
+
+            if len(buffer) >= WRITE_BUFFER_SIZE:
+                file.write(buffer)
+                position += len(buffer)
+                buffer.clear()
+
+        file.write(buffer)
+        position += len(buffer)
+        trailer = []
+        for kind, spill in enumerate(spills):
+            trailer += [counts[kind], position]
+            save_offsets(kind)
+            spill.seek(0)
+            shutil.copyfileobj(spill, file)
+            position += 8 * counts[kind]
+        file.write(_TRAILER.pack(*trailer, MAGIC))
+    return counts[2], step
+
+
+class ProofFile:
+    """ Binary file of the formal output (see write_proof_file) opened for reading.
+
+    Steps are decoded lazily: proof[k] reads only the k-th step and formulas that it needs
+    (the recent FORMULAS_CACHE_SIZE decoded formulas and STRINGS_CACHE_SIZE strings are cached,
+    so the near steps share their formulas and the memory doesn't grow with the number of
+    rendered steps).
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:              # empty file can't be mapped
+            self._file.close()
+            raise ErrorProofFile(f'{path} is not a proof file')
+        if len(self._map) < len(MAGIC) + _TRAILER.size or self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ErrorProofFile(f'{path} is not a proof file')
+
+        *trailer, magic = _TRAILER.unpack_from(self._map, len(self._map) - _TRAILER.size)
+        if magic != MAGIC:
+            self.close()
+            raise ErrorProofFile(f'{path} is not a complete proof file')
+        (self._strings_count, self._strings_index, self._formulas_count, self._formulas_index,
+         self._steps_count, self._steps_index) = trailer
+        self._strings = OrderedDict()    # {index: string} of the recent strings
+        self._formulas = OrderedDict()   # {index: formula} of the recent formulas
+
+    def _offset(self, index_offset, count, k):
+        if not 0 <= k < count:
+            raise IndexError('index out of range')
+        return _U64.unpack_from(self._map, index_offset + 8 * k)[0]
+
+    def string(self, k):
+        """ k-th string of the file (None for NONE_INDEX).
+        """
+        if k == NONE_INDEX:
+            return None
+        strings = self._strings
+        if k in strings:
+            strings.move_to_end(k)
+            return strings[k]
+        offset = self._offset(self._strings_index, self._strings_count, k)
+        length = _U32.unpack_from(self._map, offset)[0]
+        s = strings[k] = self._map[offset + 4:offset + 4 + length].decode('utf-8')
+        if len(strings) > STRINGS_CACHE_SIZE:
+            strings.popitem(last=False)
+        return s
+
+    def _formula_record(self, k) -> tuple:
+        """ Record of FormulaTable for the k-th formula.
+        """
+        offset = self._offset(self._formulas_index, self._formulas_count, k)
+        if self._map[offset] == VARIABLE_CODE:
+            return None, self.string(_U32.unpack_from(self._map, offset + 1)[0])
+
+        code, flags, name = _FORMULA.unpack_from(self._map, offset)
+        main_con = CONNECTIONS[code]
+        offset += _FORMULA.size
+        arity = 2 if main_con in BINARY else 1
+        sons = struct.unpack_from(f'<{arity}I', self._map, offset)
+        return main_con, sons, bool(flags & COPY_FLAG), self.string(name)
+
+    def formula(self, k):
+        """ k-th formula of the file (with all its sons).
+
+        :return: Formula or Var
+        """
+        formulas = self._formulas
+        decoded = {}                 # formulas of this call (sons aren't evicted before their parents)
+        stack = [k]
+        while stack:                 # sons are decoded before the formula
+            i = stack[-1]
+            if i in decoded:
+                stack.pop()
+                continue
+            if i in formulas:
+                formulas.move_to_end(i)
+                decoded[i] = formulas[i]
+                stack.pop()
+                continue
+            record = self._formula_record(i)
+            missing = [] if record[0] is None else [j for j in record[1] if j not in decoded]
+            if missing:
+                stack.extend(missing)
+                continue
+            decoded[i] = formulas[i] = _unpack_formula(record, decoded, {})
+            stack.pop()
+        while len(formulas) > FORMULAS_CACHE_SIZE:
+            formulas.popitem(last=False)
+        return decoded[k]
+
+    def step(self, k) -> Step:
+        """ k-th step of the proof.
+        """
+        if k < 0:
+            k += self._steps_count
+        offset = self._offset(self._steps_index, self._steps_count, k)
+        x, rule, count = _STEP.unpack_from(self._map, offset)
+        offset += _STEP.size
+        premises = struct.unpack_from(f'<{count}I', self._map, offset)
+        offset += 4 * count
+        basis, count = _BASIS.unpack_from(self._map, offset)
+        args = struct.unpack_from(f'<{count}I', self._map, offset + _BASIS.size)
+        return Step(self.formula(x), self.string(rule), tuple(self.formula(i) for i in premises),
+                    self.string(basis), *(self.formula(i) for i in args))
+
+    def steps(self, start=0, stop=None):
+        """ Generator of the steps from start to stop (not including).
+        """
+        return (self.step(k) for k in range(*slice(start, stop).indices(self._steps_count)))
+
+    def messages(self, start=0, stop=None):
+        """ Generator of the messages of the steps from start to stop (not including).
+        """
+        return (step.message for step in self.steps(start, stop))
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self.step(k) for k in range(*item.indices(self._steps_count))]
+        return self.step(item)
+
+    def __iter__(self):
+        return self.steps()
+
+    def __len__(self):
+        return self._steps_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return f'ProofFile(<{self._steps_count} steps, {self._formulas_count} formulas>)'
+
+
+def write_proof_text(path, file, start=0, stop=None, batch_size=PROOF_BATCH_SIZE):
+    """ Convert the binary file of the formal output to the text (one message per line, see write_proof).
+
+    :param path: path of the binary file
+    :param file: text file
+    :param start: index of the first step
+    :param stop: index after the last step (by default all the steps are written)
+    :return: number of written steps, last Step (or None)
+    """
+    with ProofFile(path) as proof:
+        return write_proof(proof.steps(start, stop), file, batch_size)
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# -*-encoding: utf-8-*-
+
+""" Search of the short proofs in the system A1 - A3 + (MP).
+
+Proof from adequacy_theorem always splits by all the variables, so it grows exponentially
+even for (A -> A). Search works with the sets of hypotheses Г instead (just like
+the semantic tableaux) and splits only when it is needed:
+
+    Г |- F -> G         from Г, F |- G by the deduction theorem;
+    Г |- G              from the contradiction Г, !G |- H and Г, !G |- !H by A3;
+    Г is contradictory  if H and !H are obtained from Г by (MP) and !!F -> F (theorem T1),
+                        if !(F -> G) is in Г and Г |- F -> G,
+                        or if Г, !F and Г, F are contradictory for F -> G from Г (split by F).
+
+Each new hypothesis is a subformula of the theorem or its negation, so the search always
+stops. Outputs are built at each level (by the deduction theorem), so the budget is the number
+of steps that are built (by all the branches, including the ones that fail): the time and memory
+of the search are proportional to it. Outputs longer than max_steps are dropped as soon as
+they are built, prove() uses the length of the proof from adequacy_theorem for it, so only
+the outputs that could be shorter than that proof are kept.
+All the formulas are hash-consed, so the closures and results for the sets of hypotheses
+are kept in the dictionaries (transposition table) and each of them is built once.
+A goal that is already on the current path of the search fails there (against the cycles),
+but this failure isn't kept in the table: it is kept only for the goals whose search
+didn't meet such cycle.
+
+Search works with the connectives of the axioms (! and ->), prove() eliminates the other ones.
+"""
+
+from collections import deque
+
+from .formulas import *
+from .normal_forms import eliminate, BASIS_IMPLICATION
+from .theorems import *
+
+SEARCH_BUDGET = 1 << 16      # steps built by search_proof before it gives up
+PROVE_BUDGET_FACTOR = 4      # prove() builds at most this number of steps for each step of the adequacy proof
+
+
+def _canon(x):
+    return Formula(PASS, None, x) if isinstance(x, Var) else x._canon
+
+
+def _mp(f, f_g) -> Step:
+    res = modus_pones(f, f_g)
+    return Step(res, MP, (f, f_g), '(MP) for {} and {}', f, f_g)
+
+
+class _OutOfBudget(Exception):
+    pass
+
+
+class _Search:
+    """ State of search_proof: closures and results for the sets of hypotheses.
+
+    Formulas are hash-consed (see _canon), sets of hypotheses are frozensets.
+    Each output is a list of Steps where the hypotheses are used as they are (see theorem_deduction).
+    """
+
+    def __init__(self, budget, max_steps=None):
+        self.budget = budget
+        self.max_steps = max_steps
+        self.closures = {}           # {hypotheses: (known, contradiction)}
+        self.refutations = {}        # {hypotheses: (H, output for H, output for !H) or None}
+        self.proofs = {}             # {(hypotheses, goal): output or None}
+        self.searching = set()       # keys of proofs and refutations on the current path
+        self.cycles = 0              # number of the searches cut off by the current path
+
+    def _spend(self, count=1):
+        self.budget -= count
+        if self.budget < 0:
+            raise _OutOfBudget
+
+    def _built(self, output):
+        """ Charge the steps of the new output, the output longer than max_steps is dropped (None).
+        """
+        self._spend(len(output))
+        if self.max_steps is not None and len(output) > self.max_steps:
+            return None
+        return output
+
+    def _deduction(self, hypotheses, f, output):
+        """ Output of the deduction theorem (see theorem_deduction), None if it's longer than max_steps
+        (the building stops there).
+        """
+        result = []
+        for step in iter_theorem_deduction(hypotheses, f, output, indexation=False):
+            result.append(step)
+            if self.max_steps is not None and len(result) > self.max_steps:
+                break
+        return self._built(result)
+
+    def closure(self, hypotheses) -> tuple:
+        """ Formulas obtained from hypotheses by (MP) and theorem T1.
+
+        :return: {formula: (its copy, steps that prove it, formulas used by the steps)},
+                 formula H such that H and !H are both obtained (or None)
+        """
+        if hypotheses in self.closures:
+            return self.closures[hypotheses]
+
+        known = {}
+        waiting = {}                 # {F: [F -> G]} for the implications whose left part isn't obtained
+        agenda = deque()
+
+        def add(x, obj, steps, deps):
+            if x not in known:
+                self._spend(len(steps))
+                known[x] = (obj, steps, deps)
+                agenda.append(x)
+
+        for x in sorted(hypotheses, key=lambda h: h.operations_count):
+            obj = x.copy()
+            add(x, obj, [Step(obj, HYPOTHESIS, (), 'from hypothesis')], ())
+
+        contradiction = None
+        while agenda and contradiction is None:
+            x = agenda.popleft()
+            obj = known[x][0]
+            if x.neg() in known:
+                contradiction = x
+            elif x.main_con == NOT and _canon(x.sons[0]) in known:
+                contradiction = _canon(x.sons[0])
+
+            if x.main_con == IMPLICATION:
+                left = _canon(x.sons[0])
+                if left in known:
+                    step = _mp(known[left][0], obj)
+                    add(_canon(x.sons[1]), step.formula, [step], (left, x))
+                else:
+                    waiting.setdefault(left, []).append(x)
+            for x_y in waiting.pop(x, ()):
+                step = _mp(obj, known[x_y][0])
+                add(_canon(x_y.sons[1]), step.formula, [step], (x, x_y))
+
+            if x.main_con == NOT and isinstance(x.sons[0], Formula) and x.sons[0].main_con == NOT:   # !!F
+                f = _canon(x.sons[0].sons[0])
+                output = theorem_T1(f, indexation=False)
+                step = _mp(obj, output[-1][0])
+                add(f, step.formula, list(output) + [step], (x,))
+
+        self.closures[hypotheses] = known, contradiction
+        return known, contradiction
+
+    def collect(self, known, x):
+        """ Steps that prove x from the closure (premises go first), None if they are too many.
+        """
+        result = []
+        done = set()
+        stack = [(x, False)]
+        while stack:                 # iterative post-order traversal
+            y, ready = stack.pop()
+            if y in done:
+                continue
+            if ready:
+                done.add(y)
+                result += known[y][1]
+                continue
+            stack.append((y, True))
+            stack.extend((dep, False) for dep in reversed(known[y][2]))
+        return self._built(result)
+
+    def prove(self, hypotheses, goal):
+        """ Output for hypotheses |- goal or None.
+        """
+        key = (hypotheses, goal)
+        if key in self.proofs:
+            return self.proofs[key]
+        if key in self.searching:
+            self.cycles += 1
+            return None
+        self._spend()
+        self.searching.add(key)
+        cycles = self.cycles
+        try:
+            known, _ = self.closure(hypotheses)
+            if goal in known:
+                result = self.collect(known, goal)
+            elif goal.main_con == IMPLICATION:
+                left = _canon(goal.sons[0])
+                output = self.prove(hypotheses | {left}, _canon(goal.sons[1]))
+                result = None if output is None else \
+                    self._deduction(list(hypotheses - {left}), left, output)
+            else:
+                result = self.by_contradiction(hypotheses, goal)
+        finally:
+            self.searching.discard(key)
+
+        if result is not None or self.cycles == cycles:
+            self.proofs[key] = result
+        return result
+
+    def by_contradiction(self, hypotheses, goal):
+        """ Output for hypotheses |- goal from the contradiction of hypotheses and !goal (A3).
+        """
+        not_goal = goal.neg()
+        refutation = self.refute(hypotheses | {not_goal})
+        if refutation is None:
+            return None
+        h, output_h, output_not_h = refutation
+        rest = list(hypotheses - {not_goal})
+        output = self._deduction(rest, not_goal, output_h)                # !G -> H
+        if output is None:
+            return None
+        output_not = self._deduction(rest, not_goal, output_not_h)        # !G -> !H
+        if output_not is None:
+            return None
+        f1 = axiom_A3(h, goal)              # (!G -> !H) -> ((!G -> H) -> G)
+        step1 = _mp(output_not[-1][0], f1)
+        step2 = _mp(output[-1][0], step1.formula)
+        return self._built(output + output_not +
+                           [Step(f1, AXIOM_A3, (), 'Axiom A3 for {} and {}', h, goal), step1, step2])
+
+    def refute(self, hypotheses):
+        """ Contradiction of hypotheses.
+
+        :return: (H, output for H, output for !H) or None
+        """
+        if hypotheses in self.refutations:
+            return self.refutations[hypotheses]
+        if hypotheses in self.searching:
+            self.cycles += 1
+            return None
+        self._spend()
+        self.searching.add(hypotheses)
+        cycles = self.cycles
+        try:
+            known, contradiction = self.closure(hypotheses)
+            if contradiction is not None:
+                result = (contradiction, self.collect(known, contradiction),
+                          self.collect(known, contradiction.neg()))
+                if None in result:
+                    result = None
+            else:
+                result = self._refute_negated_implication(hypotheses, known)
+                if result is None:
+                    result = self._refute_by_split(hypotheses, known)
+        finally:
+            self.searching.discard(hypotheses)
+
+        if result is not None or self.cycles == cycles:
+            self.refutations[hypotheses] = result
+        return result
+
+    def _refute_negated_implication(self, hypotheses, known):
+        """ Contradiction of !(F -> G) from known with the proof of F -> G.
+        """
+        for x in sorted(known, key=lambda y: y.operations_count):
+            son = x.sons[0] if x.main_con == NOT else None
+            if not isinstance(son, Formula) or son.main_con != IMPLICATION:
+                continue
+            f, g = _canon(son.sons[0]), _canon(son.sons[1])
+            if f in known and g.neg() in known:          # it gives nothing new
+                continue
+            output = self.prove(hypotheses, son)
+            output_not = None if output is None else self.collect(known, x)
+            if output_not is not None:
+                return son, output, output_not
+        return None
+
+    def _refute_by_split(self, hypotheses, known):
+        """ Contradiction of hypotheses from the contradictions of hypotheses with F and with !F,
+        where F -> G is known and F, !F aren't.
+        """
+        candidates = [_canon(x.sons[0]) for x in known if x.main_con == IMPLICATION]
+        candidates = [f for f in candidates if f not in known and f.neg() not in known]
+        if not candidates:
+            return None
+        f = min(candidates, key=lambda y: y.operations_count)
+
+        output_f = self.by_contradiction(hypotheses, f)          # Г, !F is contradictory, so Г |- F
+        if output_f is None:
+            return None
+        refutation = self.refute(hypotheses | {f})
+        if refutation is None:
+            return None
+        h, output_h, output_not_h = refutation
+        rest = list(hypotheses)
+        result = [h]
+        for output in (output_h, output_not_h):            # Г |- F -> H and (MP) for F
+            output = self._deduction(rest, f, output)
+            if output is not None:
+                output = self._built(output_f + output + [_mp(output_f[-1][0], output[-1][0])])
+            if output is None:
+                return None
+            result.append(output)
+        return tuple(result)
+
+
+def search_proof(f: Formula, budget=SEARCH_BUDGET, st_index=0, indexation=True, max_steps=None):
+    """ Find the short formal output of the theorem f.
+
+    >>> a = Var('a')
+    >>> output = search_proof(Formula(IMPLICATION, None, a, a))
+    >>> len(output), output[-1][0].print_form()
+    (5, '(a->a)')
+
+    :param f: Formula
+    :param budget: maximal number of the steps that are built by the search (see above)
+    :param st_index: first index of addition formula
+    :param indexation: if True then each formula will have a name
+    :param max_steps: if it isn't None then only the outputs with at most max_steps steps are found
+    :return: deque of Steps (formula, message for printing) or None if the proof isn't found
+    """
+    goal = _canon(f)
+    try:
+        output = _Search(budget, max_steps).prove(frozenset(), goal)
+    except _OutOfBudget:
+        return None
+    if output is None:
+        return None
+    return deque(unique_steps(output, st_index, indexation, goal))
+
+
+def prove(f: Formula, budget=None, st_index=0, indexation=True) -> deque:
+    """ The shortest of the formal outputs of the tautology f from search_proof and adequacy_theorem.
+
+    The proof from adequacy_theorem is built first, the search looks only for the shorter outputs
+    (see max_steps of search_proof) and gives up when it's out of budget, so its time and memory
+    are at most PROVE_BUDGET_FACTOR times of the ones of the adequacy proof by default.
+    Axioms have only the connectives ! and ->, so the other ones are eliminated before
+    (see normal_forms.eliminate) and the last step is the equivalent formula in this basis:
+
+    >>> a = Var('a')
+    >>> output = prove(Formula(OR, None, a, Formula(NOT, None, a)))
+    >>> output[-1][0].print_form()
+    '((!a)->(!a))'
+
+    :param f: Formula (tautology)
+    :param budget: maximal number of the steps built by search_proof, by default
+                   PROVE_BUDGET_FACTOR * (number of steps of the adequacy proof)
+    :param st_index: first index of addition formula
+    :param indexation: if True then each formula will have a name
+    :return: deque of Steps (formula, message for printing)
+    """
+    if not f.check_tautology():
+        raise ValueError(f"{f} isn't tautology!")
+    f = eliminate(f, BASIS_IMPLICATION)
+    steps = adequacy_theorem(f, st_index, indexation, shared=True)
+    if budget is None:
+        budget = PROVE_BUDGET_FACTOR * len(steps)
+    found = search_proof(f, budget, st_index, indexation, max_steps=len(steps) - 1)
+    return steps if found is None else found
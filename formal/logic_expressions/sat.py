@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+# -*-encoding: utf-8-*-
+
+""" SAT solver (CDCL) for checking formulas with a lot of variables.
+
+F is tautology iff !F is unsatisfiable, so formula is encoded to CNF
+by Tseitin transformation and the solver looks for the model of its negation.
+Literals are non-zero integers just like in DIMACS: k means that k-th variable
+is True and -k means that it is False.
+"""
+
+from heapq import heappush, heappop
+from .formulas import *
+
+RESTART_BASE = 100         # number of conflicts before the first restart (multiplied by Luby sequence)
+ACTIVITY_DECAY = 0.95      # VSIDS decay of variables' activity
+MAX_LEARNTS = 2000         # learnt clauses above it are partially removed at restarts
+
+
+def tseitin(f) -> tuple:
+    """ Tseitin encoding of the formula.
+
+    Each subformula with the binary operation gets the new variable x and the clauses
+    for x <-> (a * b), negation and PASS just use literal of the son.
+
+    >>> a, b = Var('a'), Var('b')
+    >>> clauses, root, variables = tseitin(Formula(AND, {a, b}, a, b))
+    >>> root, variables
+    (3, {Var('a'): 1, Var('b'): 2})
+    >>> clauses
+    [[-3, 1], [-3, 2], [3, -1, -2]]
+
+    :param f: Formula or Var
+    :return: list of clauses, literal of f, dictionary {Var: index of variable}
+    """
+    variables = {var: i for i, var in enumerate(sorted(f.vars, key=lambda var: var.name), 1)} \
+        if isinstance(f, Formula) else {f: 1}
+    count = len(variables)
+    literals = {}           # {id(subformula): literal}
+    clauses = []
+
+    stack = [(f, False)]
+    while stack:                   # iterative post-order traversal
+        node, ready = stack.pop()
+        if isinstance(node, Var) or id(node) in literals:
+            continue
+        if not ready:
+            stack.append((node, True))
+            stack.extend((son, False) for son in reversed(node.sons))
+            continue
+
+        sons = [variables[son] if isinstance(son, Var) else literals[id(son)] for son in node.sons]
+        if node.main_con == PASS:
+            literals[id(node)] = sons[0]
+            continue
+        if node.main_con == NOT:
+            literals[id(node)] = -sons[0]
+            continue
+
+        count += 1
+        x, (a, b) = count, sons
+        literals[id(node)] = x
+        if node.main_con == AND:
+            clauses += [[-x, a], [-x, b], [x, -a, -b]]
+        elif node.main_con == OR:
+            clauses += [[-x, a, b], [x, -a], [x, -b]]
+        elif node.main_con == IMPLICATION:
+            clauses += [[-x, -a, b], [x, a], [x, -b]]
+        elif node.main_con == EQUIV:
+            clauses += [[-x, -a, b], [-x, a, -b], [x, a, b], [x, -a, -b]]
+        else:       # XOR
+            clauses += [[-x, a, b], [-x, -a, -b], [x, -a, b], [x, a, -b]]
+
+    root = variables[f] if isinstance(f, Var) else literals[id(f)]
+    return clauses, root, variables
+
+
+def luby(i):
+    """ i-th element of Luby sequence (1, 1, 2, 1, 1, 2, 4, 1, ...), i starts from 1.
+    """
+    k = 1
+    while (1 << k) - 1 < i:
+        k += 1
+    while (1 << k) - 1 != i:
+        i -= (1 << (k - 1)) - 1
+        k = 1
+        while (1 << k) - 1 < i:
+            k += 1
+    return 1 << (k - 1)
+
+
+class CDCLSolver:
+    """ Conflict-driven clause learning SAT solver.
+
+    Two watched literals for the unit propagation, first UIP clause learning with
+    non-chronological backjumping, VSIDS branching with phase saving and Luby restarts.
+    """
+
+    def __init__(self, variables_count: int, clauses=()):
+        self.variables_count = variables_count
+        self.clauses = []                 # all the clauses (with at least two literals)
+        self.learnts = 0                  # number of learnt clauses in the end of self.clauses
+        self.watches = {}                 # {literal: list of indexes of clauses that watch it}
+        self.values = [None] * (variables_count + 1)
+        self.levels = [0] * (variables_count + 1)
+        self.reasons = [None] * (variables_count + 1)      # index of clause that implied the variable
+        self.trail = []                   # assigned literals in the order of assigning
+        self.trail_lims = []              # index in trail of the each decision
+        self.queue_head = 0               # first literal in trail that isn't propagated yet
+        self.activity = [0.0] * (variables_count + 1)
+        self.activity_inc = 1.0
+        self.phases = [False] * (variables_count + 1)
+        self.heap = [(0.0, var) for var in range(1, variables_count + 1)]
+        self.conflicts = 0
+        self.unsat = False
+
+        for clause in clauses:
+            self.add_clause(clause)
+
+    def add_clause(self, clause):
+        """ Add the clause before solving (on the zero level).
+        """
+        clause = list(dict.fromkeys(clause))          # remove repeated literals
+        if any(-lit in clause for lit in clause):     # always True
+            return
+        clause = [lit for lit in clause if self._value(lit) is not False]
+        if any(self._value(lit) for lit in clause):
+            return
+        if not clause:
+            self.unsat = True
+        elif len(clause) == 1:
+            self._assign(clause[0], None)
+            if self._propagate() is not None:
+                self.unsat = True
+        else:
+            self._attach(clause)
+
+    def _attach(self, clause):
+        self.clauses.append(clause)
+        index = len(self.clauses) - 1
+        self.watches.setdefault(clause[0], []).append(index)
+        self.watches.setdefault(clause[1], []).append(index)
+        return index
+
+    def _value(self, lit):
+        value = self.values[abs(lit)]
+        if value is None:
+            return None
+        return value if lit > 0 else not value
+
+    def _assign(self, lit, reason):
+        var = abs(lit)
+        self.values[var] = lit > 0
+        self.levels[var] = len(self.trail_lims)
+        self.reasons[var] = reason
+        self.trail.append(lit)
+
+    def _propagate(self):
+        """ Unit propagation.
+
+        :return: index of conflict clause or None
+        """
+        clauses = self.clauses
+        while self.queue_head < len(self.trail):
+            false_lit = -self.trail[self.queue_head]
+            self.queue_head += 1
+            watchers = self.watches.get(false_lit, [])
+            kept = []
+            for i, index in enumerate(watchers):
+                clause = clauses[index]
+                if clause[0] == false_lit:           # false literal is always the second one
+                    clause[0], clause[1] = clause[1], clause[0]
+                first = clause[0]
+                if self._value(first) is True:
+                    kept.append(index)
+                    continue
+
+                for k in range(2, len(clause)):      # look for the new literal to watch
+                    if self._value(clause[k]) is not False:
+                        clause[1], clause[k] = clause[k], clause[1]
+                        self.watches.setdefault(clause[1], []).append(index)
+                        break
+                else:
+                    kept.append(index)
+                    if self._value(first) is False:      # all the literals are False
+                        kept.extend(watchers[i + 1:])
+                        self.watches[false_lit] = kept
+                        return index
+                    self._assign(first, index)
+            self.watches[false_lit] = kept
+        return None
+
+    def _bump(self, var):
+        self.activity[var] += self.activity_inc
+        if self.activity[var] > 1e100:            # rescale all the activities
+            self.activity = [act * 1e-100 for act in self.activity]
+            self.activity_inc *= 1e-100
+            self.heap = [(-self.activity[v], v) for v in range(1, self.variables_count + 1)
+                         if self.values[v] is None]
+            self.heap.sort()
+        else:
+            heappush(self.heap, (-self.activity[var], var))
+
+    def _analyze(self, conflict):
+        """ First UIP learning.
+
+        :return: learnt clause (the first literal is asserting), level for backjumping
+        """
+        seen = set()
+        learnt = [None]
+        counter = 0
+        lit = None
+        index = len(self.trail) - 1
+        level = len(self.trail_lims)
+
+        while True:
+            for q in self.clauses[conflict]:
+                var = abs(q)
+                if q == lit or var in seen or self.levels[var] == 0:
+                    continue
+                seen.add(var)
+                self._bump(var)
+                if self.levels[var] == level:
+                    counter += 1
+                else:
+                    learnt.append(q)
+
+            while abs(self.trail[index]) not in seen:      # last assigned literal from the conflict
+                index -= 1
+            lit = self.trail[index]
+            index -= 1
+            counter -= 1
+            if counter == 0:
+                break
+            conflict = self.reasons[abs(lit)]
+
+        learnt[0] = -lit
+        self.activity_inc /= ACTIVITY_DECAY
+        if len(learnt) == 1:
+            return learnt, 0
+
+        # the literal with the highest level should be watched as well
+        best = max(range(1, len(learnt)), key=lambda i: self.levels[abs(learnt[i])])
+        learnt[1], learnt[best] = learnt[best], learnt[1]
+        return learnt, self.levels[abs(learnt[1])]
+
+    def _backjump(self, level):
+        if len(self.trail_lims) <= level:
+            return
+        lim = self.trail_lims[level]
+        for lit in self.trail[lim:]:
+            var = abs(lit)
+            self.phases[var] = lit > 0
+            self.values[var] = None
+            self.reasons[var] = None
+            heappush(self.heap, (-self.activity[var], var))
+        del self.trail[lim:]
+        del self.trail_lims[level:]
+        self.queue_head = len(self.trail)
+
+    def _decide(self):
+        """ Unassigned variable with the highest activity (or None if all are assigned).
+        """
+        while self.heap:
+            act, var = heappop(self.heap)
+            if self.values[var] is None and -act == self.activity[var]:
+                return var
+        for var in range(1, self.variables_count + 1):     # heap entries could be lost during the rescaling
+            if self.values[var] is None:
+                return var
+        return None
+
+    def _reduce(self):
+        """ Remove the longest half of learnt clauses that aren't reasons now.
+        """
+        start = len(self.clauses) - self.learnts
+        locked = {self.reasons[abs(lit)] for lit in self.trail}
+        learnts = sorted(range(start, len(self.clauses)), key=lambda i: len(self.clauses[i]))
+        keep = set(learnts[:len(learnts) // 2]) | (locked & set(learnts))
+
+        new_indexes = {}
+        clauses = self.clauses[:start]
+        for i in range(start, len(self.clauses)):
+            if i in keep:
+                new_indexes[i] = len(clauses)
+                clauses.append(self.clauses[i])
+        self.clauses = clauses
+        self.learnts = len(clauses) - start
+        self.reasons = [new_indexes.get(reason, reason) for reason in self.reasons]
+        self.watches = {}
+        for index, clause in enumerate(self.clauses):
+            self.watches.setdefault(clause[0], []).append(index)
+            self.watches.setdefault(clause[1], []).append(index)
+
+    def solve(self):
+        """ Find the model of the clauses.
+
+        :return: list of values of variables (index 0 isn't used) or None if clauses are unsatisfiable
+        """
+        if self.unsat or self._propagate() is not None:
+            self.unsat = True
+            return None
+
+        restarts = 1
+        conflicts_limit = RESTART_BASE * luby(restarts)
+        while True:
+            conflict = self._propagate()
+            if conflict is not None:
+                self.conflicts += 1
+                conflicts_limit -= 1
+                if not self.trail_lims:
+                    self.unsat = True
+                    return None
+                learnt, level = self._analyze(conflict)
+                self._backjump(level)
+                if len(learnt) == 1:
+                    self._assign(learnt[0], None)
+                else:
+                    self.learnts += 1
+                    self._assign(learnt[0], self._attach(learnt))
+                continue
+
+            if conflicts_limit <= 0:          # restart
+                self._backjump(0)
+                restarts += 1
+                conflicts_limit = RESTART_BASE * luby(restarts)
+                if self.learnts > MAX_LEARNTS:
+                    self._reduce()
+                continue
+
+            var = self._decide()
+            if var is None:
+                return list(self.values)
+            self.trail_lims.append(len(self.trail))
+            self._assign(var if self.phases[var] else -var, None)
+
+
+def sat_counterexample(f):
+    """ Find assignment for which formula is False using CDCLSolver for !f.
+
+    :param f: Formula
+    :return: {Var: bool} or None if formula is tautology
+    """
+    clauses, root, variables = tseitin(f)
+    solver = CDCLSolver(max([len(variables), abs(root)] + [abs(lit) for clause in clauses for lit in clause]),
+                        clauses + [[-root]])
+    model = solver.solve()
+    if model is None:
+        return None
+    return {var: bool(model[index]) for var, index in variables.items()}
+
+
+def sat_model(f):
+    """ Find assignment for which formula is True using CDCLSolver.
+
+    :param f: Formula
+    :return: {Var: bool} or None if formula is unsatisfiable
+    """
+    return sat_counterexample(f.neg())
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*-encoding: utf-8-*-
+
+""" Persistent store of the results of checks and the formal outputs (SQLite file).
+
+Results of check_tautology are kept by the canonical key of formula (see equivalence.canonical_key),
+so they don't depend on the names of variables. Outputs are the binary proof files
+(see proof_file.py) compressed by zlib, their key is the canonical key together with the names
+of variables and the kind of output (ADEQUACY_PROOF or the name of theorem).
+
+The file could be used by several processes at the same time (WAL journal, each change
+is one transaction). Lookups are plain reads that don't take the lock of writers, the time
+of use of the found records is written later together with the next change (or after
+USED_BATCH lookups). The least recently used records are removed when there are more than
+max_results results or outputs take more than max_size bytes.
+
+Formula.check_tautology consults the store when Formula.store is set:
+
+    Formula.store = ProofStore()
+"""
+
+import sqlite3
+import zlib
+from threading import RLock
+import time
+
+from .formulas import *
+from .equivalence import canonical_key
+from .proof_file import *
+
+STORE_PATH = 'logic_store.sqlite'
+STORE_MAX_RESULTS = 1 << 20       # results of checks
+STORE_MAX_SIZE = 1 << 30          # bytes of all the compressed outputs
+STORE_MAX_PROOF_SIZE = 1 << 26    # bytes of one compressed output, bigger ones aren't stored
+STORE_TIMEOUT = 30                # seconds of waiting for the other processes
+COMPRESSION_LEVEL = 6
+CHUNK_SIZE = 1 << 20              # bytes that are decompressed at once
+USED_BATCH = 256                  # lookups whose time of use is written in one transaction
+
+ADEQUACY_PROOF = 'adequacy'       # kind of output of iter_adequacy_theorem(f, shared=True)
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, counterexample TEXT, used REAL);
+CREATE TABLE IF NOT EXISTS proofs (key TEXT PRIMARY KEY, data BLOB, size INTEGER, used REAL);
+CREATE INDEX IF NOT EXISTS results_used ON results (used);
+CREATE INDEX IF NOT EXISTS proofs_used ON proofs (used);
+'''
+
+
+class _CompressingWriter:
+    """ Binary file that writes the data and keeps its compressed copy (while it isn't too big).
+    """
+
+    def __init__(self, file, limit):
+        self.file = file
+        self.limit = limit
+        self.compressor = zlib.compressobj(COMPRESSION_LEVEL)
+        self.parts = []
+        self.size = 0
+
+    def write(self, data):
+        self.file.write(data)
+        if self.parts is not None:
+            part = self.compressor.compress(data)
+            self.parts.append(part)
+            self.size += len(part)
+            if self.size > self.limit:
+                self.parts = None
+
+    def compressed(self):
+        """ Compressed data or None if it is too big.
+        """
+        if self.parts is None:
+            return None
+        data = b''.join(self.parts) + self.compressor.flush()
+        return data if len(data) <= self.limit else None
+
+
+class ProofStore:
+    """ SQLite file with the results of checks and compressed formal outputs.
+    """
+
+    def __init__(self, path=STORE_PATH, max_results=STORE_MAX_RESULTS, max_size=STORE_MAX_SIZE,
+                 max_proof_size=STORE_MAX_PROOF_SIZE):
+        self.path = path
+        self.max_results = max_results
+        self.max_size = max_size
+        self.max_proof_size = max_proof_size
+        self._lock = RLock()
+        self._used = {'results': {}, 'proofs': {}}      # {table: {key: time of the last lookup}}
+        self._connection = sqlite3.connect(path, timeout=STORE_TIMEOUT, check_same_thread=False,
+                                           isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.executescript(_SCHEMA)
+
+    def _execute(self, *queries):
+        """ Execute the queries (sql, parameters) in one transaction (with the delayed times of use).
+
+        :return: rows of the last query
+        """
+        with self._lock:
+            used = [(f'UPDATE {table} SET used = ? WHERE key = ?', (moment, key))
+                    for table, keys in self._used.items() for key, moment in keys.items()]
+            cursor = self._connection.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                for sql, parameters in used + list(queries):
+                    cursor.execute(sql, parameters)
+                rows = cursor.fetchall()
+                cursor.execute('COMMIT')
+            except BaseException:
+                cursor.execute('ROLLBACK')
+                raise
+            for keys in self._used.values():
+                keys.clear()
+            return rows
+
+    def _lookup(self, table, column, key):
+        """ Value of the column of the record with the given key or None (without the lock of writers).
+
+        :return: (value,) or None if there is no such record
+        """
+        with self._lock:
+            row = self._connection.execute(f'SELECT {column} FROM {table} WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                self._used[table][key] = time.time()
+                if sum(map(len, self._used.values())) >= USED_BATCH:
+                    self._execute()
+            return row
+
+    # ------------------------------------------results of checks------------------------------------------------
+
+    def find_counterexample(self, f, workers=None, engine=AUTO_ENGINE, decompose=True):
+        """ Formula.find_counterexample with the result from the store (it is computed and stored
+        if it isn't there).
+
+        :param f: Formula or Var
+        :return: {Var: bool} or None if formula is tautology
+        """
+        key, variables = canonical_key(f)
+        row = self._lookup('results', 'counterexample', key)
+        if row is not None:
+            value = row[0]
+        else:
+            f = Formula(PASS, None, f) if isinstance(f, Var) else f
+            counterexample = f.find_counterexample(workers, engine, decompose)
+            value = None if counterexample is None else ''.join('01'[counterexample[var]] for var in variables)
+            self._execute(('INSERT OR REPLACE INTO results VALUES (?, ?, ?)', (key, value, time.time())),
+                          ('DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY used DESC '
+                           'LIMIT -1 OFFSET ?)', (self.max_results,)))
+        if value is None:
+            return None
+        return {var: bit == '1' for var, bit in zip(variables, value)}
+
+    def check_tautology(self, f, workers=None, engine=AUTO_ENGINE, decompose=True) -> bool:
+        return self.find_counterexample(f, workers, engine, decompose) is None
+
+    # -----------------------------------------------outputs-----------------------------------------------------
+
+    @staticmethod
+    def proof_key(f, kind=ADEQUACY_PROOF) -> str:
+        """ Key of the output of f (it depends on the names of variables).
+        """
+        key, variables = canonical_key(f)
+        return f'{kind}:{key}:' + ','.join(var.name for var in variables)
+
+    def get_proof(self, f, kind=ADEQUACY_PROOF):
+        """ Compressed binary proof file of f or None if it isn't stored.
+        """
+        key = self.proof_key(f, kind)
+        row = self._lookup('proofs', 'data', key)
+        return None if row is None else row[0]
+
+    def put_proof(self, f, data, kind=ADEQUACY_PROOF):
+        """ Store the compressed binary proof file of f (the least recently used are removed
+        if all of them are bigger than max_size).
+        """
+        key = self.proof_key(f, kind)
+        self._execute(('INSERT OR REPLACE INTO proofs VALUES (?, ?, ?, ?)', (key, data, len(data), time.time())),
+                      ('DELETE FROM proofs WHERE key IN (SELECT key FROM (SELECT key, SUM(size) OVER '
+                       '(ORDER BY used DESC, key ROWS UNBOUNDED PRECEDING) AS total FROM proofs) WHERE total > ?)',
+                       (self.max_size,)))
+
+    def write_proof_file(self, f, path, build, kind=ADEQUACY_PROOF):
+        """ Write the binary proof file of f from the store or from the steps of build()
+        (and store them).
+
+        :param f: Formula
+        :param path: path of the binary file
+        :param build: function without arguments that returns iterable of Steps
+        :param kind: ADEQUACY_PROOF or name of theorem
+        :return: number of steps, last Step (or None)
+        """
+        data = self.get_proof(f, kind)
+        if data is None:
+            with open(path, 'wb') as file:
+                writer = _CompressingWriter(file, self.max_proof_size)
+                result = write_proof_file(build(), writer)
+            data = writer.compressed()
+            if data is not None:
+                self.put_proof(f, data, kind)
+            return result
+
+        decompressor = zlib.decompressobj()
+        with open(path, 'wb') as file:
+            for start in range(0, len(data), CHUNK_SIZE):
+                file.write(decompressor.decompress(data[start:start + CHUNK_SIZE]))
+            file.write(decompressor.flush())
+        with ProofFile(path) as proof:
+            return len(proof), proof[-1] if len(proof) else None
+
+    def clear(self):
+        self._execute(('DELETE FROM results', ()), ('DELETE FROM proofs', ()))
+
+    def close(self):
+        if any(self._used.values()):
+            self._execute()
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT (SELECT COUNT(*) FROM results) + '
+                                            '(SELECT COUNT(*) FROM proofs)').fetchone()[0]
+
+    def __repr__(self):
+        return f'ProofStore({self.path!r})'
@@ -11,24 +11,90 @@
 """
 
 
-from collections import deque
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from .parser import *
 from .formulas import *
+from .patterns import *
 from itertools import product
+import weakref
 
 NAME = 'F_{}'
 MESSAGE = '{} = {}     basis: {}'
 
+# rules of the steps of formal output
+AXIOM_A1 = 'A1'
+AXIOM_A2 = 'A2'
+AXIOM_A3 = 'A3'
+AXIOM = 'axiom'           # axiom of the unknown schema
+MP = 'MP'
+HYPOTHESIS = 'hypothesis'
+AXIOM_RULES = (AXIOM_A1, AXIOM_A2, AXIOM_A3, AXIOM)
+
+KALMAR_CACHE_SIZE = 1 << 12    # outputs of Kalmar's lemma in the KalmarCache by default
+PROOF_BATCH_SIZE = 1000        # lines written to the file at once by write_proof
+PROOF_SHARDS_PER_WORKER = 2    # outputs for each worker in the parallel adequacy_theorem
+
 Formula.print_name = True
 
 
+class Step:
+    """ Step of the formal output: formula, rule and premises.
+
+    All the information about the proof is kept in the step, the formula is
+    the hash-consed one or its copy with the name only (see NamedFormula), so the same formula
+    could be used by the different steps and proofs.
+
+    Message for printing is built only when it is needed, so the steps that
+    are never printed (like in the nested outputs) cost nothing. For the compatibility
+    step is also a pair (formula, message).
+    """
+
+    __slots__ = ('formula', 'rule', 'premises', '_basis', '_args')
+
+    def __init__(self, formula: Formula, rule=HYPOTHESIS, premises=(), basis=None, *args):
+        """
+        :param formula: Formula
+        :param rule: rule of the step: one of AXIOM_RULES, MP or HYPOTHESIS
+        :param premises: formulas for MP (f, f -> g)
+        :param basis: template of the basis for the message (without it message is empty)
+        :param args: arguments for the template
+        """
+        self.formula = formula
+        self.rule = rule
+        self.premises = premises
+        self._basis = basis
+        self._args = args
+
+    @property
+    def message(self):
+        """ Message for printing: 'name = formula     basis: ...'.
+        """
+        if self._basis is None:
+            return ''
+        return MESSAGE.format(self.formula, self.formula.print_form(), self._basis.format(*self._args))
+
+    def __iter__(self):
+        yield self.formula
+        yield self.message
+
+    def __len__(self):
+        return 2
+
+    def __getitem__(self, item):
+        if item == 0 or item == -2:
+            return self.formula
+        return (self.formula, self.message)[item]
+
+    def __repr__(self):
+        return f'Step({self.formula!r}, {self.rule!r})'
+
+
 def axiom_A1(f: Formula, g: Formula) -> Formula:
     """ For formulas f and g creates axiom from schema A1
     """
     tmp = g.implication(f)        # g -> f
-    res = f.implication(tmp)      # f -> (g -> f)
-    res.is_axiom = True       # that's for checking in the theorems
-    return res
+    return f.implication(tmp).copy()      # f -> (g -> f)
 
 
 def axiom_A2(f: Formula, g: Formula, h: Formula) -> Formula:
@@ -39,9 +105,7 @@ def axiom_A2(f: Formula, g: Formula, h: Formula) -> Formula:
     g1 = g.implication(h)       # g -> h
     g2 = f.implication(g1)      # f -> (g -> h)
     f3 = f1.implication(f2)     # (f -> g) -> (f -> h)
-    res = g2.implication(f3)    # (f -> (g -> h)) -> ((f -> g) -> (f -> h))
-    res.is_axiom = True       # that's for checking in the theorems
-    return res
+    return g2.implication(f3).copy()    # (f -> (g -> h)) -> ((f -> g) -> (f -> h))
 
 
 def axiom_A3(f: Formula, g: Formula) -> Formula:
@@ -50,9 +114,7 @@ def axiom_A3(f: Formula, g: Formula) -> Formula:
     f1 = g.neg().implication(f.neg())    # !g -> !f
     f2 = g.neg().implication(f)          # !g -> f
     f3 = f2.implication(g)               # (!g -> f) -> g
-    res = f1.implication(f3)             # (!g -> !f) -> ((!g -> f) -> g)
-    res.is_axiom = True
-    return res
+    return f1.implication(f3).copy()      # (!g -> !f) -> ((!g -> f) -> g)
 
 
 def modus_pones(f: Formula, f_g: Formula) -> Formula:
@@ -63,10 +125,159 @@ def modus_pones(f: Formula, f_g: Formula) -> Formula:
     assert len(f_g.sons) > 1, f"coudn't use (MP) for {f.print_form()} and {f_g.print_form()}"
 
     # copy uses for different names
-    res = f_g.sons[1].copy()  # type: Formula
-    res.by_modus_pones = True           # for checking in theorems
-    res.from_modus_pones = (f, f_g)     # for checking in theorems
-    return res
+    res = f_g.sons[1]
+    if isinstance(res, Var):
+        res = Formula(PASS, None, res)
+    return res.copy()  # type: Formula
+
+
+def _connectives(f) -> set:
+    """ All the connectives of formula (each hash-consed subformula is visited once).
+    """
+    result = set()
+    done = set()
+    stack = [f]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Var) or id(node._canon) in done:
+            continue
+        done.add(id(node._canon))
+        result.add(node.main_con)
+        stack.extend(node._canon.sons)
+    return result
+
+
+def _sons(f, main_con):
+    """ Sons of formula with the given main connective (PASS nodes are skipped) or None.
+    """
+    while isinstance(f, Formula) and f.main_con == PASS and isinstance(f.sons[0], Formula):
+        f = f.sons[0]
+    if isinstance(f, Formula) and f.main_con == main_con:
+        return f.sons
+    return None
+
+
+_F, _G, _H = Var('F'), Var('G'), Var('H')
+_f, _g, _h = (Formula(PASS, None, var) for var in (_F, _G, _H))
+
+# schemas of axioms as patterns (F, G, H are metavariables): {schema: (pattern, metavariables)}
+AXIOM_SCHEMAS = {AXIOM_A1: (axiom_A1(_f, _g), (_F, _G)),
+                 AXIOM_A2: (axiom_A2(_f, _g, _h), (_F, _G, _H)),
+                 AXIOM_A3: (axiom_A3(_f, _g), (_F, _G)),
+                 }
+
+_axioms_tree = DiscriminationTree((pattern, schema) for schema, (pattern, _) in AXIOM_SCHEMAS.items())
+
+
+def match_axiom(f):
+    """ Schema of the axiom that has f as an instance and formulas of this instance.
+
+    Unlike the rule of the step it works for any formula (built by hand or loaded from the file),
+    axiom is found by the discrimination tree of schemas (see patterns.py).
+
+    >>> a, b = Formula(PASS, None, Var('a')), Formula(PASS, None, Var('b'))
+    >>> schema, (f, g, h) = match_axiom(axiom_A2(a, b.neg(), a))
+    >>> schema, str(f), str(g), str(h)
+    ('A2', 'a', '(!b)', 'a')
+
+    Result is kept while the hash-consed formula is alive, so each formula is matched once.
+
+    :param f: Formula
+    :return: (AXIOM_A1, (f, g)), (AXIOM_A2, (f, g, h)), (AXIOM_A3, (f, g)) (arguments of
+             axiom_A1, axiom_A2, axiom_A3 respectively) or None if f isn't an axiom
+    """
+    canon = Formula(PASS, None, f) if isinstance(f, Var) else f._canon
+    if canon in _axioms:
+        return _axioms[canon]
+    result = None
+    for _, schema, substitution in _axioms_tree.generalizations(canon):
+        result = schema, tuple(substitution[var] for var in AXIOM_SCHEMAS[schema][1])
+        break
+    _axioms[canon] = result
+    return result
+
+
+_axioms = weakref.WeakKeyDictionary()      # {hash-consed formula: result of match_axiom}
+
+
+def axiom_schema(f) -> str:
+    """ Schema of the axiom that has f as an instance.
+
+    >>> a, b = Formula(PASS, None, Var('a')), Formula(PASS, None, Var('b'))
+    >>> axiom_schema(axiom_A2(a, b, a)), axiom_schema(axiom_A3(a, b)), axiom_schema(a.implication(b))
+    ('A2', 'A3', None)
+
+    :param f: Formula
+    :return: AXIOM_A1, AXIOM_A2, AXIOM_A3 or None if f isn't an axiom
+    """
+    res = match_axiom(f)
+    return None if res is None else res[0]
+
+
+class ErrorProof(Exception):
+
+    def __init__(self, message='', index=None, step=None):
+        super().__init__(message, index)
+        self.message = message
+        self.index = index        # index of the bad step
+        self.step = step
+
+    def __str__(self):
+        if self.index is None:
+            return 'Bad proof'
+        return f'Bad proof at step {self.index}: {self.message}'
+
+
+def verify_proof(steps, hypotheses=()) -> int:
+    """ Check that each step of the formal output is an axiom (A1, A2 or A3),
+    a hypothesis or (MP) for the formulas above.
+
+    Just like in the outputs of this module, premises of (MP) that are axioms
+    or hypotheses could be not in the output. All the proved formulas are in the hash set
+    and the implications are indexed by the right part, so each step is checked in O(1)
+    (if it isn't a Step with premises, all the proved F -> G are checked for G).
+
+    :param steps: iterable of Steps, (formula, message) or formulas
+    :param hypotheses: iterable of formulas-hypothesis
+    :return: number of steps
+    """
+    hypotheses = set(hypotheses)
+    proved = set()
+    by_right = {}             # {G: [F for all the proved F -> G]}
+
+    def known(x):
+        return x in proved or x in hypotheses or axiom_schema(x) is not None
+
+    index = -1
+    for index, step in enumerate(steps):
+        if isinstance(step, Step):
+            x, premises = step.formula, step.premises if step.rule == MP else ()
+        elif isinstance(step, tuple):
+            x, premises = step[0], ()
+        else:
+            x, premises = step, ()
+        if isinstance(x, Var):
+            x = Formula(PASS, None, x)
+
+        if x not in proved and x not in hypotheses and axiom_schema(x) is None:
+            if len(premises) == 2:
+                f, f_g = premises
+                if _sons(f_g, IMPLICATION) is None or _sons(f_g, IMPLICATION)[0] != f:
+                    f, f_g = f_g, f
+                sons = _sons(f_g, IMPLICATION)
+                if sons is None or sons[0] != f or sons[1] != x:
+                    raise ErrorProof(f'{x.print_form()} is not a result of (MP) for its premises', index, step)
+                if not known(f) or not known(f_g):
+                    raise ErrorProof(f'premises of {x.print_form()} are not proved above', index, step)
+            elif not any(f in proved for f in by_right.get(x, ())):
+                raise ErrorProof(f'{x.print_form()} is not an axiom, hypothesis or result of (MP)', index, step)
+
+        if x not in proved:
+            proved.add(x)
+            sons = _sons(x, IMPLICATION)
+            if sons is not None:
+                by_right.setdefault(sons[1], []).append(sons[0])
+    return index + 1
 
 
 def theorem_L(f: Formula, st_index=0, indexation=True) -> deque:
@@ -75,7 +286,7 @@ def theorem_L(f: Formula, st_index=0, indexation=True) -> deque:
     :param f: formula
     :param st_index: first index of addition formula
     :param indexation: if True then each formula will have a name
-    :return: deque((formula, message for printing))
+    :return: deque of Steps (formula, message for printing)
     """
     # -----------------------------------------------formal output------------------------------------------------------
     f0 = axiom_A2(f, f.implication(f), f)
@@ -94,11 +305,11 @@ def theorem_L(f: Formula, st_index=0, indexation=True) -> deque:
 
     # ---------------------------------adding formulas and messages to the deque----------------------------------------
     result = deque()
-    result.append((f0, MESSAGE.format(f0, f0.print_form(), f'Axiom A2 for {f}, {f.implication(f)} and {f}')))
-    result.append((f1, MESSAGE.format(f1, f1.print_form(), f'Axiom A1 for {f} and {f.implication(f)}')))
-    result.append((f2, MESSAGE.format(f2, f2.print_form(), f'(MP) for {f1} and {f0}')))
-    result.append((f3, MESSAGE.format(f3, f3.print_form(), f'Axiom A1 for {f} and {f}')))
-    result.append((f4, MESSAGE.format(f4, f4.print_form(), f'(MP) for {f3} and {f2}')))
+    result.append(Step(f0, AXIOM_A2, (), 'Axiom A2 for {}, {} and {}', f, f.implication(f), f))
+    result.append(Step(f1, AXIOM_A1, (), 'Axiom A1 for {} and {}', f, f.implication(f)))
+    result.append(Step(f2, MP, (f1, f0), '(MP) for {} and {}', f1, f0))
+    result.append(Step(f3, AXIOM_A1, (), 'Axiom A1 for {} and {}', f, f))
+    result.append(Step(f4, MP, (f3, f2), '(MP) for {} and {}', f3, f2))
     return result
 
 
@@ -111,14 +322,45 @@ def theorem_deduction(hypothesis: list, f: Formula, output: deque, st_index=0, i
     :param output: deque((formula, message for printing)) from other function
     :param st_index: first index of addition formula
     :param indexation: if True then each formula will have a name
-    :return: deque((formula, message for printing))
+    :return: deque of Steps (formula, message for printing)
+    """
+    return deque(iter_theorem_deduction(hypothesis, f, output, st_index, indexation))
+
+
+def iter_theorem_deduction(hypothesis: list, f: Formula, output, st_index=0, indexation=True):
+    """ Same with theorem_deduction, but the steps are yielded one by one
+    while the output for Г, F |- G is read, so it can be a generator as well.
+
+    :return: generator of Steps (formula, message for printing)
     """
-    result = deque()
     i = 0            # index of formula name
+    proved = set()   # formulas F_i for which F -> F_i is already proved
 
     # induction
-    for f_i, mess in output:
-        if f_i.is_axiom or f_i in hypothesis:         # if F_i is axiom or F_i in Г
+    for step in output:
+        f_i = step.formula
+        if step.rule == MP and not (f_i in hypothesis or f_i == f):
+            # premises that aren't in the output (axioms used as is) need F -> F_r as well
+            for f_pre in step.premises:
+                if f_pre in proved:
+                    continue
+                proved.add(f_pre)
+                if f_pre == f:
+                    tmp = theorem_L(f, st_index + i, indexation=indexation)
+                    yield from tmp
+                    i += len(tmp)
+                    continue
+                f_pre1 = axiom_A1(f_pre, f)
+                f_pre2 = modus_pones(f_pre, f_pre1)
+                if indexation:
+                    f_pre1.name = NAME.format(st_index + i)
+                    f_pre2.name = NAME.format(st_index + i + 1)
+                i += 2
+                yield Step(f_pre1, AXIOM_A1, (), 'Axiom A1 for {} and {}', f_pre, f)
+                yield Step(f_pre2, MP, (f_pre, f_pre1), '(MP) for {} and  {}', f_pre, f_pre1)
+        proved.add(f_i)
+
+        if step.rule in AXIOM_RULES or f_i in hypothesis:         # if F_i is axiom or F_i in Г
 
             # formal output
             f_i1 = axiom_A1(f_i, f)
@@ -129,16 +371,15 @@ def theorem_deduction(hypothesis: list, f: Formula, output: deque, st_index=0, i
             if indexation:
                 f_next.name = NAME.format(st_index + i)
 
-            # adding to the deque
-            result.append((f_i1, MESSAGE.format(f_i1, f_i1.print_form(), f'Axiom A1 for {f_i} and {f}')))
-            result.append((f_next, MESSAGE.format(f_next, f_next.print_form(), f'(MP) for {f_i} and  {f_i1}')))
+            yield Step(f_i1, AXIOM_A1, (), 'Axiom A1 for {} and {}', f_i, f)
+            yield Step(f_next, MP, (f_i, f_i1), '(MP) for {} and  {}', f_i, f_i1)
 
         elif f_i == f:               # if F_i == F then it is enough to proof theorem L
-            tmp = theorem_L(f, st_index + i)
-            result += tmp
+            tmp = theorem_L(f, st_index + i, indexation=indexation)
+            yield from tmp
             i += len(tmp) - 1
-        elif f_i.by_modus_pones:     # if F_i was created as a result of any modus pones in the past
-            f_pre1, f_pre2 = f_i.from_modus_pones
+        elif step.rule == MP:        # if F_i was created as a result of any modus pones in the past
+            f_pre1, f_pre2 = step.premises
             tmp1 = f.implication(f_pre1)             # (F -> Fr)
             tmp2 = f.implication(f_pre2)             # (F -> Fs)
 
@@ -156,17 +397,108 @@ def theorem_deduction(hypothesis: list, f: Formula, output: deque, st_index=0, i
             if indexation:
                 f_i3.name = NAME.format(st_index + i)
 
-            # adding to the deque
-            result.append((f_i1, MESSAGE.format(f_i1, f_i1.print_form(), f'Axiom A2 for {f_pre1} and {f_pre2}')))
-            result.append((f_i2,
-                           MESSAGE.format(f_i2, f_i2.print_form(), f'(MP) for {f_i1} and {tmp2} ({tmp2} is above)')))
-            result.append((f_i3,
-                           MESSAGE.format(f_i3, f_i3.print_form(), f'(MP) for {tmp1} and {f_i2} ({tmp1} is above)')))
+            yield Step(f_i1, AXIOM_A2, (), 'Axiom A2 for {} and {}', f_pre1, f_pre2)
+            yield Step(f_i2, MP, (tmp2, f_i1), '(MP) for {} and {} ({} is above)', f_i1, tmp2, tmp2)
+            yield Step(f_i3, MP, (tmp1, f_i2), '(MP) for {} and {} ({} is above)', tmp1, f_i2, tmp1)
         else:
             raise Exception('something wrong')
 
         i += 1
-    return result
+
+
+def iter_shared_deduction(hypothesis: list, f: Formula, output):
+    """ Deduction theorem that keeps the steps which don't depend on F.
+
+    If F_i is proved without F then it is proved from Г as well, so such step
+    stays as is and isn't proved again for the other hypothesis instead of F.
+    F -> F_i for such formulas is built by the axiom A1 only when it's needed
+    for (MP). The last step is always F -> G.
+
+    Premises of (MP) could be not in the output if they are axioms or hypotheses (just like
+    in theorem_deduction) or G -> G (theorem L is used for it). The other premises without steps
+    are proved by the adequacy theorem if they are tautologies with only ! and ->, otherwise
+    ValueError is raised (as well as for the step that isn't an axiom, hypothesis or (MP)).
+
+    :param hypothesis: list of formulas-hypothesis
+    :param f: last hypothesis (param hypothesis doesn't have this formula)
+    :param output: formal output for Г, F |- G (iterable of Steps)
+    :return: generator of Steps without names
+    """
+    hypothesis = set(hypothesis)
+    independent = set()      # formulas of output that are proved without F
+    implications = {}        # {F_i: F -> F_i} for all the F -> F_i that are already proved
+
+    def given(g):
+        return g in independent or g in hypothesis or axiom_schema(g) is not None
+
+    f_i = None
+    for step in output:
+        f_i = step.formula
+        if f_i in implications or f_i in independent:
+            continue
+        if f_i == f:                 # if F_i == F then it is enough to proof theorem L
+            tmp = theorem_L(f, indexation=False)
+            yield from tmp
+            implications[f_i] = tmp[-1][0]
+        elif step.rule in AXIOM_RULES or f_i in hypothesis:
+            independent.add(f_i)
+        elif step.rule == MP:
+            f_pre1, f_pre2 = step.premises
+            if given(f_pre1) and given(f_pre2):
+                independent.add(f_i)
+                yield step
+                continue
+
+            for g in (f_pre1, f_pre2):
+                if g in implications:
+                    continue
+                if g == f:
+                    tmp = theorem_L(f, indexation=False)
+                    yield from tmp
+                    implications[g] = tmp[-1][0]
+                else:
+                    if not given(g):
+                        yield from _missing_steps(g)
+                        independent.add(g)
+                    yield from _implication_steps(g, f, implications)
+            tmp1 = implications[f_pre1]              # (F -> Fr)
+            tmp2 = implications[f_pre2]              # (F -> Fs)
+
+            f_i1 = axiom_A2(f, f_pre1, f_i)          # (F -> (Fr -> Fi)) -> ((F -> Fr) -> (F -> Fi))
+            f_i2 = modus_pones(tmp2, f_i1)
+            f_i3 = modus_pones(tmp1, f_i2)
+            implications[f_i] = f_i3
+
+            yield Step(f_i1, AXIOM_A2, (), 'Axiom A2 for {} and {}', f_pre1, f_pre2)
+            yield Step(f_i2, MP, (tmp2, f_i1), '(MP) for {} and {}', f_i1, tmp2)
+            yield Step(f_i3, MP, (tmp1, f_i2), '(MP) for {} and {}', tmp1, f_i2)
+        else:
+            raise ValueError(f'{f_i} is not an axiom, hypothesis or (MP) of the output')
+
+    if f_i is not None and f_i not in implications:
+        yield from _implication_steps(f_i, f, implications)
+
+
+def _missing_steps(g: Formula):
+    """ Proof of the premise that is used without the steps (see iter_shared_deduction).
+
+    G -> G is proved by theorem L, the other tautologies by the adequacy theorem.
+    """
+    if g.main_con == IMPLICATION and g.sons[0] == g.sons[1]:
+        return theorem_L(g.sons[0], indexation=False)
+    if not _connectives(g) <= {IMPLICATION, NOT, PASS} or not g.check_tautology():
+        raise ValueError(f'premise {g} is not proved and is not a tautology with only ! and ->')
+    return iter_adequacy_theorem(g, tmp_indexation=False, shared=True)
+
+
+def _implication_steps(g: Formula, f: Formula, implications: dict):
+    """ F -> G for G that is proved (or given) without F, using the axiom A1.
+    """
+    g1 = axiom_A1(g, f)
+    g2 = modus_pones(g, g1)
+    implications[g] = g2
+    yield Step(g1, AXIOM_A1, (), 'Axiom A1 for {} and {}', g, f)
+    yield Step(g2, MP, (g, g1), '(MP) for {} and {}', g, g1)
 
 
 def rule_S1(f_g: Formula, g_h: Formula, st_index=0, indexation=True):
@@ -185,7 +517,7 @@ def rule_S1(f_g: Formula, g_h: Formula, st_index=0, indexation=True):
     h = g_h.sons[1]
 
     if isinstance(f, Var):     # if f_g is (f -> g) where f is var, f is need to be converted to formula
-        f = Formula(PASS, {f}, f)
+        f = Formula(PASS, {f}, f).copy()
         f.name = f_g.sons[0].name
 
     # creates formal output from f_g, g_h, f to h
@@ -196,7 +528,7 @@ def rule_S1(f_g: Formula, g_h: Formula, st_index=0, indexation=True):
     f5 = modus_pones(f4, f3)
 
     # modify our formal output using deduction theorem
-    output = deque([(f1, ''), (f2, ''), (f3, ''), (f4, ''), (f5, '')])
+    output = deque([Step(f1), Step(f2), Step(f3), Step(f4, MP, (f1, f2)), Step(f5, MP, (f4, f3))])
     output = theorem_deduction([f_g, g_h], f, output, st_index, indexation=indexation)
     return f.implication(h), output
 
@@ -222,7 +554,7 @@ def rule_S2(f_g_h: Formula, g: Formula, st_index=0, indexation=True):
     f5 = modus_pones(f2, f4)
 
     # modify our formal output using deduction theorem
-    output = deque([(f1, ''), (f2, ''), (f3, ''), (f4, ''), (f5, '')])
+    output = deque([Step(f1), Step(f2), Step(f3), Step(f4, MP, (f1, f3)), Step(f5, MP, (f2, f4))])
     output = theorem_deduction([f_g_h, g], f1, output, st_index, indexation=indexation)
     return f1.implication(f_g_h.sons[1].sons[1]), output
 
@@ -233,13 +565,13 @@ def theorem_T1(f: Formula, st_index=0, indexation=True):
     :param f: formula
     :param st_index: first index of addition formula
     :param indexation: if True then each formula will have a name
-    :return: deque((formula, message for printing))
+    :return: deque of Steps (formula, message for printing)
     """
     output = deque()
     f1 = axiom_A3(f.neg(), f)
     if indexation:
         f1.name = NAME.format(st_index)
-    output.append((f1, MESSAGE.format(f1, f1.print_form(), f'Axiom A3 for {f} and {f.neg()}')))
+    output.append(Step(f1, AXIOM_A3, (), 'Axiom A3 for {} and {}', f, f.neg()))
 
     output += theorem_L(f.neg(), st_index=st_index + 1, indexation=indexation)
 
@@ -252,7 +584,7 @@ def theorem_T1(f: Formula, st_index=0, indexation=True):
     f4 = axiom_A1(tmp, tmp2)
     if indexation:
         f4.name = NAME.format(st_index + len(output))
-    output.append((f4, MESSAGE.format(f4, f4.print_form(), f'Axiom A1 for {tmp} and {tmp2}')))
+    output.append(Step(f4, AXIOM_A1, (), 'Axiom A1 for {} and {}', tmp, tmp2))
 
     f5, tmp_output = rule_S1(f4, f3, st_index=st_index + len(output), indexation=indexation)
     output += tmp_output
@@ -265,13 +597,13 @@ def theorem_T2(f: Formula, st_index=0, indexation=True):
     :param f: formula
     :param st_index: first index of addition formula
     :param indexation: if True then each formula will have a name
-    :return: deque((formula, message for printing))
+    :return: deque of Steps (formula, message for printing)
     """
     output = deque()
     f1 = axiom_A3(f, f.neg().neg())
     if indexation:
         f1.name = NAME.format(st_index)
-    output.append((f1, MESSAGE.format(f1, f1.print_form(), f'Axiom A3 for {f} and {f.neg().neg()}')))
+    output.append(Step(f1, AXIOM_A3, (), 'Axiom A3 for {} and {}', f, f.neg().neg()))
 
     output += theorem_T1(f.neg(), st_index=st_index+1, indexation=indexation)
 
@@ -280,12 +612,12 @@ def theorem_T2(f: Formula, st_index=0, indexation=True):
     f3 = modus_pones(f2, f1)
     if indexation:
         f3.name = NAME.format(st_index + len(output))
-    output.append((f3, MESSAGE.format(f3, f3.print_form(), f'(MP) for {f2} and {f1}')))
+    output.append(Step(f3, MP, (f2, f1), '(MP) for {} and {}', f2, f1))
 
     f4 = axiom_A1(f, f.neg().neg().neg())
     if indexation:
         f4.name = NAME.format(st_index + len(output))
-    output.append((f4, MESSAGE.format(f4, f4.print_form(), f'Axiom A1 for {f} and {f.neg().neg().neg()}')))
+    output.append(Step(f4, AXIOM_A1, (), 'Axiom A1 for {} and {}', f, f.neg().neg().neg()))
 
     f5, tmp_output = rule_S1(f4, f3, st_index=st_index + len(output), indexation=indexation)
     output += tmp_output
@@ -299,7 +631,7 @@ def theorem_T3(f: Formula, g: Formula, st_index=0, indexation=True):
     :param g: formula
     :param st_index: first index of addition formula
     :param indexation: if True then each formula will have a name
-    :return: deque((formula, message for printing))
+    :return: deque of Steps (formula, message for printing)
     """
 
     f1 = f.neg()                # !F
@@ -312,11 +644,11 @@ def theorem_T3(f: Formula, g: Formula, st_index=0, indexation=True):
     f8 = modus_pones(f6, f7)    # (!B -> A) -> B
     f9 = modus_pones(f4, f8)    # B
 
-    output = deque([(f1, ''), (f2, ''),
-                    (f3, ''), (f4, ''),
-                    (f5, ''), (f6, ''),
-                    (f7, ''), (f8, ''),
-                    (f9, '')])
+    output = deque([Step(f1), Step(f2),
+                    Step(f3, AXIOM_A1), Step(f4, MP, (f2, f3)),
+                    Step(f5, AXIOM_A1), Step(f6, MP, (f1, f5)),
+                    Step(f7, AXIOM_A3), Step(f8, MP, (f6, f7)),
+                    Step(f9, MP, (f4, f8))])
 
     output = theorem_deduction([f1], f2, output, indexation=False)
     output = theorem_deduction([], f1, output, st_index=st_index, indexation=indexation)
@@ -330,7 +662,7 @@ def theorem_T4(f: Formula, g: Formula, st_index=0, indexation=True):
     :param g: formula
     :param st_index: first index of addition formula
     :param indexation: if True then each formula will have a name
-    :return: deque((formula, message for printing))
+    :return: deque of Steps (formula, message for printing)
     """
     f1 = axiom_A3(f, g)
     f2 = (g.neg().implication(f.neg()))
@@ -339,7 +671,7 @@ def theorem_T4(f: Formula, g: Formula, st_index=0, indexation=True):
 
     f5, tmp_output = rule_S1(f4, f3, indexation=False)
 
-    output = deque([(f1, ''), (f2, ''), (f3, ''), (f4, '')]) + tmp_output
+    output = deque([Step(f1, AXIOM_A3), Step(f2), Step(f3, MP, (f2, f1)), Step(f4, AXIOM_A1)]) + tmp_output
     output = theorem_deduction([], f2, output, st_index=st_index, indexation=indexation)
     return output
 
@@ -351,11 +683,11 @@ def theorem_T5(f: Formula, g: Formula, st_index=0, indexation=True):
     :param g: formula
     :param st_index: first index of addition formula
     :param indexation: if True then each formula will have a name
-    :return: deque((formula, message for printing))
+    :return: deque of Steps (formula, message for printing)
     """
     f1 = axiom_A3(g.neg(), f.neg())
     f2 = f.implication(g)
-    output = deque([(f1, ''), (f2, '')])
+    output = deque([Step(f1, AXIOM_A3), Step(f2)])
     output += theorem_T2(g, indexation=False)
 
     f3 = output[-1][0]        # G -> !!G
@@ -370,10 +702,10 @@ def theorem_T5(f: Formula, g: Formula, st_index=0, indexation=True):
     output += tmp_output
 
     f7 = modus_pones(f6, f1)
-    output.append((f7, ''))
+    output.append(Step(f7, MP, (f6, f1)))
 
     f8 = axiom_A1(g.neg(), f.neg().neg())
-    output.append((f8, ''))
+    output.append(Step(f8, AXIOM_A1))
 
     f9, tmp_output = rule_S1(f8, f7, indexation=False)
     output += tmp_output
@@ -389,23 +721,24 @@ def theorem_T6(f: Formula, g: Formula, st_index=0, indexation=True):
     :param g: formula
     :param st_index: first index of addition formula
     :param indexation: if True then each formula will have a name
-    :return: deque((formula, message for printing))
+    :return: deque of Steps (formula, message for printing)
     """
     f1 = f
-    output = deque([(f1, '')])
+    output = deque([Step(f1)])
     output += theorem_T5(f.implication(g), g, indexation=False)
 
     f2 = output[-1][0]     # ((F -> G) -> G) -> (!G -> !(F -> G))
 
+    f_g = f.implication(g)
     tmp_output = theorem_deduction([f],
-                                   f.implication(g),
-                                   deque([(f, ''), (f.implication(g), ''), (modus_pones(f, f.implication(g)), '')]),
+                                   f_g,
+                                   deque([Step(f), Step(f_g), Step(modus_pones(f, f_g), MP, (f, f_g))]),
                                    indexation=False)
 
     output += tmp_output
     f3 = output[-1][0]     # (F -> G) -> G
     f4 = modus_pones(f3, f2)
-    output.append((f4, ''))
+    output.append(Step(f4, MP, (f3, f2)))
 
     output = theorem_deduction([], f, output, st_index=st_index, indexation=indexation)
     return output
@@ -417,16 +750,16 @@ def theorem_T7(f: Formula, g: Formula, st_index=0, indexation=True) -> deque:
     if isinstance(f, Var):
         f = Formula(PASS, {f}, f)
     f0 = f.implication(g)
-    output.append((f0, ''))
+    output.append(Step(f0))
     output += theorem_T5(f, g, indexation=False)
 
     f1 = output[-1][0]    # (F -> G) -> (!G -> !F)
     f2 = axiom_A3(f, g)
-    output.append((f2, ''))
+    output.append(Step(f2, AXIOM_A3))
     f3, tmp_output = rule_S1(f1, f2, indexation=False)
     output += tmp_output
     f4 = modus_pones(f0, f3)
-    output.append((f4, ''))
+    output.append(Step(f4, MP, (f0, f3)))
 
     output += theorem_T4(g.neg(), f, indexation=False)
     f5 = output[-1][0]          # (!F -> !!G) -> (!G -> F)
@@ -450,7 +783,7 @@ def _lemma_T7(f: Formula, g: Formula, st_index=0, indexation=True):
     :param g: formula
     :param st_index: first index of addition formula
     :param indexation: if True then each formula will have a name
-    :return: deque((formula, message for printing))
+    :return: deque of Steps (formula, message for printing)
     """
     f1 = f.neg()
     f2 = f.neg().implication(g)
@@ -459,60 +792,183 @@ def _lemma_T7(f: Formula, g: Formula, st_index=0, indexation=True):
     f4 = tmp_output[-1][0]
     f5 = modus_pones(f3, f4)
 
-    output = deque([(f1, ''), (f2, ''), (f3, '')]) + tmp_output + deque([(f4, ''), (f5, '')])
+    output = deque([Step(f1), Step(f2), Step(f3, MP, (f1, f2))]) + tmp_output + \
+        deque([Step(f4, MP, tmp_output[-1].premises), Step(f5, MP, (f3, f4))])
     output = theorem_deduction([f2], f1, output, indexation=False)
     output = theorem_deduction([], f2, output, st_index=st_index, indexation=indexation)
     return output
 
 
-def lemma_Kalmar(f: Formula, st_index=0, indexation=True) -> deque:
-    """ Kalmar's lemma for f and its variables that already have own values
+class KalmarCache:
+    """ LRU cache of the outputs of Kalmar's lemma without names.
+
+    Output for subformula depends only on the values of its own variables,
+    so the key is (subformula, values of its variables in the order of their indexes).
+    Outputs are kept with the hash-consed formulas only and each get returns the new copies
+    of them, so the names given to the output later (see unique_steps) don't go to the other proofs.
+    """
+
+    def __init__(self, maxsize=KALMAR_CACHE_SIZE):
+        """
+        :param maxsize: maximal number of outputs in cache (None for unlimited cache)
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._outputs = OrderedDict()
+
+    @staticmethod
+    def key(f, assignment: dict) -> tuple:
+        values = 0
+        mask = f.var_mask
+        while mask:
+            low = mask & -mask
+            values = values << 1 | Var._all[low.bit_length() - 1].evaluate(assignment)
+            mask ^= low
+        return f, values
+
+    def get(self, key):
+        """ Output for the key (list of Steps with the new formulas) or None
+        (and move it to the end of the queue).
+        """
+        packed = self._outputs.get(key)
+        if packed is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._outputs.move_to_end(key)
+        records, steps = packed
+        formulas = []
+        for x, sons, copy in records:
+            if sons is not None:          # the new object with the same sons as the original one
+                x = Formula(x.main_con, None, *(formulas[i] for i in sons))
+                if copy:
+                    x = x.copy()
+            formulas.append(x)
+        return [Step(formulas[x], rule, tuple(formulas[i] for i in premises), basis, *(formulas[i] for i in args))
+                for x, rule, premises, basis, args in steps]
+
+    def put(self, key, output):
+        """ Store the output without names: (records, steps) like pack_steps, but the record is
+        (hash-consed formula, sons, copy), where sons is None for the hash-consed formulas (and variables)
+        that are used as they are, so the table has only the parts of formulas that are built from the copies.
+        """
+        indexes = {}         # {id(formula): index in records}
+        records = []         # all the formulas are alive while the output is, so ids aren't reused
+
+        def index(x):
+            if id(x) in indexes:
+                return indexes[id(x)]
+            stack = [(x, False)]
+            while stack:                   # iterative post-order traversal
+                node, ready = stack.pop()
+                if id(node) in indexes:
+                    continue
+                if isinstance(node, Var) or node._canon is node:
+                    record = (node, None, False)
+                else:
+                    if not ready:
+                        stack.append((node, True))
+                        stack.extend((son, False) for son in node.sons if id(son) not in indexes)
+                        continue
+                    record = (node._canon, tuple(indexes[id(son)] for son in node.sons),
+                              isinstance(node, NamedFormula))
+                indexes[id(node)] = len(records)
+                records.append(record)
+            return indexes[id(x)]
+
+        steps = [(index(step.formula), step.rule, tuple(index(x) for x in step.premises), step._basis,
+                  tuple(index(x) for x in step._args)) for step in output]
+        self._outputs[key] = records, steps
+        if self.maxsize is not None and len(self._outputs) > self.maxsize:
+            self._outputs.popitem(last=False)
+
+    def clear(self):
+        self._outputs.clear()
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._outputs)
+
+    def __repr__(self):
+        return f'KalmarCache(hits={self.hits}, misses={self.misses}, size={len(self)}, maxsize={self.maxsize})'
+
+
+def lemma_Kalmar(f: Formula, st_index=0, indexation=True, assignment=None, cache=None) -> deque:
+    """ Kalmar's lemma for f and the given values of its variables
 
     :param f: Formula
     :param st_index: first index of addition formula
     :param indexation: if True then each formula will have a name
-    :return: deque((formula, message for printing))
+    :param assignment: {Var: value}, by default variables' own values are used
+    :param cache: KalmarCache for the outputs without names (it's used by the subformulas as well)
+    :return: deque of Steps (formula, message for printing)
     """
+    if assignment is None:
+        assignment = {var: var() for var in f.vars}
+    if cache is None or indexation:
+        return _lemma_Kalmar(f, st_index, indexation, assignment, cache)
+
+    key = cache.key(f, assignment)
+    output = cache.get(key)
+    if output is None:
+        output = _lemma_Kalmar(f, 0, False, assignment, cache)
+        cache.put(key, output)
+    return deque(output)
+
+
+def _lemma_Kalmar(f: Formula, st_index, indexation, assignment, cache) -> deque:
     if f.operations_count == 0:
-        tmp = f.pow_alpha()
+        tmp = f.pow_alpha(assignment).copy()
         if indexation:
             tmp.name = NAME.format(st_index)
-        output = deque([(tmp, MESSAGE.format(tmp, tmp.print_form(),
-                                             'from hypothesis'))])
+        output = deque([Step(tmp, HYPOTHESIS, (), 'from hypothesis')])
 
     else:
         if f.main_con == NOT:
-            if f():
-                output = lemma_Kalmar(f.sons[0], st_index=st_index, indexation=indexation)
+            if f.evaluate(assignment):
+                output = lemma_Kalmar(f.sons[0], st_index=st_index, indexation=indexation, assignment=assignment,
+                                      cache=cache)
             else:
-                output = lemma_Kalmar(f.sons[0], st_index=st_index, indexation=indexation)
-                output += theorem_T2(output[-1][0], st_index=st_index + len(output), indexation=indexation)
+                output = lemma_Kalmar(f.sons[0], st_index=st_index, indexation=indexation, assignment=assignment,
+                                      cache=cache)
+                g = output[-1][0]
+                output += theorem_T2(g, st_index=st_index + len(output), indexation=indexation)
+                tmp = output[-1][0]          # G -> !!G
+                res = modus_pones(g, tmp)
+                if indexation:
+                    res.name = NAME.format(st_index + len(output))
+                output.append(Step(res, MP, (g, tmp), '(MP) to {} and {}', g, tmp))
         else:
-            if not f.sons[0]():
-                output = lemma_Kalmar(f.sons[0], st_index=st_index, indexation=indexation)
+            if not f.sons[0].evaluate(assignment):
+                output = lemma_Kalmar(f.sons[0], st_index=st_index, indexation=indexation, assignment=assignment,
+                                      cache=cache)
                 g = output[-1][0]
                 output += theorem_T3(f.sons[0], f.sons[1], st_index=st_index+len(output), indexation=indexation)
                 tmp = output[-1][0]
                 res = modus_pones(g, tmp)
                 if indexation:
                     res.name = NAME.format(st_index+len(output))
-                output.append((res, MESSAGE.format(res, res.print_form(), f'(MP) to {g} and {tmp}')))
-            elif f.sons[1]():
-                output = lemma_Kalmar(f.sons[1], st_index=st_index, indexation=indexation)
+                output.append(Step(res, MP, (g, tmp), '(MP) to {} and {}', g, tmp))
+            elif f.sons[1].evaluate(assignment):
+                output = lemma_Kalmar(f.sons[1], st_index=st_index, indexation=indexation, assignment=assignment,
+                                      cache=cache)
                 h = output[-1][0]
                 tmp = axiom_A1(h, f.sons[0])
                 if indexation:
                     tmp.name = NAME.format(st_index + len(output))
-                output.append((tmp, MESSAGE.format(tmp, tmp.print_form(), f'Axiom A1 for {h} and {f.sons[0]}')))
+                output.append(Step(tmp, AXIOM_A1, (), 'Axiom A1 for {} and {}', h, f.sons[0]))
                 res = modus_pones(h, tmp)
                 if indexation:
                     res.name = NAME.format(st_index + len(output))
 
-                output.append((res, MESSAGE.format(res, res.print_form(), f'(MP) to {h} and {tmp}')))
+                output.append(Step(res, MP, (h, tmp), '(MP) to {} and {}', h, tmp))
             else:
-                output = lemma_Kalmar(f.sons[0], st_index=st_index, indexation=indexation)
+                output = lemma_Kalmar(f.sons[0], st_index=st_index, indexation=indexation, assignment=assignment,
+                                      cache=cache)
                 g = output[-1][0]
-                output += lemma_Kalmar(f.sons[1], st_index=st_index, indexation=indexation)
+                output += lemma_Kalmar(f.sons[1], st_index=st_index, indexation=indexation, assignment=assignment,
+                                       cache=cache)
                 h = output[-1][0]
 
                 output += theorem_T6(f.sons[0], f.sons[1], st_index=st_index+len(output), indexation=indexation)
@@ -524,96 +980,382 @@ def lemma_Kalmar(f: Formula, st_index=0, indexation=True) -> deque:
                     res.name = NAME.format(st_index + len(output))
                     res2.name = NAME.format(st_index + len(output) + 1)
 
-                output.append((res, MESSAGE.format(res, res.print_form(), f'(MP) for {g} and {tmp}')))
-                output.append((res2, MESSAGE.format(res2, res2.print_form(), f'(MP) for {h} and {res}')))
+                output.append(Step(res, MP, (g, tmp), '(MP) for {} and {}', g, tmp))
+                output.append(Step(res2, MP, (h, res), '(MP) for {} and {}', h, res))
 
     return output
 
 
-def adequacy_theorem(f: Formula, st_index=0, tmp_indexation=True):
+def adequacy_theorem(f: Formula, st_index=0, tmp_indexation=True, shared=False, cache=None, workers=None):
     """ Proofing tautology F like a theorem using algorithm from
     adequacy theorem.
 
     :param f: Formula (tautology)
     :param st_index: first index of addition formula
     :param tmp_indexation: if True then each formula will have a name
-    :return: deque((formula, message for printing))
+    :param shared: if True then each formula is proved only once (see unique_steps)
+    :param cache: KalmarCache for the outputs of Kalmar's lemma (new one by default)
+    :param workers: number of processes (see iter_adequacy_theorem), by default everything is done in this process
+    :return: deque of Steps (formula, message for printing)
+    """
+    return deque(iter_adequacy_theorem(f, st_index, tmp_indexation, shared, cache, workers))
+
+
+def iter_adequacy_theorem(f: Formula, st_index=0, tmp_indexation=True, shared=False, cache=None, workers=None):
+    """ Same with adequacy_theorem, but the steps are yielded in the order of the output
+    as soon as they are built.
+
+    Output for the values of first k variables consists of two outputs for k + 1 variables
+    (passed through the deduction theorem) and theorem T7, so all the outputs are
+    the nested generators and only one branch of the 2^n ones is in memory at the same time.
+
+    With workers > 1 the outputs for the values of the first k variables (Kalmar's lemma and
+    the elimination of the rest variables) are built by the processes, 2^k >= PROOF_SHARDS_PER_WORKER * workers,
+    and are sent back by pack_steps. Only the last k levels are done in this process.
+    The output is the same: in the shared mode the steps of theorem T7 are sent back too and
+    replaced by the outputs of this process, so the shared formulas are the same objects (with
+    the same names) as in the serial mode.
+
+    :param f: Formula (tautology)
+    :param st_index: first index of addition formula
+    :param tmp_indexation: if True then each formula will have a name
+    :param shared: if True then each formula is proved only once (see unique_steps)
+    :param cache: KalmarCache for the outputs of Kalmar's lemma (new one by default)
+    :param workers: number of processes, by default everything is done in this process
+    :return: generator of Steps (formula, message for printing)
     """
     if not f.check_tautology():
         raise ValueError(f"{f} isn't tautology!")
-
-    # -----------------build the outputs for all the combinations of variables value using Kalmar lemma-----------------
-    outputs = {}
+    if not _connectives(f) <= {IMPLICATION, NOT, PASS}:
+        raise ValueError(f"{f} has the connectives other than {NOT} and {IMPLICATION}, "
+                         f"use eliminate(f, BASIS_IMPLICATION)")
+    if cache is None:
+        cache = KalmarCache()
     variables = list(f.vars)
-    for el in product([True, False], repeat=len(variables)):
-        [var.set_val(val) for var, val in zip(variables, el)]
-        output_id = ''.join([str(int(var())) for var in variables])
-        outputs[output_id] = lemma_Kalmar(f, indexation=False)    # dictionary {sequence of variables values: output}
+    t7_outputs = {} if shared else None
 
-    # -----------------------------do all the actions without the indexing----------------------------------------------
-    while len(variables) > 1:
-        last_var = variables.pop()
-        for el in product([True, False], repeat=len(variables)):
-            [var.set_val(val) for var, val in zip(variables, el)]         # set value for n-1 variables
-            output_id = ''.join([str(int(var())) for var in variables])   # sequence of n-1 variables
+    split = outputs = None
+    if workers is not None and workers > 1:
+        split = min(len(variables), (PROOF_SHARDS_PER_WORKER * workers - 1).bit_length())
+        outputs = _prefix_outputs(f, variables, split, shared, workers)
 
-            last_var.set_val(1)
-            tmp_output_id = output_id + str(int(last_var()))
+    steps = _adequacy_steps(f, variables, (), cache, st_index, tmp_indexation, t7_outputs, split, outputs)
+    if not shared:
+        return steps
+    return unique_steps(steps, st_index, tmp_indexation, f)
 
-            # use the deduction theorem to build output from n-1 variables
-            hypothesis = [Formula(PASS, {var}, var).pow_alpha() for var in variables]
-            tmp_output = theorem_deduction(hypothesis, Formula(PASS, {last_var}, last_var).pow_alpha(),
-                                           outputs[tmp_output_id], indexation=False)
 
-            last_var.set_val(0)
-            tmp_output_id = output_id + str(int(last_var()))
+def _prefix_outputs(f: Formula, variables: list, split: int, shared: bool, workers: int):
+    """ Packed outputs for all the values of the first split variables
+    in the order of product([True, False], repeat=split), built by the pool of processes.
 
-            tmp_output2 = theorem_deduction(hypothesis, Formula(PASS, {last_var}, last_var).pow_alpha(),
-                                            outputs[tmp_output_id], indexation=False)
+    At most 2 outputs for each worker are waiting in memory.
 
-            f1 = tmp_output[-1][0]    # xn -> F
-            f2 = tmp_output2[-1][0]   # !xn -> F
+    :return: generator of (values, packed output, packed outputs of theorem T7) (see _prefix_output)
+    """
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        try:
+            for values in product([True, False], repeat=split):
+                pending.append(executor.submit(_prefix_output, f, variables, values, shared))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:            # the proof could be finished earlier (see unique_steps)
+            for future in pending:
+                future.cancel()
+
+
+def _prefix_output(f: Formula, variables: list, values: tuple, shared: bool) -> tuple:
+    """ Packed output of F from the hypothesis x1^a1, ..., xk^ak (in the worker process).
+
+    :return: values, result of pack_steps, {name of variable: records of the steps of theorem T7
+             (see FormulaTable.pack)} in the shared mode (empty otherwise)
+    """
+    t7_outputs = {} if shared else None
+    table = FormulaTable()
+    packed = [table.pack(step) for step in _adequacy_steps(f, variables, values, KalmarCache(),
+                                                           t7_outputs=t7_outputs)]
+    t7_packed = {var.name: [table.pack(step) for step in output] for var, output in (t7_outputs or {}).items()}
+    return values, (table.records, packed), t7_packed
+
+
+def _adequacy_steps(f: Formula, variables: list, values: tuple, cache: KalmarCache, st_index=0, indexation=True,
+                    t7_outputs=None, split=None, outputs=None):
+    """ Output of F from the hypothesis x1^a1, ..., xk^ak, where k = len(values).
+
+    Only the top level (without values) has names, the nested
+    outputs are used by the deduction theorem only.
+
+    :param variables: all the variables of F in the fixed order
+    :param values: values a1, ..., ak of the first k variables
+    :param cache: KalmarCache for the outputs of Kalmar's lemma
+    :param t7_outputs: None or dictionary {variable: output of theorem T7}, if it is given
+                       then the outputs are shared (see iter_shared_deduction and unique_steps)
+    :param split: number of the first variables for which the outputs are taken from outputs
+    :param outputs: iterator of (values, packed output, packed outputs of theorem T7) (see _prefix_outputs)
+    :return: generator of Steps
+    """
+    if len(values) == split:
+        for prefix, packed, t7_packed in outputs:      # the skipped outputs aren't needed (see unique_steps)
+            if prefix == values:
+                known = {}          # formulas of theorem T7 from the worker are replaced by the shared ones
+                for name, records in t7_packed.items():
+                    var = Var(name)
+                    tmp_output = t7_outputs.get(var)
+                    if tmp_output is None:
+                        tmp_output = t7_outputs[var] = theorem_T7(var, f, indexation=False)
+                    for (x, _, premises, _, args), step in zip(records, tmp_output):
+                        known[x] = step.formula
+                        known.update(zip(premises, step.premises))
+                        known.update(zip(args, step._args))
+                yield from unpack_steps(packed, variables, known)
+                return
+
+    assignment = dict(zip(variables, values))
+    if len(values) == len(variables):
+        yield from lemma_Kalmar(f, indexation=False, assignment=assignment, cache=cache)
+        return
+
+    shared = t7_outputs is not None
+    top = not values
+    indexation = indexation and top and not shared      # shared output is named by unique_steps
+    last_var = variables[len(values)]
+    hypothesis = [Formula(PASS, None, var).pow_alpha(assignment) for var in variables[:len(values)]]
+
+    # use the deduction theorem to build output from k variables: xk+1 -> F, !xk+1 -> F
+    count = 0
+    last = []
+    for value in (True, False):
+        step = None
+        last_hypothesis = Formula(PASS, None, last_var).pow_alpha({last_var: value})
+        nested = _adequacy_steps(f, variables, values + (value,), cache, t7_outputs=t7_outputs,
+                                 split=split, outputs=outputs)
+        if shared:
+            steps = iter_shared_deduction(hypothesis, last_hypothesis, unique_steps(nested, target=f))
+        else:
+            steps = iter_theorem_deduction(hypothesis, last_hypothesis, nested,
+                                           st_index + count if top else st_index, indexation)
+        for step in steps:
+            count += 1
+            yield step
+        last.append(step.formula)
+    f1, f2 = last
+
+    if not shared:
+        tmp_output = theorem_T7(last_var, f, st_index=st_index + count if top else st_index, indexation=indexation)
+    else:            # the same for all the values of the first variables
+        tmp_output = t7_outputs.get(last_var)
+        if tmp_output is None:
+            tmp_output = t7_outputs[last_var] = theorem_T7(last_var, f, indexation=False)
+    yield from tmp_output          # (xn -> F) -> ((!xn -> F) -> F)
+    count += len(tmp_output)
+
+    f3 = tmp_output[-1][0]
+    f4 = modus_pones(f1, f3)
+    f5 = modus_pones(f2, f4)
+    if indexation:
+        f4.name = NAME.format(st_index + count)
+        f5.name = NAME.format(st_index + count + 1)
+    yield Step(f4, MP, (f1, f3), '(MP) for {} and {}', f1, f3)
+    yield Step(f5, MP, (f2, f4), '(MP) for {} and {}', f2, f4)
 
-            tmp_output3 = theorem_T7(last_var, f, indexation=False)   # (xn -> F) -> ((!xn -> F) -> F)
 
-            f3 = tmp_output3[-1][0]   # (xn -> F) -> ((!xn -> F) -> F)
-            f4 = modus_pones(f1, f3)
-            f5 = modus_pones(f2, f4)
+def unique_steps(steps, st_index=0, indexation=False, target=None):
+    """ Remove the steps with the formulas that are already proved above.
 
-            output = tmp_output + tmp_output2 + tmp_output3
-            output.append((f4, ''))
-            output.append((f5, ''))
-            outputs[output_id] = output
+    The steps that use such formula (MP or messages) refer to the first
+    its proof, so the result is still a correct formal output, but
+    each formula is proved only once.
 
-    # ----------------------------do the last action with indexing (same with above)------------------------------------
-    last_var = variables.pop()
-    last_var.set_val(1)
-    tmp_output_id = str(int(last_var()))
-    tmp_output = theorem_deduction([], Formula(PASS, {last_var}, last_var).pow_alpha(),
-                                   outputs[tmp_output_id], st_index=st_index, indexation=tmp_indexation)
+    :param steps: iterable of Steps
+    :param st_index: first index of addition formula
+    :param indexation: if True then formulas are renamed in the new order, and repeated
+                       formulas get the name of the first proof
+    :param target: if the step with this formula is found then it is the last step
+    :return: generator of Steps
+    """
+    proved = {}         # {formula: name}
+    for step in steps:
+        formula = step.formula
+        name = proved.get(formula)
+        if name is not None:
+            if indexation:
+                formula.name = name
+            continue
 
-    last_var.set_val(0)
-    tmp_output_id = str(int(last_var()))
-    tmp_output2 = theorem_deduction([], Formula(PASS, {last_var}, last_var).pow_alpha(),
-                                    outputs[tmp_output_id], st_index=st_index + len(tmp_output), indexation=tmp_indexation)
+        if indexation:
+            formula.name = NAME.format(st_index + len(proved))
+        proved[formula] = formula.name
+        yield step
+        if target is not None and formula == target:
+            return
 
-    f1 = tmp_output[-1][0]
-    f2 = tmp_output2[-1][0]
 
-    tmp_output3 = theorem_T7(last_var, f, st_index=st_index + len(tmp_output) + len(tmp_output2), indexation=tmp_indexation)
-    output = tmp_output + tmp_output2 + tmp_output3
+class _TableRef(weakref.ref):
+    """ Weak reference to the formula of FormulaTable with its id and index in the table.
+    """
+    __slots__ = ('key', 'index')
 
-    f3 = tmp_output3[-1][0]     # (xn -> F) -> ((!xn -> F) -> F)
-    f4 = modus_pones(f1, f3)
-    if tmp_indexation:
-        f4.name = NAME.format(st_index + len(output))
-    f5 = modus_pones(f2, f4)
-    if tmp_indexation:
-        f5.name = NAME.format(st_index + len(output) + 1)
+    def __new__(cls, x, callback, index):
+        self = weakref.ref.__new__(cls, x, callback)
+        self.key = id(x)
+        self.index = index
+        return self
 
-    output.append((f4, MESSAGE.format(f4, f4.print_form(), f'(MP) for {f1} and {f3}')))
-    output.append((f5, MESSAGE.format(f5, f5.print_form(), f'(MP) for {f2} and {f4}')))
-    return output
+    def __init__(self, x, callback, index):
+        super().__init__(x, callback)
+
+
+class FormulaTable:
+    """ Table of all the formulas of the steps (with their sons), sons go before their parents.
+
+    Record of the table is (None, name) for variable and (main_con, sons, copy, name) for formula,
+    where sons are indexes in the table and copy is True for the named copies
+    (see Formula.copy). Records could be removed from the list (for example, when they are already
+    written to the file), indexes of the next ones don't change.
+
+    The table doesn't keep the formulas of the proof alive. Variables are stored once,
+    hash-consed formulas and named copies keep their index while they are alive (it's forgotten
+    with the formula, so the same index is always the same object). Formulas that are built
+    from the copies are stored again for each step that has them.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.count = 0           # number of formulas in the table
+        self._variables = {}     # {name: index in the table}
+        self._alive = {}         # {id(hash-consed formula or named copy): _TableRef}
+        self._built = {}         # {id(formula built from copies): index} for the current step
+        alive = self._alive
+        self._forget = lambda ref: alive.get(ref.key) is ref and alive.pop(ref.key)     # formula is removed
+
+    def _find(self, x):
+        """ Index of the formula or None if it isn't in the table.
+        """
+        if isinstance(x, Var):
+            return self._variables.get(x.name)
+        if x._canon is x or isinstance(x, NamedFormula):
+            ref = self._alive.get(id(x))
+            return None if ref is None else ref.index
+        return self._built.get(id(x))
+
+    def _add(self, x, record):
+        if isinstance(x, Var):
+            self._variables[x.name] = self.count
+        elif x._canon is x or isinstance(x, NamedFormula):
+            self._alive[id(x)] = _TableRef(x, self._forget, self.count)
+        else:
+            self._built[id(x)] = self.count
+        self.count += 1
+        self.records.append(record)
+
+    def index(self, x) -> int:
+        """ Index of the formula in the table (formula and its parts are added if they aren't there).
+        """
+        find = self._find
+        index = find(x)
+        if index is not None:
+            return index
+        stack = [(x, False)]
+        while stack:                   # iterative post-order traversal
+            node, ready = stack.pop()
+            if find(node) is not None:
+                continue
+            if isinstance(node, Var):
+                record = (None, node.name)
+            else:
+                if not ready:
+                    stack.append((node, True))
+                    stack.extend((son, False) for son in node.sons if find(son) is None)
+                    continue
+                record = (node.main_con, tuple(find(son) for son in node.sons), isinstance(node, NamedFormula),
+                          node.name)
+            self._add(node, record)
+        return find(x)
+
+    def pack(self, step: Step) -> tuple:
+        """ Record of the step: (formula, rule, premises, basis, args) with the indexes of formulas.
+        """
+        self._built.clear()
+        return (self.index(step.formula), step.rule, tuple(self.index(x) for x in step.premises), step._basis,
+                tuple(self.index(x) for x in step._args))
+
+    def __len__(self):
+        return self.count
+
+
+def pack_steps(steps) -> tuple:
+    """ Compact form of the steps for sending them to the other process (by pickle).
+
+    :param steps: iterable of Steps
+    :return: (records of FormulaTable, list of records of steps (see FormulaTable.pack))
+    """
+    table = FormulaTable()
+    packed = [table.pack(step) for step in steps]
+    return table.records, packed
+
+
+def _unpack_formula(record, formulas, variables):
+    """ Formula from the record of FormulaTable.
+
+    :param formulas: sequence of formulas from the table (for sons)
+    :param variables: {name: Var} that are used instead of the variables with the same names
+    """
+    if record[0] is None:
+        name = record[1]
+        return variables[name] if name in variables else Var(name)
+
+    main_con, sons, copy, name = record
+    x = Formula(main_con, None, *(formulas[i] for i in sons))
+    if copy:
+        x = x.copy()
+        x.name = name
+    return x
+
+
+def unpack_steps(data: tuple, variables, known=None) -> list:
+    """ Steps from pack_steps.
+
+    :param data: result of pack_steps
+    :param variables: iterable of variables that are used instead of the variables with the same names
+    :param known: {index in the table: formula} that are used instead of the records
+    :return: list of Steps
+    """
+    table, packed = data
+    variables = {var.name: var for var in variables}
+    known = {} if known is None else known
+    formulas = []
+    for i, record in enumerate(table):
+        formulas.append(known[i] if i in known else _unpack_formula(record, formulas, variables))
+
+    return [Step(formulas[x], rule, tuple(formulas[i] for i in premises), basis, *(formulas[i] for i in args))
+            for x, rule, premises, basis, args in packed]
+
+
+def write_proof(steps, file, batch_size=PROOF_BATCH_SIZE):
+    """ Write messages of the steps to the file (one per line) by batches,
+    so the proof isn't kept in memory.
+
+    :param steps: iterable of Steps
+    :param file: text file
+    :param batch_size: number of lines in one write
+    :return: number of written steps, last Step (or None)
+    """
+    count = 0
+    step = None
+    batch = []
+    for step in steps:
+        batch.append(step.message)
+        if len(batch) >= batch_size:
+            file.write('\n'.join(batch) + '\n')
+            count += len(batch)
+            batch.clear()
+    if batch:
+        file.write('\n'.join(batch) + '\n')
+        count += len(batch)
+    return count, step
 
 
 if __name__ == '__main__':
@@ -7,13 +7,24 @@
 # Taras Shevchenko National University of Kyiv
 # email: davendiy@gmail.com
 
+import os
+
 from logic_expressions import *
+from logic_expressions.store import *
 
-with open('output.txt', 'w', encoding='utf-8') as file:
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))     # store and binary proof are kept next to the script
+PROOF_PATH = os.path.join(DIRECTORY, 'output.proof')
+
+print("Please, enter the tautology using any names for variables, '->' for implication and '!' for NOT")
+f = parse(input('--> '))
 
-    print("Please, enter the tautology using any names for variables, '->' for implication and '!' for NOT")
-    f = parse(input('--> '))
-    test_output = adequacy_theorem(f)
-    file.write(f'last formula: {test_output[-1][1]}\n\n\n')
-    for _, message in test_output:
-        file.write(message + '\n')
+# the last formula goes first, so the proof is streamed to the binary file (see proof_file.py)
+# and then rendered to the text after it, proofs and checks of the previous runs are taken from the store
+store = ProofStore(os.path.join(DIRECTORY, STORE_PATH))
+Formula.store = store
+with store:
+    _, last_step = store.write_proof_file(f, PROOF_PATH, lambda: iter_adequacy_theorem(f, shared=True))
+
+with open('output.txt', 'w', encoding='utf-8') as file:
+    file.write(f'last formula: {last_step.message}\n\n\n')
+    write_proof_text(PROOF_PATH, file)
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*-encoding: utf-8-*-
+
+""" Checking tautologies in the file with one formula per line, results are JSON lines.
+
+python main_bulk.py formulas.txt -o results.jsonl --workers 4
+cat formulas.txt | python main_bulk.py > results.jsonl
+"""
+
+import argparse
+import io
+import sys
+
+from logic_expressions.bulk import *
+
+parser = argparse.ArgumentParser(description='Check tautologies (one formula per line).')
+parser.add_argument('input', nargs='?', help='file with formulas (stdin by default)')
+parser.add_argument('-o', '--output', help='file for results (stdout by default)')
+parser.add_argument('-w', '--workers', type=int, default=None, help='number of processes')
+parser.add_argument('-b', '--batch-size', type=int, default=BATCH_SIZE, help='formulas in one batch')
+parser.add_argument('-e', '--engine', default=AUTO_ENGINE,
+                    choices=[AUTO_ENGINE, TABLE_ENGINE, GRAY_ENGINE, SAT_ENGINE, BDD_ENGINE])
+args = parser.parse_args()
+
+if args.input is None:
+    src = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+else:
+    src = open(args.input, encoding='utf-8', buffering=BUFFER_SIZE)
+if args.output is None:
+    dst = sys.stdout
+else:
+    dst = open(args.output, 'w', encoding='utf-8', buffering=BUFFER_SIZE)
+
+with src, dst:
+    count, seconds = check_file(src, dst, args.batch_size, args.workers, args.engine)
+
+print(f'checked {count} formulas in {seconds:.2f} s ({count / seconds if seconds else 0:.0f} formulas/s)',
+      file=sys.stderr)
@@ -7,7 +7,13 @@
 # Taras Shevchenko National University of Kyiv
 # email: davendiy@gmail.com
 
+import os
+
 from logic_expressions.parser import *
+from logic_expressions.store import *
+
+# results of the previous runs are used, the store is next to the script (see .gitignore)
+Formula.store = ProofStore(os.path.join(os.path.dirname(os.path.abspath(__file__)), STORE_PATH))
 
 print("Syntax: not - '!', implication - '->', and - '&', or - '|', equiv - '<->', xor - '^'")
 print("Each formula should be in parenthesis except variants when formula is just one variable.")
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+# -*-encoding: utf-8-*-
+
+""" Random formulas for the tests and benchmarks (tests.py, bench_decomposition.py).
+"""
+
+from logic_expressions import *
+
+
+def random_formula(generator, names, size, connectives=BINARY) -> str:
+    """ Text of the random formula with size binary connectives.
+
+    :param generator: random.Random
+    :param names: names of the variables
+    :param size: number of binary connectives
+    :param connectives: binary connectives that are chosen
+    :return: str (see parse)
+    """
+    if size == 0:
+        name = generator.choice(names)
+        return f'(!{name})' if generator.random() < 0.3 else name
+    left = generator.randrange(size)
+    res = '({} {} {})'.format(random_formula(generator, names, left, connectives), generator.choice(connectives),
+                              random_formula(generator, names, size - 1 - left, connectives))
+    return f'(!{res})' if generator.random() < 0.2 else res
@@ -17,8 +17,16 @@ sys.stdout = file
 
 F = parse('(((A -> B) -> A) -> A)')
 print('Theorem (((A -> B) -> A) -> A)')
-test_output = adequacy_theorem(F)
-for _, message in test_output:
-    print(message)
+write_proof(iter_adequacy_theorem(F), file)
 
 file.close()
+
+sys.stdout = sys.__stdout__
+verify_proof(iter_adequacy_theorem(F))
+verify_proof(iter_adequacy_theorem(F, shared=True))
+
+# parallel output is the same as the serial one (4 variables, so theorem T7 is in the workers' outputs)
+G = parse('(((A -> B) -> (C -> A)) -> (D -> (C -> A)))')
+serial = [step.message for step in iter_adequacy_theorem(G, shared=True)]
+assert [step.message for step in iter_adequacy_theorem(G, shared=True, workers=2)] == serial
+print('the proofs are correct')
@@ -8,14 +8,41 @@
 # email: davendiy@gmail.com
 
 from logic_expressions import *
+from logic_expressions import bdd, proof_file
+from logic_expressions.bdd import BDD, MIN_CACHE_BITS, bdd_equivalent
+from logic_expressions.bulk import check_file
+from logic_expressions.sat import CDCLSolver
+from logic_expressions.store import ProofStore
+from random_formulas import random_formula
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import gc
+import io
+import json
+import math
+import os
+import random
+import re
+import sqlite3
 import sys
+import tempfile
+import warnings
+import weakref
+
+
+def check_counterexample(f, counterexample, engine=None):
+    """ Counterexample is found if and only if the truth table has it, and f is False for it.
+    """
+    expected = f.find_counterexample(engine=TABLE_ENGINE, decompose=False)
+    assert (counterexample is None) == (expected is None), (f, engine)
+    assert counterexample is None or not f.evaluate(counterexample), (f, engine)
 
 # -------------------------------------------test theorem L-------------------------------------------------------------
 
 file = open('tests/theorem_l_test.txt', 'w', encoding='utf-8')
 sys.stdout = file
 
-F = parse('(A -> B)')
+F = parse('(A -> B)').copy()
 F.name = 'F'
 test_output = theorem_L(F, 1)
 
@@ -30,7 +57,7 @@ file.close()
 file = open('tests/theorem_deduction_test.txt', 'w', encoding='utf-8')
 sys.stdout = file
 
-test_g = parse('(F -> F)')
+test_g = parse('(F -> F)').copy()
 test_g.name = 'G'
 print('\n\n')
 print(f'G = {test_g.print_form()}')
@@ -42,12 +69,31 @@ print('\n\n')
 
 file.close()
 
+# without indexation no step is named, also when F is a step or only a premise of (MP)
+A, A_B = parse('A'), parse('(A -> B)')
+for steps in ([Step(A, HYPOTHESIS), Step(A_B, HYPOTHESIS), Step(modus_pones(A, A_B), MP, (A, A_B))],
+              [Step(A_B, HYPOTHESIS), Step(modus_pones(A, A_B), MP, (A, A_B))]):
+    test_output = theorem_deduction([A_B], A, steps, indexation=False)
+    assert test_output[-1].formula == A_B and all(step.formula.name == '' for step in test_output)
+    assert verify_proof(test_output, [A_B]) == len(test_output)
+
+# shared deduction proves the tautologies that are used without steps, other premises are errors
+A, B, B_B = parse('a'), parse('(!(!b))'), parse('((!(!b)) -> b)')
+test_output = list(iter_shared_deduction([B], A, [Step(A), Step(modus_pones(B, B_B), MP, (B, B_B))]))
+assert test_output[-1].formula == parse('(a -> b)') and verify_proof(test_output, [B]) == len(test_output)
+try:
+    list(iter_shared_deduction([], A, [Step(parse('b'), MP, (A, parse('(a -> b)')))]))
+except ValueError:
+    pass
+else:
+    raise AssertionError('premise without steps is used')
+
 # ------------------------------------------test rule S1 -----------------------------------------------------------
 file = open('tests/rule_S1_test.txt', 'w', encoding='utf-8')
 sys.stdout = file
 
-a_b = parse('(A -> B)')
-b_c = parse('(B -> C)')
+a_b = parse('(A -> B)').copy()
+b_c = parse('(B -> C)').copy()
 
 a_b.name = 'H1'
 b_c.name = 'H2'
@@ -65,8 +111,8 @@ file = open('tests/rule_S2_test.txt', 'w', encoding='utf-8')
 sys.stdout = file
 
 print('\n\n')
-a_b_c = parse('(A -> (B -> C))')
-b = parse('B')
+a_b_c = parse('(A -> (B -> C))').copy()
+b = parse('B').copy()
 
 a_b_c.name = 'T1'
 b.name = 'T2'
@@ -186,3 +232,570 @@ for _, message in test_output:
     print(message)
 
 file.close()
+
+# ---------------------------------------test counting of models----------------------------------------------------
+sys.stdout = sys.__stdout__
+
+# random 3-CNF with 60 variables and 180 clauses is counted by DPLL counter (too many variables for the table)
+generator = random.Random(1)
+names = [f'r{i}' for i in range(60)]
+clauses = []
+for _ in range(180):
+    literals = [name if generator.random() < 0.5 else f'(!{name})' for name in generator.sample(names, 3)]
+    clauses.append('(({} | {}) | {})'.format(*literals))
+F = parse(functools.reduce(lambda left, right: f'({left} & {right})', clauses))
+assert F.count_models(engine=SAT_ENGINE) == 43735473
+
+# all the engines give the same number (weight) of models as the truth table
+generator = random.Random(2)
+names = [f'r{i}' for i in range(8)]
+for _ in range(300):
+    F = parse(random_formula(generator, names, generator.randint(1, 20)))
+    probabilities = {var: generator.random() for var in F.vars}
+    pairs = {var: (generator.random(), generator.random()) for var in F.vars}
+    count = F.count_models(engine=TABLE_ENGINE)
+    variables = list(F.vars)            # bitmask assignments have bit var.index for each variable
+    rows = [sum(var.var_mask for k, var in enumerate(variables) if row >> k & 1) for row in range(2 ** len(variables))]
+    assert count == sum(F.evaluate(row) for row in rows), F
+    for weights in (probabilities, pairs):
+        weight = F.count_models(weights, engine=TABLE_ENGINE)
+        for engine in (BDD_ENGINE, SAT_ENGINE):
+            assert math.isclose(F.count_models(weights, engine=engine), weight), (F, engine)
+    for engine in (BDD_ENGINE, SAT_ENGINE):
+        assert F.count_models(engine=engine) == count, (F, engine)
+
+# pair of weights is any sequence of length two
+F = parse('(r0 | r1)')
+r0, r1 = Var('r0'), Var('r1')
+for engine in (TABLE_ENGINE, BDD_ENGINE, SAT_ENGINE):
+    assert F.count_models({r0: [1, 2], r1: (3, 4)}, engine=engine) == 2 * 3 + 1 * 4 + 2 * 4, engine
+try:
+    F.count_models({r0: (1, 2, 3)})
+except ValueError:
+    pass
+else:
+    raise AssertionError('weight of three values is accepted')
+
+# ---------------------------------------test truth table---------------------------------------------------------------
+# blocks of the bit-parallel table have the same values as the evaluation of each row
+generator = random.Random(3)
+names = [f'r{i}' for i in range(6)]
+for _ in range(200):
+    F = parse(random_formula(generator, names, generator.randint(1, 15)))
+    variables = sorted(F.vars, key=lambda var: var.name)       # the order of the table
+    values = [F.evaluate(sum(var.var_mask for k, var in enumerate(variables) if row >> k & 1))
+              for row in range(2 ** len(variables))]
+    for chunk_bits in (CHUNK_BITS, 2):
+        table = F.truth_table(chunk_bits)
+        assert list(table) == values, F
+        assert table.count_models() == sum(values), F
+        assert table.is_tautology() == all(values) and table.is_satisfiable() == any(values), F
+        counterexample, model = table.counterexample(), table.model()
+        assert (counterexample is None) == all(values), F
+        assert counterexample is None or not F.evaluate(counterexample), F
+        assert (model is None) == (not any(values)), F
+        assert model is None or F.evaluate(model), F
+
+# ---------------------------------------test parallel checking---------------------------------------------------------
+# falsifying row is found by the processes if and only if the table has it
+generator = random.Random(4)
+names = [f'r{i}' for i in range(8)]
+for _ in range(10):
+    text = random_formula(generator, names, generator.randint(3, 15))
+    for F in (parse(text), parse(f'({text} -> ({text} | r0))')):
+        check_counterexample(F, F.truth_table(chunk_bits=2).counterexample(workers=2))
+
+# with several workers the default engine checks the table by the processes if it has several blocks,
+# up to PARALLEL_TABLE_MAX_VARS variables, the bigger formulas are still checked by SAT solver (with the warning)
+shards = []
+parallel_find = TruthTable._parallel_find_false_row
+TruthTable._parallel_find_false_row = lambda table, *args: shards.append(args) or parallel_find(table, *args)
+try:
+    chain = functools.reduce(lambda left, right: f'({left} ^ {right})', (f'w{i}' for i in range(CHUNK_BITS + 2)))
+    assert parse(f'(({chain} | w0) | (!{chain}))').check_tautology(workers=2, decompose=False)
+    F = parse(f'({chain} -> ({chain} & w0))')
+    assert not F.check_tautology(workers=2, decompose=False) and len(shards) == 2
+    assert not F.evaluate(F.find_counterexample(workers=2, decompose=False))
+
+    chain = functools.reduce(lambda left, right: f'({left} ^ {right})', (f'w{i}' for i in range(TABLE_MAX_VARS + 2)))
+    F = parse(f'({chain} -> ({chain} & w0))')
+    assert not F.evaluate(F.find_counterexample(workers=2, decompose=False)) and len(shards) == 4
+
+    chain = functools.reduce(lambda left, right: f'({left} ^ {right})', (f'w{i}' for i in range(60)))
+    F = parse(f'({chain} -> ({chain} & w0))')
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        assert not F.evaluate(F.find_counterexample(workers=2, decompose=False)) and len(shards) == 4
+        assert not F.evaluate(F.find_counterexample(decompose=False)) and len(caught) == 1
+    assert issubclass(caught[0].category, RuntimeWarning) and 'workers are ignored' in str(caught[0].message)
+finally:
+    TruthTable._parallel_find_false_row = parallel_find
+
+# ---------------------------------------test engines-------------------------------------------------------------------
+# SAT, BDD and Gray code engines find a counterexample if and only if the truth table has it
+generator = random.Random(5)
+names = [f'r{i}' for i in range(10)]
+for _ in range(200):
+    text = random_formula(generator, names, generator.randint(1, 30))
+    for F in (parse(text), parse(f'({text} -> ({text} | r0))')):
+        for engine in (SAT_ENGINE, BDD_ENGINE, GRAY_ENGINE):
+            check_counterexample(F, F.find_counterexample(engine=engine, decompose=False), engine)
+        satisfiable = F.truth_table().is_satisfiable()
+        assert all(F.check_satisfiable(engine=engine) == satisfiable for engine in (AUTO_ENGINE, SAT_ENGINE)), F
+
+# satisfiability of the formula with many variables is checked by SAT solver (there is no table for it)
+chain = functools.reduce(lambda left, right: f'({left} & {right})', (f'w{i}' for i in range(60)))
+assert parse(chain).check_satisfiable() and not parse(f'({chain} & (!w7))').check_satisfiable()
+
+# ---------------------------------------test BDD manager---------------------------------------------------------------
+# operation cache of the manager grows with its unique table (up to 2^cache_bits slots)
+pairs = [(Var(f'x{i}'), Var(f'y{i}')) for i in range(10)]
+manager = BDD([x for x, _ in pairs] + [y for _, y in pairs], cache_bits=10)     # the worst order
+assert len(manager._cache) == 2 ** MIN_CACHE_BITS
+F = parse(functools.reduce(lambda left, right: f'({left} | {right})', (f'({x} & {y})' for x, y in pairs)))
+edge = manager.from_formula(F)
+assert len(manager) > 2 ** 10 and len(manager._cache) == 2 ** 10
+assert manager.count_models(edge) == 4 ** 10 - 3 ** 10
+
+# sifting swaps the levels in place and finds the best order (the same formula gives the same edge after it)
+edge, = manager.sift([edge])
+assert manager.size(edge) == 20 and len(manager) == 21
+assert manager.variables == [var for pair in pairs for var in pair]
+assert manager.from_formula(F) == edge and manager.count_models(edge) == 4 ** 10 - 3 ** 10
+
+generator = random.Random(6)
+names = [f'r{i}' for i in range(6)]
+for _ in range(50):
+    F = parse(random_formula(generator, names, generator.randint(1, 20)))
+    manager = BDD()
+    edge = manager.from_formula(F)
+    for _ in range(10):
+        if len(manager.variables) > 1:
+            manager.swap(generator.randrange(len(manager.variables) - 1))
+        fresh = BDD(manager.variables)          # BDD with the same order is built from scratch
+        assert manager.from_formula(F) == edge and manager.size(edge) == fresh.size(fresh.from_formula(F)), F
+        assert manager.count_models(edge) == F.count_models(engine=TABLE_ENGINE), F
+
+# operations and counting don't use the recursion, so the depth of BDD isn't limited
+variables = [Var(f'z{i}') for i in range(3000)]
+manager = BDD()
+edge = manager.apply(XOR, manager.from_formula(functools.reduce(lambda rest, var: Formula(XOR, None, var, rest),
+                                                                reversed(variables))),
+                     manager.from_formula(functools.reduce(lambda rest, var: Formula(AND, None, var, rest),
+                                                           reversed(variables))))
+assert manager.size(edge) == 5998 and manager.count_models(edge) == 2 ** 2999 + 1
+
+# formulas are checked in the shared manager, equivalent formulas have the same BDD
+assert bdd_equivalent(parse('(s1 -> s2)'), parse('((!s1) | s2)')) and not bdd_equivalent(parse('(s1 -> s2)'),
+                                                                                            parse('(s2 -> s1)'))
+assert equivalent(parse('(s1 -> s2)'), parse('((!s2) -> (!s1))'), engine=BDD_ENGINE)
+
+# collection with trim removes the variables without nodes, the kept edges have the same functions
+manager = BDD([Var('t0'), Var('t1'), Var('t2')])
+edge = manager.from_formula(parse('(t0 & t2)'))
+manager.from_formula(parse('(t1 -> t0)'))
+edge, = manager.collect([edge], trim=True)
+assert manager.variables == [Var('t0'), Var('t2')] and len(manager) == 3 and manager.count_models(edge) == 1
+assert manager.from_formula(parse('(t2 & t0)')) == edge and manager.size(edge) == 2
+
+# memory of the shared manager stays bounded when many unrelated formulas are checked
+max_nodes, max_vars = bdd.SHARED_MAX_NODES, bdd.SHARED_MAX_VARS
+bdd.SHARED_MAX_NODES, bdd.SHARED_MAX_VARS = 200, 50
+try:
+    for i in range(300):
+        F = parse(f'((u{i}_0 & u{i}_1) -> ((u{i}_2 | u{i}_0) | (!u{i}_3)))')
+        check_counterexample(F, bdd.bdd_counterexample(F))
+        assert bdd_equivalent(F, F)
+        assert len(bdd._shared) <= 200 + 20 and len(bdd._shared.variables) <= 50 + 4
+finally:
+    bdd.SHARED_MAX_NODES, bdd.SHARED_MAX_VARS = max_nodes, max_vars
+
+# ---------------------------------------test incremental truth table---------------------------------------------------
+# incremental blocks have the same values as the evaluation of each row (in the order of the table)
+generator = random.Random(20)
+names = [f'r{i}' for i in range(8)]
+for _ in range(200):
+    text = random_formula(generator, names, generator.randint(1, 20))
+    for F in (parse(text), parse(f'({text} -> ({text} | r0))')):
+        table = F.truth_table(chunk_bits=2, incremental=True)
+        assert all(F.evaluate(table.assignment(row)) == value for row, value in enumerate(table)), F
+        assert table.count_models() == F.count_models(engine=TABLE_ENGINE), F
+        check_counterexample(F, table.counterexample())
+
+# ---------------------------------------test decomposition-------------------------------------------------------------
+# decomposition gives a counterexample for the whole formula if and only if the truth table has it
+generator = random.Random(22)
+for _ in range(200):
+    left = random_formula(generator, ['r0', 'r1', 'r2', 'r3'], generator.randint(1, 10))
+    right = random_formula(generator, ['r4', 'r5', 'r6', 'r7'], generator.randint(1, 10))
+    texts = (f'({left} {generator.choice(BINARY)} {right})', f'({left} -> ({left} | {right}))',
+             f'({left} | ((!r8) & (r8 | {right})))')
+    for F in map(parse, texts):
+        for engine in (TABLE_ENGINE, SAT_ENGINE, BDD_ENGINE):
+            check_counterexample(F, F.find_counterexample(engine=engine), engine)
+
+# ---------------------------------------test parser--------------------------------------------------------------------
+# position of the first bad symbol is reported
+for text, position in [('(a -> b', 0), ('((a -> b)', 0), ('(a -> -> b)', 6), ('(a -> b) c', 9), ('', 0),
+                       ('(a $ b)', 3), ('(!)', 2), ('(a & b | c)', 7), ('a b', 2), ('()', 1)]:
+    try:
+        parse(text)
+    except ErrorLogicExpression as e:
+        assert e.position == position, (text, e.position)
+        assert str(e).startswith(f'Bad logic expression at position {position}: '), text
+    else:
+        raise AssertionError(f'{text!r} is parsed')
+
+# printed formula is parsed back to the same formula, the depth of nesting isn't limited
+generator = random.Random(7)
+names = [f'r{i}' for i in range(6)]
+for _ in range(200):
+    F = parse(random_formula(generator, names, generator.randint(0, 20)))
+    assert parse(F.print_form()) is F, F
+F = parse('(a -> ' * 100000 + 'b' + ')' * 100000)
+assert F.sons[1].sons[0] is parse('a') and F.vars == {Var('a'), Var('b')}
+
+# ---------------------------------------test binary proof file---------------------------------------------------------
+# binary file gives the same steps as the original output, in any order
+F = parse('(((x1 -> x2) -> x1) -> x1)')
+output = adequacy_theorem(F, shared=True)
+with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'proof.bin')
+    with open(path, 'wb') as file:
+        assert write_proof_file(output, file)[0] == len(output)
+    messages = [message for _, message in output]
+    with ProofFile(path) as proof:
+        assert len(proof) == len(output)
+        assert list(proof.messages()) == messages
+        assert [proof[k].message for k in range(len(proof) - 1, -1, -7)] == messages[::-7]
+        assert [step.message for step in proof[10:20]] == messages[10:20]
+        assert proof[-1].formula.print_form() == F.print_form()
+        verify_proof(proof)
+
+    # the same file when the old strings are written again and the offsets go through the temporary files
+    sizes = proof_file.STRINGS_CACHE_SIZE, proof_file.OFFSETS_BUFFER_SIZE
+    proof_file.STRINGS_CACHE_SIZE, proof_file.OFFSETS_BUFFER_SIZE = 3, 5
+    try:
+        with open(path, 'wb') as file:
+            assert write_proof_file(output, file)[0] == len(output)
+    finally:
+        proof_file.STRINGS_CACHE_SIZE, proof_file.OFFSETS_BUFFER_SIZE = sizes
+    with ProofFile(path) as proof:
+        assert list(proof.messages()) == messages
+
+    # only the recent decoded formulas and strings are kept by the reader
+    sizes = proof_file.FORMULAS_CACHE_SIZE, proof_file.STRINGS_CACHE_SIZE
+    proof_file.FORMULAS_CACHE_SIZE, proof_file.STRINGS_CACHE_SIZE = 4, 3
+    try:
+        with ProofFile(path) as proof:
+            assert [proof[k].message for k in range(len(proof) - 1, -1, -3)] == messages[::-3]
+            assert list(proof.messages()) == messages and len(proof._formulas) <= 4 and len(proof._strings) <= 3
+    finally:
+        proof_file.FORMULAS_CACHE_SIZE, proof_file.STRINGS_CACHE_SIZE = sizes
+    with open(path, 'r+b') as file:
+        file.truncate(os.path.getsize(path) - 1)
+    try:
+        ProofFile(path).close()
+    except ErrorProofFile:
+        pass
+    else:
+        raise AssertionError('incomplete file is opened')
+
+# table of the formulas doesn't keep the copies alive
+table = FormulaTable()
+copy = parse('(t1 -> t2)').copy()
+index = table.index(copy)
+count = table.count
+assert table.index(copy) == index and table.count == count
+del copy
+assert table.index(parse('(t1 -> t2)').copy()) == count     # the new copy isn't confused with the removed one
+
+# ---------------------------------------test persistent store----------------------------------------------------------
+# results and proofs are kept in the store, the least recently used proofs are removed
+with ProofStore(':memory:') as store, tempfile.TemporaryDirectory() as directory:
+    s1, s2 = Var('s1'), Var('s2')
+    assert store.find_counterexample(parse('(s1 -> s2)')) == {s1: True, s2: False}
+    assert store.find_counterexample(parse('(s2 -> s1)')) == {s2: True, s1: False}   # the same key
+    assert store.check_tautology(parse('(s1 -> (s2 -> s1))'))
+
+    def build():
+        return iter_adequacy_theorem(F, shared=True)
+
+    def stored():
+        raise AssertionError('proof is built again')
+
+    path = os.path.join(directory, 'proof.bin')
+    F = parse('(s1 -> (s2 -> s1))')
+    count, last = store.write_proof_file(F, path, build)
+    with ProofFile(path) as proof:
+        messages = list(proof.messages())
+    assert count == len(messages) and last.message == messages[-1]
+    assert store.write_proof_file(F, path, stored)[0] == count
+    with ProofFile(path) as proof:
+        assert list(proof.messages()) == messages
+
+    store.max_size = len(store.get_proof(F)) * 3 // 2        # only one of the proofs fits
+    F = parse('(s2 -> (s1 -> s2))')
+    store.write_proof_file(F, path, build)
+    assert store.get_proof(parse('(s1 -> (s2 -> s1))')) is None and store.get_proof(F) is not None
+
+    Formula.store = store
+    try:
+        assert not parse('(s1 -> (s1 & s2))').check_tautology()
+        store.clear()
+        assert store.get_proof(F) is None and parse('(s1 -> (s2 | s1))').check_tautology()
+    finally:
+        Formula.store = None
+
+# lookups don't wait for the lock of writer of the other process, their times of use are written later
+with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'store.sqlite')
+    with ProofStore(path) as store:
+        F = parse('(s1 -> s2)')
+        store.put_proof(F, b'proof')
+        assert not store.check_tautology(F)
+        other = sqlite3.connect(path, timeout=0, isolation_level=None)
+        other.execute('BEGIN IMMEDIATE')
+        assert store.get_proof(F) == b'proof' and not store.check_tautology(F)
+        other.execute('COMMIT')
+    assert other.execute('SELECT COUNT(*) FROM results WHERE used > (SELECT used FROM proofs)').fetchone()[0] == 1
+    other.close()
+
+# ---------------------------------------test bulk checking-------------------------------------------------------------
+# every line gets its result in the order of the file, serial and parallel results are the same
+generator = random.Random(8)
+names = [f'r{i}' for i in range(6)]
+lines = []
+for k in range(100):
+    text = random_formula(generator, names, generator.randint(1, 12))
+    lines.append(f'({text} -> ({text} | r0))' if k % 3 == 0 else text)
+lines[10], lines[50] = '', '(r0 -> -> r1)'
+src = '\n'.join(lines) + '\n'
+outputs = []
+for workers in (None, 2):
+    dst = io.StringIO()
+    assert check_file(io.StringIO(src), dst, batch_size=7, workers=workers)[0] == 99
+    outputs.append(dst.getvalue())
+assert outputs[0] == outputs[1]
+results = [json.loads(line) for line in outputs[0].splitlines()]
+assert [result['line'] for result in results] == [k + 1 for k in range(100) if k != 10]
+for result in results:
+    text = lines[result['line'] - 1]
+    if result['line'] == 51:
+        assert result['error'].startswith('Bad logic expression at position 7')
+        continue
+    F = parse(text)
+    assert result['tautology'] == (F.find_counterexample(engine=TABLE_ENGINE, decompose=False) is None), text
+    assert result['tautology'] or not F.evaluate(result['counterexample']), text
+
+# ---------------------------------------test discrimination tree-------------------------------------------------------
+# the tree finds the same patterns (instances) as matching of all the stored formulas
+generator = random.Random(17)
+names = [f'r{i}' for i in range(4)]
+patterns = list(dict.fromkeys(parse(random_formula(generator, ['p0', 'p1', 'p2'], generator.randint(0, 4)))
+                             for _ in range(100)))        # the tree keeps one value for each formula
+tree = DiscriminationTree((pattern, k) for k, pattern in enumerate(patterns))
+for k in range(300):
+    pattern = patterns[k % len(patterns)]
+    texts = {name: random_formula(generator, names, generator.randint(0, 3)) for name in ('p0', 'p1', 'p2')}
+    F = parse(re.sub(r'p\d', lambda m: texts[m.group()], pattern.print_form()))
+    found = {value: substitution for _, value, substitution in tree.generalizations(F)}
+    assert k % len(patterns) in found, (pattern, F)
+    assert found.keys() == {value for value, p in enumerate(patterns) if match(p, F) is not None}, F
+    for value, substitution in found.items():
+        text = re.sub(r'p\d', lambda m: substitution[Var(m.group())].print_form(), patterns[value].print_form())
+        assert parse(text) is F, (patterns[value], F)
+
+formulas = list(dict.fromkeys(parse(random_formula(generator, names, generator.randint(0, 6))) for _ in range(300)))
+tree = DiscriminationTree((f, k) for k, f in enumerate(formulas))
+for pattern in patterns:
+    found = {value for _, value, _ in tree.instances(pattern)}
+    assert found == {value for value, f in enumerate(formulas) if match(pattern, f) is not None}, pattern
+
+# all the instances of the axioms are recognized
+for _ in range(100):
+    F, G, H = (parse(random_formula(generator, names, generator.randint(0, 4))) for _ in range(3))
+    assert axiom_schema(axiom_A1(F, G)) == AXIOM_A1, (F, G)
+    assert axiom_schema(axiom_A2(F, G, H)) == AXIOM_A2, (F, G, H)
+    assert axiom_schema(axiom_A3(F, G)) == AXIOM_A3, (F, G)
+
+# ---------------------------------------test proof search--------------------------------------------------------------
+# proof is found for the tautologies and only for them, the proofs are correct
+generator = random.Random(19)
+names = ['r0', 'r1', 'r2']
+for _ in range(50):
+    text = random_formula(generator, names, generator.randint(1, 8), (IMPLICATION,))
+    for F in (parse(text), parse(f'((!{text}) -> ({text} -> r0))')):
+        output = search_proof(F)
+        if not F.check_tautology():
+            assert output is None, F
+            continue
+        assert output is not None and output[-1][0] == F, F
+        verify_proof(output)
+        output = prove(F)
+        assert len(output) <= len(adequacy_theorem(F, shared=True)) and verify_proof(output) == len(output), F
+
+# adequacy theorem is used when the search is out of budget (the steps that are built),
+# the search looks only for the proofs shorter than max_steps
+F = parse('(((x1 -> x2) -> x1) -> x1)')
+assert search_proof(F, budget=0) is None
+output = prove(F, budget=0)
+assert len(output) > len(search_proof(F)) and output[-1][0] == F
+verify_proof(output)
+assert search_proof(F, max_steps=100) is None and search_proof(F, budget=1000) is None
+assert len(prove(F)) < len(adequacy_theorem(F, shared=True))
+
+# the search that doesn't find the short proof is stopped by the budget, adequacy theorem gives the shorter one
+F = parse('((!(((v1 -> ((!v2) -> v0)) -> v1) -> ((!(v2 -> v1)) -> v0))) -> (!((v1 -> v0) -> v2)))')
+output = prove(F)
+assert output[-1][0] == F and len(output) == len(adequacy_theorem(F, shared=True)) and verify_proof(output) == len(output)
+try:
+    prove(parse('(x1 -> x2)'))
+except ValueError:
+    pass
+else:
+    raise AssertionError("formula that isn't tautology is proved")
+
+# the other connectives are eliminated before the search and adequacy theorem (with the nested negations too)
+for text in ('(x1 | (!x1))', '((x1 & x2) -> x1)', '((!(!x1)) -> x1)', '((x1 <-> x2) -> ((x1 ^ x2) -> x3))'):
+    F = parse(text)
+    for budget in (SEARCH_BUDGET, 0):
+        output = prove(F, budget=budget)
+        assert output[-1][0] == eliminate(F, BASIS_IMPLICATION), (F, budget)
+        verify_proof(output)
+try:
+    adequacy_theorem(parse('(x1 | (!x1))'))
+except ValueError:
+    pass
+else:
+    raise AssertionError('adequacy theorem is used for the disjunction')
+
+# ---------------------------------------test normal forms--------------------------------------------------------------
+# all the forms have the same values as the formula and only the connectives of the form
+generator = random.Random(21)
+names = [f'r{i}' for i in range(5)]
+for _ in range(200):
+    F = parse(random_formula(generator, names, generator.randint(1, 12)))
+    variables = sorted(F.vars, key=lambda var: var.name)
+    forms = [nnf(F), simplify(F), eliminate(F), eliminate(F, BASIS_IMPLICATION),
+             clauses_formula(*cnf(F)), clauses_formula(*dnf(F), AND), anf_formula(anf(F), F.vars)]
+    for row in range(2 ** len(variables)):
+        assignment = {var: bool(row >> k & 1) for k, var in enumerate(variables)}
+        value = F.evaluate(assignment)
+        assert all(g.evaluate(assignment) == value for g in forms), (F, row)
+    nnf_form, simplified, and_or, implications = (g.print_form() for g in forms[:4])
+    assert '!(' not in nnf_form and '!(' not in simplified, F
+    assert not any(con in and_or for con in ('->', '^')), F
+    assert not any(con in implications for con in ('&', '|', '^', '<->')), F
+    assert all(literal and abs(literal) <= len(variables) for clause in cnf(F)[0] for literal in clause), F
+try:
+    dnf(parse('((r0 | r1) & (r2 | r3))'), max_terms=3)
+except ErrorNormalForm:
+    pass
+else:
+    raise AssertionError('DNF has more than max_terms terms')
+
+# CNF with too many clauses isn't built, Tseitin clauses are satisfiable just like the formula
+disjunction = functools.reduce(lambda left, right: f'({left} | {right})', (f'(a{i} & b{i})' for i in range(14)))
+for text in ('r0', '(r0 & (!r0))', '(r0 -> r1)'):
+    F = parse(f'({disjunction} & {text})')
+    try:
+        assert cnf(F)[0] == [[]] and text == '(r0 & (!r0))', F        # only the contradiction is simplified
+    except ErrorNormalForm:
+        pass
+    clauses, variables = tseitin_cnf(F)
+    count = max(abs(literal) for clause in clauses for literal in clause)
+    model = CDCLSolver(count, clauses).solve()
+    assert (model is None) == (text == '(r0 & (!r0))'), F
+    assert model is None or F.evaluate({var: model[index] for var, index in variables.items()}), F
+
+# ---------------------------------------test equivalence---------------------------------------------------------------
+# results agree with the truth table, renamed formulas are answered from the cache
+generator = random.Random(23)
+names = [f'r{i}' for i in range(4)]
+cache = ResultCache(size=50)
+for _ in range(200):
+    left, right = random_formula(generator, names, generator.randint(0, 6)), random_formula(generator, names, 2)
+    F, G = parse(left), parse(generator.choice([right, f'(!(!{left}))', f'({left} & {right})']))
+    variables = sorted(F.vars | G.vars, key=lambda var: var.name)
+    rows = [{var: bool(row >> k & 1) for k, var in enumerate(variables)} for row in range(2 ** len(variables))]
+    assert equivalent(F, G, cache=cache) == all(F.evaluate(x) == G.evaluate(x) for x in rows), (F, G)
+    assert implies(F, G, cache=cache) == all(G.evaluate(x) for x in rows if F.evaluate(x)), (F, G)
+
+    renaming = dict(zip(names, generator.sample(names, len(names))))
+    H = parse(re.sub(r'r\d', lambda m: renaming[m.group()], left))
+    find_counterexample(F, cache=cache)
+    hits = cache.hits
+    counterexample = find_counterexample(H, cache=cache)
+    assert cache.hits == hits + 1, (F, H)
+    check_counterexample(H, counterexample)
+assert len(cache) == 50
+
+with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'cache.jsonl')
+    cache.save(path)
+    loaded = ResultCache(path=path)
+    assert len(loaded) == 50
+    assert find_counterexample(F, cache=loaded) == find_counterexample(F, cache=cache) and loaded.hits == 1
+
+# each shared subformula is hashed once, so the key of the formula with 2^60 leaves is built by 60 steps
+F, G = parse('r0'), parse('r1')
+for _ in range(60):
+    F, G = F.implication(F), G.implication(G)
+assert canonical_key(F)[0] == canonical_key(G)[0] and canonical_key(F)[1] == (Var('r0'),)
+assert canonical_key(parse('((r0 -> r1) & r0)'))[0] != canonical_key(parse('((r0 -> r1) & r1)'))[0]
+assert cached_check_tautology(parse('(r0 -> r0)')) and not cached_check_tautology(parse('(r0 -> r1)'))
+
+# ---------------------------------------test hash-consing--------------------------------------------------------------
+# equal formulas are the same object and have the same hash, the formula that is just a variable too
+a = Var('a')
+F = parse('((a -> b) & (a -> b))')
+assert F.sons[0] is F.sons[1] is parse('(a -> b)')
+for x, y in ((Formula(PASS, None, a), a), (F.copy(), F), (parse('a').copy(), a)):
+    assert x == y and y == x and hash(x) == hash(y), x
+    assert len({x, y}) == 1 and x in {y} and y in {x}, x
+
+# copies and the formulas built from them keep the structural data only in the hash-consed formula
+G = parse('(b | c)').copy()
+H = F.implication(G)
+assert H._canon is not H and not hasattr(H, '__weakref__') and not hasattr(G, '_compiled')
+assert (H.var_mask, H.operations_count) == (H._canon.var_mask, 5) and H.vars == {a, Var('b'), Var('c')}
+assert H.compile() is H._canon.compile() and G.compile() is parse('(b | c)').compile()
+
+# copy has only the name of its line, the rule and premises are in the step of the proof
+output = theorem_L(G, indexation=False)
+assert [step.rule for step in output] == [AXIOM_A2, AXIOM_A1, MP, AXIOM_A1, MP]
+assert output[-1].premises == (output[3].formula, output[2].formula) and not hasattr(output[-1].formula, 'is_axiom')
+
+# printed text is kept in the hash-consed formula, so printing doesn't keep the formula alive
+F = parse('((p1 -> p2) | p3)')
+text, reference = str(F), weakref.ref(F)
+assert str(F) is text and F._text is text
+del F
+gc.collect()            # hash-consed formula is its own _canon
+assert reference() is None
+
+# bit var.index of the bitmask assignment is the value of var (just like in var_mask)
+assert H.evaluate(a.var_mask | Var('c').var_mask) == H.evaluate({a: True, 'b': False, 'c': True})
+assert a.evaluate(a.var_mask) and not a.evaluate(Var('b').var_mask)
+
+# variable created by several threads at the same time is one object
+with ThreadPoolExecutor(8) as executor:
+    assert len({id(var) for var in executor.map(Var, ['thread_var'] * 64)}) == 1
+
+sys.stdout = sys.__stdout__
+
+F = parse('F')
+G = parse('G')
+verify_proof(theorem_L(F, 0))
+verify_proof(rule_S1(a_b, b_c, 0)[1], [a_b, b_c])
+verify_proof(rule_S2(a_b_c, b, 0)[1], [a_b_c, b])
+verify_proof(theorem_T1(F, 0))
+verify_proof(theorem_T2(F, 0))
+verify_proof(theorem_T3(F, G, 0))
+verify_proof(theorem_T4(F, G, 0))
+verify_proof(theorem_T5(F, G, 0))
+verify_proof(theorem_T6(F, G, 0))
+verify_proof(theorem_T7(F, G, 0))
+verify_proof(test_output, [X1.pow_alpha(), X2.pow_alpha()])
+print('all the proofs are correct')